@@ -3,6 +3,8 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import numpy as np
 
+from game_clock import period_length
+
 # ========= ファイル読み込み =========
 df = pd.read_csv("/Users/nakamurawataru/Documents/学校/研究室/SDSC/03.バスケ/6月送付分/【2025年度】ボックススコア.csv")
 
@@ -16,7 +18,7 @@ agg = use.groupby(["試合ID",'ピリオド区分',"チームID"], as_index=Fals
 )
 
 agg['is_OT']   = agg['ピリオド区分'].between(5, 6, inclusive='both')
-agg["MINUTES"] = np.where(agg["is_OT"], 5, 10)
+agg["MINUTES"] = period_length(agg["ピリオド区分"]) / 60   # 1〜4Q は10分、OT は5分（game_clock）
 
 agg["ThreeFGA_per_min"] = agg["ThreeFGA_Sum"] / agg["MINUTES"]
 agg["TwoFGA_per_min"]   = agg["TwoFGA_Sum"]   / agg["MINUTES"]
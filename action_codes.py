@@ -0,0 +1,160 @@
+# action_codes.py
+# ================================================
+# アクションコードの登録簿（コードマスタ）
+#   - 各スクリプト・ノートブックで個別に定義していたコード集合をここに集約
+#   - 集合をビットフラグの密なルックアップ配列（添字＝アクションコード）にコンパイルし、
+#     列全体を1回の配列参照（gather）で分類する
+#
+# 使い方：
+#   import action_codes as ac
+#   flags = ac.row_flags(df)                       # A1〜A3 の OR
+#   is_foul = ac.has(ac.code_flags(df["アクション1"]), ac.F_FOUL)
+#   pts = ac.points(df["アクション1"])
+# ================================================
+
+from typing import Iterable, Sequence, Set
+
+import numpy as np
+import pandas as pd
+
+ACTION_COLS = ["アクション1", "アクション2", "アクション3"]
+
+# ---- アクション集合（マスタに合わせて調整）----
+MADE_FG: Set[int]     = {1, 3, 4, 44}
+MISSED_FG: Set[int]   = {2, 5, 6, 45}
+OREB: Set[int]        = {10, 18}
+DREB: Set[int]        = {9, 19}
+FT: Set[int]          = {7, 8}
+FT_MADE: Set[int]     = {7}
+STEAL: Set[int]       = {14}
+
+OFF_FOUL_MAIN: Set[int]  = {23}
+TURNOVER_MAIN: Set[int]  = {13, 17}
+TURNOVER_KINDS: Set[int] = {147,148,149,150,151,152,153,154,155,156,157,158,159,160,161,163}
+SHOT_CLOCK: Set[int]     = {34, 156}  # 156 はTO詳細にも重複しうる
+TO_LIKE: Set[int]        = TURNOVER_MAIN | TURNOVER_KINDS | SHOT_CLOCK | OFF_FOUL_MAIN
+
+# ファウル（faul.ipynb）
+FOUL: Set[int] = {20,21,22,23,24,25,26,46,132,138}
+
+# 中立イベント（clock,交代,TO,レビュー等）
+NEUTRAL: Set[int] = {
+    80,81,82,83,84,85,86,87,88,89,     # 試合/ピリオド開始・終了/clock/交代
+    90,107,108,109,110,111,            # オフィシャル、ジャンプボール関連など
+    133,134,135,136,137,138,           # 管理用
+    139,140,141,142,143,144,           # タイムアウト/レビュー/メディア等
+    116,117,118,112,113,114,115        # OOB/スローイン等（再開系）
+}
+# 中立だが「ポゼ開始に使ってよい（再開系）」コード
+NEUTRAL_CAN_START: Set[int] = {112,113,114,115,116,117,118}
+
+# 得点（epv.calc_points）：コード → 点数
+POINT_VALUE = {1: 3, 3: 2, 4: 2, 44: 2, 7: 1}
+
+# ---- ビットフラグ ----
+F_NEUTRAL   = 1 << 0
+F_CAN_START = 1 << 1
+F_FT        = 1 << 2
+F_MADE      = 1 << 3
+F_MISS      = 1 << 4
+F_OREB      = 1 << 5
+F_DREB      = 1 << 6
+F_STEAL     = 1 << 7
+F_TOLIKE    = 1 << 8
+F_FOUL      = 1 << 9
+
+FLAG_SETS = [
+    (F_NEUTRAL,   NEUTRAL),
+    (F_CAN_START, NEUTRAL_CAN_START),
+    (F_FT,        FT),
+    (F_MADE,      MADE_FG),
+    (F_MISS,      MISSED_FG),
+    (F_OREB,      OREB),
+    (F_DREB,      DREB),
+    (F_STEAL,     STEAL),
+    (F_TOLIKE,    TO_LIKE),
+    (F_FOUL,      FOUL),
+]
+
+# ルックアップ配列の長さ（マスタの最大コード + 1）
+TABLE_SIZE = max(max(max(codes) for _, codes in FLAG_SETS), max(POINT_VALUE)) + 1
+
+
+def _compile_flag_table() -> np.ndarray:
+    table = np.zeros(TABLE_SIZE, dtype=np.int32)
+    for flag, codes in FLAG_SETS:
+        table[sorted(codes)] |= flag
+    return table
+
+
+def _compile_point_table() -> np.ndarray:
+    table = np.zeros(TABLE_SIZE, dtype=np.int8)
+    for code, pts in POINT_VALUE.items():
+        table[code] = pts
+    return table
+
+
+FLAG_TABLE = _compile_flag_table()
+POINT_TABLE = _compile_point_table()
+
+
+def lookup(table: np.ndarray, codes) -> np.ndarray:
+    """
+    codes（Series / 配列）をルックアップ配列で一括変換する。
+    欠損・非数値・範囲外のコードは 0。小数は int() と同じく 0 方向へ切り捨て。
+    """
+    v = pd.to_numeric(pd.Series(codes, copy=False), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    ok = np.isfinite(v)
+    code = np.where(ok, v, -1).astype(np.int64)
+    inr = ok & (code >= 0) & (code < len(table))
+    out = np.zeros(len(v), dtype=table.dtype)
+    out[inr] = table[code[inr]]
+    return out
+
+
+def bit_table(code_sets: Sequence[Set[int]]) -> np.ndarray:
+    """code_sets[k] のコードに 1 << k を立てたルックアップ配列（int64）。任意のタグ集合の一括判定用。"""
+    size = max((max(codes) for codes in code_sets if codes), default=-1) + 1
+    table = np.zeros(size, dtype=np.int64)
+    for k, codes in enumerate(code_sets):
+        if codes:
+            table[sorted(codes)] |= np.int64(1) << k
+    return table
+
+
+def code_flags(codes) -> np.ndarray:
+    """1列分のアクションコード → ビットフラグ（int32）。"""
+    return lookup(FLAG_TABLE, codes)
+
+
+def row_flags(df: pd.DataFrame, cols: Sequence[str] = ACTION_COLS) -> np.ndarray:
+    """A1〜A3 のいずれかに該当すればビットが立つ行フラグ（int32）。存在しない列は無視。"""
+    flags = np.zeros(len(df), dtype=np.int32)
+    for c in cols:
+        if c in df.columns:
+            flags |= code_flags(df[c])
+    return flags
+
+
+def all_missing(df: pd.DataFrame, cols: Sequence[str] = ACTION_COLS) -> np.ndarray:
+    """A1〜A3 がすべて欠損（数値化できない値も欠損扱い）の行。"""
+    out = np.ones(len(df), dtype=bool)
+    for c in cols:
+        if c in df.columns:
+            out &= pd.to_numeric(df[c], errors="coerce").isna().to_numpy()
+    return out
+
+
+def has(flags: np.ndarray, flag: int) -> np.ndarray:
+    """flag のいずれかのビットが立っているか（bool 配列）。"""
+    return (flags & flag) != 0
+
+
+def points(codes) -> np.ndarray:
+    """アクションコード → 得点（int8）。"""
+    return lookup(POINT_TABLE, codes)
+
+
+def codes_with(flag: int) -> Iterable[int]:
+    """flag のいずれかのビットを持つコード一覧（isin 用）。"""
+    return np.flatnonzero(FLAG_TABLE & flag).tolist()
@@ -0,0 +1,206 @@
+# clutch.py
+# ================================================
+# 接戦・クラッチの分析を全チームまとめて1回で計算する（close_game.ipynb のチームごとの繰り返しの置き換え）
+#   - 試合データ → 1試合2行（ホーム側・アウェイ側）のチーム視点の表：自チーム得点・相手チーム得点・得点差・勝敗
+#     （get_team_scores / close_game をチームごとに呼ぶ代わりに、ホーム・アウェイを縦に積むだけ）
+#   - 得点差ごとのボックススコア平均：チーム×試合の合計表に得点差を結合し、(チームID, 得点差) で1回だけ groupby
+#     MARGIN_BINS を指定すると得点差を区間にまとめる（None なら1点刻み = notebook と同じ）
+#   - 試合終盤の内訳：プレイバイプレイから 4Q・OT の残り CLUTCH_MINUTES 分の行を取り出し、
+#     その時点の点差（running_score、イベント直前）が CLOSE_MARGIN 以内の行を「クラッチ」として
+#     全体 / 終盤 / クラッチ の得点・失点・FG・3P・FT・リバウンド・TO・ファウルを全チーム同時に数える
+#
+# 使い方：
+#   persp = team_perspective(df_game)                                   # 1試合2行
+#   prof = margin_profiles(df_box_gameid_sum, df_game)                  # 全チームの得点差ごとの平均
+#   prof[prof["チームID"] == 745]
+#   splits = clutch_splits(x)                                           # x は (試合ID, ピリオド, 履歴No) 順
+# ================================================
+
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import action_codes as ac
+from game_clock import REGULAR_PERIODS, final_seconds_mask
+from running_score import running_scores, score_margin
+
+# ========= ユーザー設定 =========
+CLOSE_MARGIN = 5         # 接戦とみなす点差（以内）
+CLUTCH_MINUTES = 5       # 4Q・OT の残り何分を「終盤」とするか
+MARGIN_BINS = None       # 得点差の区間の境界（例：[-100, -10, -5, 0, 5, 10, 100]）。None なら1点刻み
+# ===============================
+
+GAME_COLS = ["試合ID", "ホームチームID", "アウェイチームID", "ホーム得点", "アウェイ得点"]
+PERSPECTIVE_COLS = ["試合ID", "チームID", "相手チームID", "ホーム", "自チーム得点", "相手チーム得点", "得点差", "勝敗"]
+SPLITS = ["全体", "終盤", "クラッチ"]
+# 終盤の内訳で数える項目（アクション1のコード集合）
+COUNT_SETS: Dict[str, set] = {
+    "FG成功": ac.MADE_FG,
+    "FG試投": ac.MADE_FG | ac.MISSED_FG,
+    "3P成功": {1},
+    "3P試投": {1, 2},
+    "フリースロー成功": ac.FT_MADE,
+    "フリースロー試投": ac.FT,
+    "オフェンスリバウンド": ac.OREB,
+    "ディフェンスリバウンド": ac.DREB,
+    "ターンオーバ": ac.TO_LIKE,
+    "ファウル": ac.FOUL,
+}
+
+
+def team_perspective(game: pd.DataFrame) -> pd.DataFrame:
+    """
+    試合データを1試合2行（ホーム → アウェイ）のチーム視点の表にする（PERSPECTIVE_COLS ＋ あればカップID）。
+    得点差 = 自チーム得点 − 相手チーム得点、勝敗は得点差 > 0 で1。
+    """
+    miss = [c for c in GAME_COLS if c not in game.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    extra = ["カップID"] if "カップID" in game.columns else []
+    g = game[GAME_COLS + extra].drop_duplicates("試合ID")
+    n = len(g)
+
+    def both(a: str, b: str) -> np.ndarray:
+        return np.r_[g[a].to_numpy(), g[b].to_numpy()]
+
+    out = pd.DataFrame({
+        "試合ID": np.r_[g["試合ID"].to_numpy(), g["試合ID"].to_numpy()],
+        "チームID": both("ホームチームID", "アウェイチームID"),
+        "相手チームID": both("アウェイチームID", "ホームチームID"),
+        "ホーム": np.r_[np.ones(n, dtype=np.int8), np.zeros(n, dtype=np.int8)],
+        "自チーム得点": pd.to_numeric(pd.Series(both("ホーム得点", "アウェイ得点")), errors="coerce").to_numpy(),
+        "相手チーム得点": pd.to_numeric(pd.Series(both("アウェイ得点", "ホーム得点")), errors="coerce").to_numpy(),
+    })
+    out["得点差"] = out["自チーム得点"] - out["相手チーム得点"]
+    out["勝敗"] = (out["得点差"] > 0).astype(int)
+    for c in extra:
+        out[c] = np.r_[g[c].to_numpy(), g[c].to_numpy()]
+    # 試合ID → ホーム / アウェイ の順に並べる
+    order = np.lexsort((1 - out["ホーム"].to_numpy(), out["試合ID"].to_numpy()))
+    return out.iloc[order].reset_index(drop=True)
+
+
+def margin_bucket(margin, bins: Optional[Sequence[float]] = MARGIN_BINS) -> pd.Series:
+    """得点差を bins の区間（右閉じ）に分ける。bins が None なら得点差そのもの。"""
+    m = pd.Series(margin, copy=False)
+    return m if bins is None else pd.cut(m, bins=list(bins))
+
+
+def attach_margins(tg: pd.DataFrame, game: pd.DataFrame) -> pd.DataFrame:
+    """チーム×試合の表に 相手チームID・ホーム・自チーム得点・相手チーム得点・得点差・勝敗 を (試合ID, チームID) で結合する。"""
+    miss = [c for c in ["試合ID", "チームID"] if c not in tg.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    p = team_perspective(game)
+    add = ["試合ID", "チームID"] + [c for c in p.columns if c not in tg.columns]
+    return tg.merge(p[add], on=["試合ID", "チームID"], how="left")
+
+
+def margin_profiles(tg: pd.DataFrame, game: Optional[pd.DataFrame] = None,
+                    bins: Optional[Sequence[float]] = MARGIN_BINS, stats: Optional[Sequence[str]] = None,
+                    teams=None) -> pd.DataFrame:
+    """
+    全チームの「得点差（区間）ごとのボックススコア平均」を1回の groupby で返す。
+      tg   ：チーム×試合の合計表（df_box_gameid_sum / team_games.load_team_games()）
+      game ：試合データ。tg に得点差が無いときに team_perspective から結合する
+      stats：平均する列（None なら数値列すべて。ID 列は除く）
+    列：チームID, 得点差, 試合数, <stats>。teams を渡すとそのチームだけ。
+    """
+    if "得点差" not in tg.columns:
+        if game is None:
+            raise ValueError("必要列が見つかりません: ['得点差']（game を渡すと試合データから結合します）")
+        tg = attach_margins(tg, game)
+    if teams is not None:
+        tg = tg[tg["チームID"].isin(list(teams))]
+    skip = {"試合ID", "チームID", "相手チームID", "得点差", "カップID"}
+    stats = [c for c in tg.columns if c not in skip and pd.api.types.is_numeric_dtype(tg[c])] \
+        if stats is None else list(stats)
+
+    key = margin_bucket(tg["得点差"], bins).rename("得点差")
+    g = tg.groupby([tg["チームID"], key], observed=True, sort=True)
+    out = g[stats].mean()
+    out.insert(0, "試合数", g.size())
+    return out.reset_index()
+
+
+# ---------- プレイバイプレイの終盤・クラッチ内訳 ----------
+def clutch_rows(x: pd.DataFrame, minutes: float = CLUTCH_MINUTES, close_margin: float = CLOSE_MARGIN,
+                rs: Optional[pd.DataFrame] = None) -> Dict[str, np.ndarray]:
+    """
+    各行が 終盤（4Q・OT の残り minutes 分以内）/ クラッチ（終盤かつ、その行の直前の点差が close_margin 以内）
+    かを返す。点差は行のチームID視点（チームの無い行はクラッチにならない）。
+    戻り値：{"終盤": bool 配列, "クラッチ": bool 配列, "margin": 直前の点差}
+    """
+    rs = running_scores(x) if rs is None else rs
+    pts = ac.points(x["アクション1"]).astype("float64")
+    team = x["チームID"]
+    margin = score_margin(rs, np.arange(len(x)), team) - pts        # その行の得点を含めない
+    late = final_seconds_mask(x, seconds=minutes * 60, from_period=REGULAR_PERIODS)
+    close = np.abs(np.nan_to_num(margin, nan=np.inf)) <= close_margin
+    return {"終盤": late, "クラッチ": late & close, "margin": margin}
+
+
+def clutch_splits(x: pd.DataFrame, minutes: float = CLUTCH_MINUTES, close_margin: float = CLOSE_MARGIN,
+                  count_sets: Dict[str, set] = COUNT_SETS) -> pd.DataFrame:
+    """
+    全チームの 全体 / 終盤 / クラッチ の内訳を1回で数える（x は (試合ID, ピリオド, 履歴No) 順）。
+    列：チームID, 区分, 試合数, 得点, 失点, 得点差, <count_sets の各項目>
+    試合数はその区分の行が1つでもあった試合数。失点は同じ試合・同じ区分の相手チームの得点。
+    """
+    miss = [c for c in ["試合ID", "ピリオド", "チームID", "アクション1"] if c not in x.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+
+    rs = running_scores(x)
+    cr = clutch_rows(x, minutes, close_margin, rs)
+    names = list(count_sets)
+    bits = ac.lookup(ac.bit_table([count_sets[k] for k in names]), x["アクション1"])
+    pts = ac.points(x["アクション1"]).astype(np.int64)
+
+    # (試合, チーム) を 試合内の A / B に寄せて番号化（チームの無い行は除く）
+    team = pd.to_numeric(x["チームID"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    ta, tb = rs["team_a"].to_numpy(), rs["team_b"].to_numpy()
+    side = np.where(team == ta, 0, np.where(team == tb, 1, -1))
+    game_codes, game_ids = pd.factorize(x["試合ID"])
+    ok = (side >= 0) & (game_codes >= 0)
+    n_games = len(game_ids)
+
+    # 試合ごとの A / B チームID（各試合の先頭行から）
+    valid = np.flatnonzero(game_codes >= 0)
+    u, fi = np.unique(game_codes[valid], return_index=True)
+    first = np.zeros(n_games, dtype=np.int64)
+    first[u] = valid[fi]
+    side_team = np.c_[ta[first], tb[first]]                         # (試合, 2)
+
+    masks = {"全体": np.ones(len(x), dtype=bool), "終盤": cr["終盤"], "クラッチ": cr["クラッチ"]}
+    frames = []
+    for split, m in masks.items():
+        r = np.flatnonzero(ok & m)
+        slot = game_codes[r] * 2 + side[r]
+        size = n_games * 2
+        vals = {"得点": np.bincount(slot, weights=pts[r], minlength=size)}
+        for k, name in enumerate(names):
+            vals[name] = np.bincount(slot, weights=(bits[r] >> k) & 1, minlength=size)
+        seen = np.bincount(slot, minlength=size) > 0
+        played = np.repeat(seen.reshape(-1, 2).any(axis=1), 2)        # その区分の行がある試合
+        opp = vals["得点"].reshape(-1, 2)[:, ::-1].ravel()
+        gt = pd.DataFrame({"チームID": side_team.ravel(), "試合数": played.astype(np.int64),
+                           "得点": vals["得点"], "失点": opp, **{k: vals[k] for k in names}})
+        gt = gt[(gt["チームID"] >= 0) & played]
+        agg = gt.groupby("チームID", sort=True).sum()
+        agg["得点差"] = agg["得点"] - agg["失点"]
+        agg.insert(0, "区分", split)
+        frames.append(agg.reset_index())
+
+    out = pd.concat(frames, ignore_index=True)
+    cols = ["チームID", "区分", "試合数", "得点", "失点", "得点差"] + names
+    out = out[cols]
+    out[cols[2:]] = out[cols[2:]].astype(np.int64)
+    out["区分"] = pd.Categorical(out["区分"], categories=SPLITS, ordered=True)
+    return out.sort_values(["チームID", "区分"]).reset_index(drop=True)
+
+
+def split_wide(splits: pd.DataFrame, col: str = "得点差") -> pd.DataFrame:
+    """clutch_splits の1列を チームID × 区分 の横持ちにする（全チームの比較用）。"""
+    return splits.pivot_table(index="チームID", columns="区分", values=col, observed=True)
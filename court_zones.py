@@ -0,0 +1,246 @@
+# court_zones.py
+# ================================================
+# コート座標（x座標 / y座標）をゾーンに丸め、ゾーン単位で集計する
+#   - ゾーンは「格子」（np.digitize 相当の二分探索）か「六角形」（軸座標の丸め）を設定で選ぶ
+#   - 座標 → ゾーン番号は全行を一括で計算（行ごとのループなし）。欠損は -1
+#   - ゾーン中心の KD-tree を持ち、最寄りゾーン・半径内ゾーンの問い合わせに使う
+#     （scipy が無い環境では NumPy の総当たりで同じ結果を返す）
+#   - ゾーン別の 件数・EPV（平均得点）・FG%・ファウル率 は bincount 1回ずつで求まるので、
+#     リーグ全体の散布図でも出力はゾーン数の大きさに収まる
+#
+# 使い方：
+#   zones = make_zones(x["x座標"], x["y座標"])                   # 設定（ZONE_KIND など）に従って作成
+#   stats = event_zone_stats(x, zones)                            # プレイバイプレイ → FG% / ファウル率
+#   epv = epv_zone_stats(feat, zones)                             # epv.py の特徴量 → ゾーン別 EPV
+#   grid = zone_pivot(epv, zones, "epv")                          # 格子なら (y, x) の2次元表
+# ================================================
+
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+import action_codes as ac
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # scipy が無ければ総当たりで代用
+    cKDTree = None
+
+# ========= ユーザー設定 =========
+ZONE_KIND = "grid"      # "grid"（格子）/ "hex"（六角形）
+GRID_BINS = (14, 8)     # 格子の分割数（x 方向, y 方向）
+HEX_SIZE = 2.0          # 六角形の中心〜頂点の距離（座標と同じ単位）
+COURT_EXTENT = None     # (x最小, x最大, y最小, y最大)。None ならデータの範囲
+# ===============================
+
+X_COL, Y_COL = "x座標", "y座標"
+SQRT3 = np.sqrt(3.0)
+
+
+def _float_array(values) -> np.ndarray:
+    return pd.to_numeric(pd.Series(values, copy=False), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+
+def court_extent(x, y) -> tuple:
+    """データの座標範囲 (x最小, x最大, y最小, y最大)。幅0の軸は幅1に広げる。"""
+    out = []
+    for v in (_float_array(x), _float_array(y)):
+        v = v[~np.isnan(v)]
+        lo, hi = (float(v.min()), float(v.max())) if len(v) else (0.0, 1.0)
+        out += [lo, hi if hi > lo else lo + 1.0]
+    return tuple(out)
+
+
+# ---------- ゾーン定義 ----------
+def grid_zones(extent, bins=GRID_BINS) -> Dict[str, np.ndarray]:
+    """extent を bins=(x方向, y方向) に等分した格子。ゾーン番号は xi * ny + yi。"""
+    x0, x1, y0, y1 = extent
+    x_edges = np.linspace(x0, x1, int(bins[0]) + 1)
+    y_edges = np.linspace(y0, y1, int(bins[1]) + 1)
+    cx, cy = (x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2
+    gx, gy = np.meshgrid(cx, cy, indexing="ij")
+    return _with_tree({"kind": "grid", "x_edges": x_edges, "y_edges": y_edges,
+                       "centers": np.c_[gx.ravel(), gy.ravel()]})
+
+
+def _hex_round(q: np.ndarray, r: np.ndarray):
+    """小数の軸座標 (q, r) → 最も近い六角形の軸座標（キューブ座標の丸め）。"""
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq, rr
+
+
+def _hex_axial(x: np.ndarray, y: np.ndarray, size: float, origin):
+    """座標 → 六角形（pointy-top）の軸座標 (q, r)。"""
+    px, py = (x - origin[0]) / size, (y - origin[1]) / size
+    return _hex_round(SQRT3 / 3 * px - py / 3, 2 / 3 * py)
+
+
+def hex_zones(extent, size: float = HEX_SIZE) -> Dict[str, np.ndarray]:
+    """
+    extent を覆う六角形（pointy-top、中心〜頂点が size）。
+    中心が extent を size だけ広げた範囲に入る六角形だけを残すので、extent 内の点は必ずどれかに入る。
+    """
+    if size <= 0:
+        raise ValueError(f"HEX_SIZE は正の値にしてください: {size}")
+    x0, x1, y0, y1 = extent
+    origin = np.array([x0, y0])
+    r_lo, r_hi = int(np.floor(-size / (1.5 * size))) - 1, int(np.ceil((y1 - y0 + size) / (1.5 * size))) + 1
+    q_lo = int(np.floor((-size) / (SQRT3 * size) - r_hi / 2)) - 1
+    q_hi = int(np.ceil((x1 - x0 + size) / (SQRT3 * size) - r_lo / 2)) + 1
+    qq, rr = np.meshgrid(np.arange(q_lo, q_hi + 1), np.arange(r_lo, r_hi + 1))
+    cx = x0 + size * SQRT3 * (qq + rr / 2)
+    cy = y0 + size * 1.5 * rr
+    keep = (cx >= x0 - size) & (cx <= x1 + size) & (cy >= y0 - size) & (cy <= y1 + size)
+    lut = np.full(qq.shape, -1, dtype=np.int64)          # (r, q) → ゾーン番号
+    lut[keep] = np.arange(int(keep.sum()))
+    return _with_tree({"kind": "hex", "size": float(size), "origin": origin, "q_lo": q_lo, "r_lo": r_lo,
+                       "lut": lut, "centers": np.c_[cx[keep], cy[keep]]})
+
+
+def make_zones(x=None, y=None, kind: str = ZONE_KIND, extent=COURT_EXTENT,
+               bins=GRID_BINS, size: float = HEX_SIZE) -> Dict[str, np.ndarray]:
+    """設定に従ってゾーンを作る。extent が None なら x, y の範囲を使う。"""
+    if extent is None:
+        if x is None or y is None:
+            raise ValueError("COURT_EXTENT が None のときは x, y を渡してください")
+        extent = court_extent(x, y)
+    if kind == "grid":
+        return grid_zones(extent, bins)
+    if kind == "hex":
+        return hex_zones(extent, size)
+    raise ValueError(f"未知のゾーン種別です: {kind}")
+
+
+# ---------- 座標 → ゾーン ----------
+def assign_zones(zones: Dict[str, np.ndarray], x, y) -> np.ndarray:
+    """
+    各点のゾーン番号（int64）。欠損は -1。
+    格子は範囲外を端のゾーンに寄せ、六角形は範囲外を最寄りのゾーンに寄せる。
+    """
+    x, y = _float_array(x), _float_array(y)
+    ok = ~(np.isnan(x) | np.isnan(y))
+    out = np.full(len(x), -1, dtype=np.int64)
+    if zones["kind"] == "grid":
+        xe, ye = zones["x_edges"], zones["y_edges"]
+        xi = np.clip(np.searchsorted(xe, x[ok], side="right") - 1, 0, len(xe) - 2)
+        yi = np.clip(np.searchsorted(ye, y[ok], side="right") - 1, 0, len(ye) - 2)
+        out[ok] = xi * (len(ye) - 1) + yi
+        return out
+
+    q, r = _hex_axial(x[ok], y[ok], zones["size"], zones["origin"])
+    lut = zones["lut"]
+    ri, qi = r.astype(np.int64) - zones["r_lo"], q.astype(np.int64) - zones["q_lo"]
+    inr = (ri >= 0) & (ri < lut.shape[0]) & (qi >= 0) & (qi < lut.shape[1])
+    z = np.full(len(q), -1, dtype=np.int64)
+    z[inr] = lut[ri[inr], qi[inr]]
+    far = z < 0
+    if far.any():
+        z[far] = nearest_zone(zones, x[ok][far], y[ok][far])
+    out[ok] = z
+    return out
+
+
+# ---------- KD-tree ----------
+def _with_tree(zones: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    zones["tree"] = cKDTree(zones["centers"]) if cKDTree is not None else None
+    return zones
+
+
+def nearest_zone(zones: Dict[str, np.ndarray], x, y) -> np.ndarray:
+    """各点に中心が最も近いゾーン番号（欠損は -1）。"""
+    x, y = _float_array(x), _float_array(y)
+    ok = ~(np.isnan(x) | np.isnan(y))
+    out = np.full(len(x), -1, dtype=np.int64)
+    pts = np.c_[x[ok], y[ok]]
+    if zones.get("tree") is not None:
+        out[ok] = zones["tree"].query(pts)[1]
+    else:
+        c = zones["centers"]
+        step = max(1, 2_000_000 // max(len(c), 1))   # 距離行列が大きくなりすぎないよう分割
+        idx = [((pts[i:i + step, None, :] - c[None]) ** 2).sum(axis=2).argmin(axis=1)
+               for i in range(0, len(pts), step)]
+        out[ok] = np.concatenate(idx) if idx else np.zeros(0, dtype=np.int64)
+    return out
+
+
+def zones_within(zones: Dict[str, np.ndarray], x: float, y: float, radius: float) -> List[int]:
+    """点 (x, y) から半径 radius 以内に中心があるゾーン番号（昇順）。"""
+    if zones.get("tree") is not None:
+        return sorted(int(i) for i in zones["tree"].query_ball_point([x, y], radius))
+    d2 = ((zones["centers"] - np.array([x, y])) ** 2).sum(axis=1)
+    return np.flatnonzero(d2 <= radius * radius).tolist()
+
+
+# ---------- ゾーン別集計 ----------
+def zone_stats(zones: Dict[str, np.ndarray], zone_ids, **values) -> pd.DataFrame:
+    """
+    ゾーンごとの件数 n と、values（名前=行ごとの数値配列）の合計 sum_<名前>。
+    ゾーン -1 の行は数えない。値の欠損は合計にだけ入れない。
+    index はゾーン番号（全ゾーン、件数0も含む）、center_x / center_y 付き。
+    """
+    c = zones["centers"]
+    zid = np.asarray(zone_ids, dtype=np.int64)
+    ok = zid >= 0
+    out = pd.DataFrame({"center_x": c[:, 0], "center_y": c[:, 1],
+                        "n": np.bincount(zid[ok], minlength=len(c))})
+    for name, v in values.items():
+        v = _float_array(v)
+        m = ok & ~np.isnan(v)
+        out[f"sum_{name}"] = np.bincount(zid[m], weights=v[m], minlength=len(c))
+    out.index.name = "zone"
+    return out
+
+
+def _rate(num, den) -> np.ndarray:
+    num, den = np.asarray(num, dtype="float64"), np.asarray(den, dtype="float64")
+    return np.divide(num, den, out=np.full(len(num), np.nan), where=den > 0)
+
+
+def event_zone_stats(x: pd.DataFrame, zones: Dict[str, np.ndarray],
+                     x_col: str = X_COL, y_col: str = Y_COL) -> pd.DataFrame:
+    """
+    プレイバイプレイ（座標つきの行）→ ゾーン別の
+      n（座標つき行数）/ fga / fgm / fg_pct / fouls / foul_rate（= fouls / n）
+    判定はアクション1（座標は主アクションの位置）。
+    """
+    miss = [c for c in [x_col, y_col, "アクション1"] if c not in x.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    flags = ac.code_flags(x["アクション1"])
+    st = zone_stats(zones, assign_zones(zones, x[x_col], x[y_col]),
+                    fga=ac.has(flags, ac.F_MADE | ac.F_MISS), fgm=ac.has(flags, ac.F_MADE),
+                    fouls=ac.has(flags, ac.F_FOUL))
+    st = st.rename(columns={"sum_fga": "fga", "sum_fgm": "fgm", "sum_fouls": "fouls"})
+    st[["fga", "fgm", "fouls"]] = st[["fga", "fgm", "fouls"]].astype(np.int64)
+    st["fg_pct"] = _rate(st["fgm"], st["fga"])
+    st["foul_rate"] = _rate(st["fouls"], st["n"])
+    return st[["center_x", "center_y", "n", "fga", "fgm", "fg_pct", "fouls", "foul_rate"]]
+
+
+def epv_zone_stats(feat: pd.DataFrame, zones: Dict[str, np.ndarray], x_col: str = "x_start",
+                   y_col: str = "y_start", value_col: str = "points_scored") -> pd.DataFrame:
+    """epv.py の特徴量（1ポゼ1行）→ 開始ゾーン別の n（ポゼ数）/ epv（平均得点）。"""
+    miss = [c for c in [x_col, y_col, value_col] if c not in feat.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    st = zone_stats(zones, assign_zones(zones, feat[x_col], feat[y_col]), points=feat[value_col])
+    st["epv"] = _rate(st.pop("sum_points"), st["n"])
+    return st
+
+
+def zone_pivot(stats: pd.DataFrame, zones: Dict[str, np.ndarray], col: str) -> pd.DataFrame:
+    """格子ゾーンの集計列を (y 区分 × x 区分) の表にする（index / columns は区分の中心座標）。"""
+    if zones["kind"] != "grid":
+        raise ValueError("zone_pivot は格子ゾーン専用です（六角形は center_x / center_y で描画してください）")
+    xe, ye = zones["x_edges"], zones["y_edges"]
+    nx, ny = len(xe) - 1, len(ye) - 1
+    values = stats[col].to_numpy(dtype="float64").reshape(nx, ny).T
+    return pd.DataFrame(values, index=pd.Index(np.round((ye[:-1] + ye[1:]) / 2, 2), name="y_start"),
+                        columns=pd.Index(np.round((xe[:-1] + xe[1:]) / 2, 2), name="x_start"))
@@ -0,0 +1,176 @@
+# data_store.py
+# ================================================
+# 生CSV → 型付き Parquet への取り込み（1回だけ）と、列射影・述語プッシュダウン付きローダ
+#   - プレイバイプレイ：シーズン・試合ID でパーティション分割（store/pbp/シーズン=23-24/試合ID=12345/...）
+#   - ボックススコア / 試合データ / チームマスタ / 選手マスタ：それぞれ1ファイル
+#   - CSV の文字コードは UTF-8(BOM) → Shift-JIS(cp932) の順に試す
+#   - 型推論は取り込み時の1回だけ。以降は Parquet の型をそのまま使う
+#   - 型推論はシーズン（CSV）ごとに行うので、シーズン間で列型が食い違うことがある（整数 ↔ 小数、数値 ↔ 文字）。
+#     取り込み後に全ファイルの列型を pa.unify_schemas で1つに揃えて pbp/_common_metadata に保存し、
+#     読み込み時はその型で読む（食い違う列は読み込み時に広い型へキャストされる）
+#
+# 使い方：
+#   import data_store as ds_
+#   pbp = ds_.load_pbp(columns=["試合ID","チームID","アクション1"], filters=[("チームID","==",745)])
+#   game = ds_.load_table("game", filters=[("カップID","in",[500,507])])
+# ================================================
+
+import os
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# ========= ユーザー設定 =========
+RAW_DIR = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/03.バスケ/6月送付分"
+STORE_DIR = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/parquet"
+# ===============================
+
+PBP_FILES: Dict[str, str] = {
+    "23-24": "【2025年度】プレイバイプレイ_23-24シーズン.csv",
+    "24-25": "【2025年度】プレイバイプレイ_24-25シーズン.csv",
+}
+TABLE_FILES: Dict[str, str] = {
+    "box": "【2025年度】ボックススコア.csv",
+    "game": "【2025年度】試合データ.csv",
+    "team": "【2025年度】チームマスタ.csv",
+    "player": "【2025年度】選手マスタ.csv",
+}
+
+PBP_SORT_KEYS = ["試合ID", "ピリオド", "履歴No"]
+PBP_PARTITION_SCHEMA = pa.schema([("シーズン", pa.string()), ("試合ID", pa.int64())])
+PBP_PARTITIONING = ds.partitioning(PBP_PARTITION_SCHEMA, flavor="hive")
+PBP_SCHEMA_FILE = "_common_metadata"   # 先頭が "_" のファイルはデータセットのファイルとして読まれない
+
+
+def read_raw_csv(path: str, **kwargs) -> pd.DataFrame:
+    """生CSVを読む。UTF-8(BOM付き含む)で読めなければ Shift-JIS(cp932) で読み直す。"""
+    try:
+        return pd.read_csv(path, encoding="utf-8-sig", low_memory=False, **kwargs)
+    except UnicodeDecodeError:
+        return pd.read_csv(path, encoding="cp932", low_memory=False, **kwargs)
+
+
+def _to_arrow(df: pd.DataFrame) -> pa.Table:
+    """列型を確定させて Arrow テーブルへ。混在型の object 列は文字列に揃える。"""
+    df = df.loc[:, ~df.columns.astype(str).str.startswith("Unnamed")]
+    for c in df.columns[df.dtypes == object]:
+        num = pd.to_numeric(df[c], errors="coerce")
+        if num.notna().sum() == df[c].notna().sum():
+            df[c] = num                       # 全て数値として読める → 数値列
+        else:
+            df[c] = df[c].astype("string")    # 文字が混じる → 文字列列
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def unify_schemas(schemas: Sequence[pa.Schema]) -> pa.Schema:
+    """列型を1つに揃える（null → 他方の型、int → double など）。数値と文字が混ざる列は文字列にする。"""
+    schemas = [s.remove_metadata() for s in schemas]
+    try:
+        return pa.unify_schemas(schemas, promote_options="permissive")
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    fields = []
+    for name in dict.fromkeys(n for s in schemas for n in s.names):
+        parts = [pa.schema([s.field(name)]) for s in schemas if name in s.names]
+        try:
+            fields.append(pa.unify_schemas(parts, promote_options="permissive").field(name))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def _pbp_file_schema(store_dir: str) -> pa.Schema:
+    """取り込み済みの全ファイルのフッタから列型を揃えたスキーマ（パーティション列つき）。データは読まない。"""
+    files = ds.dataset(os.path.join(store_dir, "pbp"), format="parquet", partitioning=PBP_PARTITIONING).files
+    return unify_schemas([pq.read_schema(f) for f in files] + [PBP_PARTITION_SCHEMA])
+
+
+def pbp_schema(store_dir: str = STORE_DIR) -> pa.Schema:
+    """プレイバイプレイ全シーズン共通の列型（取り込み時に保存したもの。無ければファイルのフッタから作る）。"""
+    path = os.path.join(store_dir, "pbp", PBP_SCHEMA_FILE)
+    return pq.read_schema(path) if os.path.exists(path) else _pbp_file_schema(store_dir)
+
+
+def ingest_pbp(raw_dir: str = RAW_DIR, store_dir: str = STORE_DIR,
+               seasons: Optional[Sequence[str]] = None) -> None:
+    """プレイバイプレイをシーズン・試合ID でパーティション分割して書き出す（同じパーティションは上書き）。"""
+    for season in seasons or list(PBP_FILES):
+        df = read_raw_csv(os.path.join(raw_dir, PBP_FILES[season]))
+        df["試合ID"] = pd.to_numeric(df["試合ID"], errors="coerce")
+        n_na = int(df["試合ID"].isna().sum())
+        if n_na:
+            print(f"⚠️ {season}: 試合ID が欠損した {n_na} 行は取り込みません")
+        df = df.dropna(subset=["試合ID"]).astype({"試合ID": "int64"})
+        df = df.sort_values(PBP_SORT_KEYS, kind="stable").reset_index(drop=True)
+        df["シーズン"] = season
+        ds.write_dataset(
+            _to_arrow(df), os.path.join(store_dir, "pbp"), format="parquet",
+            partitioning=PBP_PARTITIONING, existing_data_behavior="delete_matching",
+            max_partitions=1_000_000, basename_template="part-{i}.parquet",
+        )
+    # シーズンごとに推論した列型を揃えて保存（読み込み時はこの型で読む）
+    pq.write_metadata(_pbp_file_schema(store_dir), os.path.join(store_dir, "pbp", PBP_SCHEMA_FILE))
+
+
+def ingest_tables(raw_dir: str = RAW_DIR, store_dir: str = STORE_DIR,
+                  names: Optional[Sequence[str]] = None) -> None:
+    """ボックススコア・試合データ・マスタ類を1ファイルずつ書き出す。"""
+    os.makedirs(store_dir, exist_ok=True)
+    for name in names or list(TABLE_FILES):
+        df = read_raw_csv(os.path.join(raw_dir, TABLE_FILES[name]))
+        pq.write_table(_to_arrow(df), os.path.join(store_dir, f"{name}.parquet"))
+
+
+def ingest_all(raw_dir: str = RAW_DIR, store_dir: str = STORE_DIR, overwrite: bool = False) -> None:
+    """まだ取り込んでいないもの（overwrite=True なら全部）を取り込む。"""
+    if overwrite or not os.path.isdir(os.path.join(store_dir, "pbp")):
+        ingest_pbp(raw_dir, store_dir)
+    missing = [n for n in TABLE_FILES
+               if overwrite or not os.path.exists(os.path.join(store_dir, f"{n}.parquet"))]
+    if missing:
+        ingest_tables(raw_dir, store_dir, missing)
+
+
+def _filter_expr(filters: Optional[List[tuple]]):
+    # pandas.read_parquet と同じ形式（[(列, 演算子, 値), ...] の AND、またはそのリストの OR）
+    return pq.filters_to_expression(filters) if filters else None
+
+
+def load_pbp(seasons: Optional[Sequence[str]] = None, columns: Optional[List[str]] = None,
+             filters: Optional[List[tuple]] = None, sort: bool = True,
+             store_dir: str = STORE_DIR) -> pd.DataFrame:
+    """
+    プレイバイプレイを読む。
+      seasons：["23-24","24-25"] など（None なら全シーズン。パーティション単位で読み飛ばす）
+      columns：読む列（列射影。None なら全列）
+      filters：述語プッシュダウン（例：[("チームID","==",745)] / [("試合ID","in",ids)]）
+      sort   ：(試合ID, ピリオド, 履歴No) の昇順に並べて返す（キー列が読み込まれている場合のみ）
+    """
+    dataset = ds.dataset(os.path.join(store_dir, "pbp"), format="parquet", partitioning=PBP_PARTITIONING,
+                         schema=pbp_schema(store_dir))
+    expr = _filter_expr(filters)
+    if seasons is not None:
+        season_expr = ds.field("シーズン").isin(list(seasons))
+        expr = season_expr if expr is None else expr & season_expr
+    df = dataset.to_table(columns=columns, filter=expr).to_pandas()
+    keys = [c for c in PBP_SORT_KEYS if c in df.columns]
+    if sort and keys:
+        df = df.sort_values(keys, kind="stable").reset_index(drop=True)
+    return df
+
+
+def load_table(name: str, columns: Optional[List[str]] = None, filters: Optional[List[tuple]] = None,
+               store_dir: str = STORE_DIR) -> pd.DataFrame:
+    """"box" / "game" / "team" / "player" を読む（列射影・述語プッシュダウン対応）。"""
+    if name not in TABLE_FILES:
+        raise ValueError(f"未知のテーブルです: {name}（{list(TABLE_FILES)}）")
+    return pq.read_table(os.path.join(store_dir, f"{name}.parquet"),
+                         columns=columns, filters=filters).to_pandas()
+
+
+if __name__ == "__main__":
+    ingest_all(overwrite=True)
+    print(f"✅ 取り込み完了: {STORE_DIR}")
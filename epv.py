@@ -3,174 +3,221 @@
 # 変更点：
 # ① 座標列「x座標」「y座標」を明示的に使用
 # ② 保存後に Seaborn で EPV（points_scored）のヒートマップを描画
+# ③ ステージごとに結果をディスクへキャッシュするパイプライン化
+#    load → possessions → scores → clock → flags → features → heatmap
+#    各ステージのキーは「自分のパラメータ＋上流ステージのキー」のハッシュ。
+#    例：ヒートマップだけ変えた場合は heatmap ステージだけが再計算される
+#    （入力CSVは パス・サイズ・更新時刻 で同一性を判定）
+# ④ ヒートマップは開始位置を格子ゾーン（court_zones）に丸めて集計（表の大きさは HEATMAP_BINS で固定）
 # ================================================
 
-import pandas as pd
-import numpy as np
+import hashlib
+import json
 import os
+from typing import Callable, Dict, List, Optional
+
 import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
 import seaborn as sns
 
+import action_codes as ac
+from court_zones import epv_zone_stats, make_zones, zone_pivot
+from game_clock import CLOCK_COL, parse_clock
+from possession_ver2 import possession_table, read_possession_csv
+from possession_tags import tag_possessions
+from running_score import running_scores, score_margin
+
 # ========= ユーザー設定 =========
 INPUT_CSV = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/possession_df_ver2.csv"
 OUTPUT_FEATURES_CSV = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/epv_features_with_xy.csv"
-TIME_COL_EXPLICIT = None  # 残時間列名がわかれば明示指定
+CACHE_DIR = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/epv_cache"  # None でキャッシュしない
+HEATMAP_PNG = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/epv_heatmap.png"
+TIME_COL_EXPLICIT = None  # 残時間列名（None なら ピリオド残時間）
+TAGS = {"fastbreak": [35], "second_chance": [37]}  # 特徴量にするタグ（列名は is_<タグ名>）
+HEATMAP = {"cmap": "RdYlGn", "figsize": [8, 6]}     # None でヒートマップを作らない
+HEATMAP_BINS = [14, 8]    # ヒートマップの格子ゾーン数（x 方向, y 方向）
+COURT_EXTENT = None       # (x最小, x最大, y最小, y最大)。None ならデータの範囲
+SHOW_PLOT = False         # True なら plt.show()（ウィンドウを閉じるまで止まる）
 # ===============================
 
-def main():
-    # ---------- 読み込み ----------
-    x = pd.read_csv(INPUT_CSV)
+# ステージの処理内容を変えたら数字を上げる（古いキャッシュを使わせないため）
+STAGE_VERSION = {"load": 1, "possessions": 1, "scores": 1, "clock": 2, "flags": 1, "features": 1, "heatmap": 2}
+
+NEED_COLS = ["試合ID","ピリオド","履歴No","チームID","アクション1",
+             "possession_id","possession_team","possession_start_row_index",
+             "possession_end_row_index","possession_end_reason","x座標","y座標"]
+FEATURE_COLS = ["試合ID","ピリオド","possession_id","possession_team",
+                "score_margin_start","clock_start","x_start","y_start",
+                "is_fastbreak","is_second_chance","opponent_team","points_scored"]
+
+
+# ---------- キャッシュ ----------
+def _file_signature(path: str) -> List:
+    st = os.stat(path)
+    return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+
+
+def stage_key(stage: str, params, upstream: List[str]) -> str:
+    """ステージ名・処理バージョン・パラメータ・上流キーから決まるキャッシュキー。"""
+    payload = json.dumps([stage, STAGE_VERSION[stage], params, upstream],
+                         ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _lazy_stage(cache_dir: Optional[str], stage: str, key: str, compute: Callable[[], object]) -> Callable[[], object]:
+    """
+    初めて呼ばれたときに、キャッシュ（<cache_dir>/<stage>-<key>.pkl）を読むか compute() して保存する関数を返す。
+    下流がキャッシュ済みなら上流は呼ばれない（読み込みもしない）。
+    """
+    path = os.path.join(cache_dir, f"{stage}-{key}.pkl") if cache_dir else None
+    memo: Dict[str, object] = {}
+
+    def get():
+        if "v" not in memo:
+            if path and os.path.exists(path):
+                memo["v"] = pd.read_pickle(path)
+            else:
+                print(f"  ▶ {stage} を計算中...")
+                memo["v"] = compute()
+                if path:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    pd.to_pickle(memo["v"], path + ".tmp")
+                    os.replace(path + ".tmp", path)
+        return memo["v"]
+    return get
+
+
+# ---------- ステージ ----------
+def stage_load(input_csv: str) -> pd.DataFrame:
+    x = read_possession_csv(input_csv)  # ID・アクション列を幅の狭い整数型で読む
     x = x.loc[:, ~x.columns.str.contains("^Unnamed")]
     x = x.sort_values(["試合ID", "ピリオド", "履歴No"]).reset_index(drop=True)
-
-    # ---------- 基本チェック ----------
-    need_cols = ["試合ID","ピリオド","履歴No","チームID","アクション1",
-                 "possession_id","possession_team","x座標","y座標"]
-    miss = [c for c in need_cols if c not in x.columns]
+    miss = [c for c in NEED_COLS if c not in x.columns]
     if miss:
         raise ValueError(f"必要列が見つかりません: {miss}")
-
-    # ---------- start/end フラグ ----------
-    if "possession_start_flag" not in x.columns:
-        print("⚠️ possession_start_flag が無いため自動生成します。")
-        x["possession_start_flag"] = 0
-        x.loc[x.groupby(["試合ID","possession_id"]).head(1).index, "possession_start_flag"] = 1
-    if "possession_end_flag" not in x.columns:
-        print("⚠️ possession_end_flag が無いため自動生成します。")
-        x["possession_end_flag"] = 0
-        x.loc[x.groupby(["試合ID","possession_id"]).tail(1).index, "possession_end_flag"] = 1
-
-    # ---------- 得点列 ----------
-    def calc_points(a1):
-        if a1 in {1}: return 3
-        if a1 in {3,4,44}: return 2
-        if a1 in {7}: return 1
-        return 0
-    x["得点"] = x["アクション1"].map(calc_points).fillna(0).astype(int)
-
-    # ---------- ポゼッション得点 ----------
-    poss_points = (x.groupby(["試合ID","possession_id","possession_team"], as_index=False)
-                     .agg(points_scored=("得点","sum")))
-
-    # ---------- 累積スコア ----------
-    x["team_score"] = (x.sort_values(["試合ID","チームID","ピリオド","履歴No"])
-                         .groupby(["試合ID","チームID"])["得点"].cumsum())
-    score_wide = (x.groupby(["試合ID","ピリオド","履歴No","チームID"])["team_score"]
-                    .max().unstack(fill_value=0))
-    score_wide.index = score_wide.index.set_names(["試合ID","ピリオド","履歴No"])
-
-    # ---------- ポゼッション開始行 ----------
-    starts = x[x["possession_start_flag"] == 1][[
-        "試合ID","ピリオド","履歴No","チームID","possession_id","possession_team","x座標","y座標"
-    ]].copy()
-
-    # ---------- 点差算出 ----------
-    starts_idx = starts.set_index(["試合ID","ピリオド","履歴No"])
-    score_narrow = score_wide.groupby(level=[0,1,2]).max()
-    starts_joined = starts_idx.join(score_narrow, how="left").reset_index()
-
-    score_cols = [c for c in starts_joined.columns if str(c).isdigit()]
-
-    def margin_from_row(row):
-        tid = int(row["チームID"])
-        vals = row[score_cols]
-        my = row.get(tid, vals.get(str(tid), 0))
-        opp_vals = [row[c] for c in score_cols if str(c) != str(tid)]
-        opp = np.nanmax(opp_vals) if opp_vals else 0
-        return float(my - opp)
-    starts_joined["score_margin_start"] = starts_joined.apply(margin_from_row, axis=1)
-
-    # ---------- 残り時間 ----------
-    if TIME_COL_EXPLICIT and TIME_COL_EXPLICIT in x.columns:
-        time_col = TIME_COL_EXPLICIT
-    else:
-        cand = [c for c in x.columns if "残" in c or "time" in c.lower()]
-        time_col = cand[0] if cand else None
-    if time_col:
-        time_idx = x.set_index(["試合ID","ピリオド","履歴No"])[time_col]
-        starts_joined["clock_start"] = time_idx.reindex(
-            starts_joined.set_index(["試合ID","ピリオド","履歴No"]).index
-        ).values
-    else:
-        starts_joined["clock_start"] = np.nan
-
-    # ---------- 速攻・セカンドチャンス ----------
-    def has_tag_any(g, tags):
-        arrs = []
-        for col in ["アクション1","アクション2","アクション3"]:
-            if col in g.columns:
-                arrs.append(g[col].values)
-        if not arrs: return False
-        vals = np.concatenate(arrs)
-        return np.isin(vals, list(tags)).any()
-    flags = (x.groupby(["試合ID","possession_id"])
-               .apply(lambda g: pd.Series({
-                   "is_fastbreak": has_tag_any(g, {35}),
-                   "is_second_chance": has_tag_any(g, {37}),
-               }))
-               .reset_index())
-
-    # ---------- 相手チーム ----------
-    team_two = (x.groupby("試合ID")["チームID"]
-                  .apply(lambda s: s.dropna().astype(int).value_counts().index[:2].tolist())
-                  .to_dict())
-    def find_opp(gid, my_team):
-        L = team_two.get(gid, [])
-        if len(L) == 2:
-            return L[1] if int(my_team) == L[0] else L[0]
-        return np.nan
-
-    # ---------- 1ポゼッション=1行 ----------
-    feat = starts_joined[[
-        "試合ID","ピリオド","possession_id","possession_team",
-        "score_margin_start","clock_start","x座標","y座標"
-    ]].copy()
-    feat = feat.rename(columns={"x座標":"x_start","y座標":"y_start"})
-
-    feat = (feat.merge(flags, on=["試合ID","possession_id"], how="left")
-                .merge(poss_points, on=["試合ID","possession_id","possession_team"], how="left"))
-
-    feat["opponent_team"] = [find_opp(g, t) for g, t in zip(feat["試合ID"], feat["possession_team"])]
-
-    feat = feat[[
-        "試合ID","ピリオド","possession_id","possession_team",
-        "score_margin_start","clock_start",
-        "x_start","y_start",
-        "is_fastbreak","is_second_chance","opponent_team","points_scored"
-    ]].reset_index(drop=True)
-
-    # ---------- 保存 ----------
-    os.makedirs(os.path.dirname(OUTPUT_FEATURES_CSV), exist_ok=True)
-    feat.to_csv(OUTPUT_FEATURES_CSV, index=False, encoding="utf-8-sig")
-    print(f"✅ 出力完了: {OUTPUT_FEATURES_CSV}")
-    print(feat.head(10))
-
-    # ======================================================
-    # 🆕 【追加】EPVヒートマップ描画（x,y座標を利用）
-    # ======================================================
-    print("\n📊 EPVヒートマップを作成中...")
-
-    # ヒートマップ用データ
-    heatmap_data = (
-        feat.groupby(["x_start","y_start"])["points_scored"]
-            .mean().reset_index()
-    )
-
-    # ピボット化
-    heatmap_pivot = heatmap_data.pivot_table(
-        index="y_start", columns="x_start", values="points_scored"
-    )
-
-    # 描画
-    plt.figure(figsize=(8, 6))
-    sns.heatmap(heatmap_pivot, cmap="RdYlGn", cbar_kws={'label': '平均得点 (EPV)'})
+    # 得点列（action_codes の得点テーブルで一括変換）
+    x["得点"] = ac.points(x["アクション1"]).astype(int)
+    return x
+
+
+def stage_possessions(x: pd.DataFrame) -> pd.DataFrame:
+    """1ポゼ1行の表＋開始位置＋ポゼッション得点（行→ポゼは開始行の二分探索で対応づけ）。"""
+    tbl = possession_table(x, clock_col=None).drop(columns="clock_start")
+    start_rows = tbl["start_row"].to_numpy()
+    tbl["x_start"] = x["x座標"].to_numpy()[start_rows]
+    tbl["y_start"] = x["y座標"].to_numpy()[start_rows]
+
+    row_start = x["possession_start_row_index"].to_numpy(dtype="float64", na_value=np.nan)
+    in_poss = ~np.isnan(row_start)
+    which = np.searchsorted(start_rows, row_start[in_poss].astype(np.int64))
+    tbl["points_scored"] = np.bincount(which, weights=x["得点"].to_numpy()[in_poss],
+                                       minlength=len(tbl)).astype(int)
+    return tbl
+
+
+def stage_scores(x: pd.DataFrame, tbl: pd.DataFrame) -> pd.DataFrame:
+    """開始行時点の点差と相手チーム（両チームの累積スコア配列を開始行で引く）。"""
+    rs = running_scores(x, points=x["得点"].to_numpy())
+    rows = tbl["start_row"].to_numpy()
+    team = tbl["possession_team"].to_numpy(dtype="int64")
+    ta, tb = rs["team_a"].to_numpy()[rows], rs["team_b"].to_numpy()[rows]
+    opp = np.where(team == ta, tb, ta).astype("float64")
+    opp[((team != ta) & (team != tb)) | (opp < 0)] = np.nan
+    return pd.DataFrame({"score_margin_start": score_margin(rs, rows, team),
+                         "opponent_team": pd.array(opp, dtype="Int64")})
+
+
+def stage_clock(x: pd.DataFrame, tbl: pd.DataFrame, time_col_explicit: Optional[str]) -> pd.Series:
+    """開始行の残り秒（"mm:ss" でも数値でも game_clock.parse_clock で秒にする）。列が無ければ NaN。"""
+    time_col = time_col_explicit or CLOCK_COL
+    if time_col not in x.columns:
+        print(f"⚠ 残時間列 {time_col} が無いため clock_start は NaN になります")
+        return pd.Series(np.nan, index=tbl.index, name="clock_start")
+    clock = parse_clock(x[time_col].iloc[tbl["start_row"].to_numpy()])
+    return pd.Series(clock, index=tbl.index, name="clock_start")
+
+
+def stage_flags(x: pd.DataFrame, tags: Dict[str, List[int]]) -> pd.DataFrame:
+    """速攻・セカンドチャンス等（全ポゼを1回の表引き＋bincount で集計）。"""
+    return tag_possessions(x, {k: set(v) for k, v in tags.items()})
+
+
+def stage_features(tbl: pd.DataFrame, scores: pd.DataFrame, clock: pd.Series, flags: pd.DataFrame) -> pd.DataFrame:
+    """1ポゼッション=1行の特徴量。"""
+    keys = ["試合ID", "possession_id"]
+    feat = pd.concat([tbl.reset_index(drop=True), scores.reset_index(drop=True),
+                      clock.reset_index(drop=True)], axis=1)
+    feat = feat.astype({k: "int64" for k in keys}).merge(flags, on=keys, how="left")
+    extra = [c for c in flags.columns if c not in FEATURE_COLS and c not in keys]
+    return feat[FEATURE_COLS + extra].reset_index(drop=True)
+
+
+def stage_heatmap(feat: pd.DataFrame, bins, extent=None) -> pd.DataFrame:
+    """開始位置の格子ゾーンごとの平均得点（y 区分 × x 区分、件数0のゾーンは NaN）。"""
+    zones = make_zones(feat["x_start"], feat["y_start"], kind="grid", extent=extent, bins=bins)
+    return zone_pivot(epv_zone_stats(feat, zones), zones, "epv")
+
+
+def draw_heatmap(heatmap_pivot: pd.DataFrame, params: Dict, png: Optional[str], show: bool) -> None:
+    plt.figure(figsize=tuple(params.get("figsize", (8, 6))))
+    sns.heatmap(heatmap_pivot, cmap=params.get("cmap", "RdYlGn"), cbar_kws={'label': '平均得点 (EPV)'})
     plt.title("EPVヒートマップ（ポゼッション開始位置）", fontsize=14)
     plt.xlabel("x座標（コート横方向）")
     plt.ylabel("y座標（コート縦方向）")
     plt.tight_layout()
-    plt.show()
+    if png:
+        os.makedirs(os.path.dirname(png) or ".", exist_ok=True)
+        plt.savefig(png, dpi=150)
+        print(f"🖼 ヒートマップを保存しました: {png}")
+    if show:
+        plt.show()
+    plt.close()
+
+
+# ---------- パイプライン ----------
+def run_pipeline(input_csv: str = INPUT_CSV, output_csv: Optional[str] = OUTPUT_FEATURES_CSV,
+                 cache_dir: Optional[str] = CACHE_DIR, time_col_explicit: Optional[str] = TIME_COL_EXPLICIT,
+                 tags: Dict[str, List[int]] = TAGS, heatmap: Optional[Dict] = HEATMAP,
+                 heatmap_png: Optional[str] = HEATMAP_PNG, show: bool = SHOW_PLOT,
+                 heatmap_bins=HEATMAP_BINS, court_extent=COURT_EXTENT) -> pd.DataFrame:
+    """
+    特徴量（1ポゼ1行）を作って返す。キーが変わっていないステージはキャッシュを読むだけ。
+    """
+    k_load = stage_key("load", _file_signature(input_csv), [])
+    k_poss = stage_key("possessions", None, [k_load])
+    k_scores = stage_key("scores", None, [k_load, k_poss])
+    k_clock = stage_key("clock", time_col_explicit, [k_load, k_poss])
+    k_flags = stage_key("flags", tags, [k_load])
+    k_feat = stage_key("features", None, [k_poss, k_scores, k_clock, k_flags])
+
+    load = _lazy_stage(cache_dir, "load", k_load, lambda: stage_load(input_csv))
+    poss = _lazy_stage(cache_dir, "possessions", k_poss, lambda: stage_possessions(load()))
+    scores = _lazy_stage(cache_dir, "scores", k_scores, lambda: stage_scores(load(), poss()))
+    clock = _lazy_stage(cache_dir, "clock", k_clock, lambda: stage_clock(load(), poss(), time_col_explicit))
+    flags = _lazy_stage(cache_dir, "flags", k_flags, lambda: stage_flags(load(), tags))
+    feats = _lazy_stage(cache_dir, "features", k_feat,
+                        lambda: stage_features(poss(), scores(), clock(), flags()))
+
+    feat = feats()
+    if output_csv:
+        os.makedirs(os.path.dirname(output_csv) or ".", exist_ok=True)
+        feat.to_csv(output_csv, index=False, encoding="utf-8-sig")
+        print(f"✅ 出力完了: {output_csv}")
+
+    if heatmap is not None:
+        # 集計結果だけをキャッシュし、描画（色・サイズ）は毎回行う
+        k_heat = stage_key("heatmap", [heatmap_bins, court_extent], [k_feat])
+        pivot = _lazy_stage(cache_dir, "heatmap", k_heat,
+                            lambda: stage_heatmap(feat, heatmap_bins, court_extent))()
+        draw_heatmap(pivot, heatmap, heatmap_png, show)
+    return feat
+
+
+def main():
+    feat = run_pipeline()
+    print(feat.head(10))
+
 
 if __name__ == "__main__":
     main()
-    
-    
@@ -2,13 +2,15 @@ import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+from game_clock import parse_clock
+
 # ========= ファイル読み込み =========
 df = pd.read_csv("/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/epv_features_with_xy.csv")
 
 # ========= 越谷アルファーズのみ抽出 =========
 KOSHI_ID = 745
-df_koshi = df[df["possession_team"] == KOSHI_ID].copy()# ========= clock_start を数値化（エラー行の前に追加） =========
-df_koshi["clock_start"] = pd.to_numeric(df_koshi["clock_start"], errors="coerce")
+df_koshi = df[df["possession_team"] == KOSHI_ID].copy()# ========= clock_start を秒に（"mm:ss" の旧出力も読める） =========
+df_koshi["clock_start"] = parse_clock(df_koshi["clock_start"])
 
 
 # ========= 欠損・型整備 =========
@@ -0,0 +1,217 @@
+# epv_cube.py
+# ================================================
+# 条件付きEPVの事前計算キューブ（全チーム × 相手 × シーズン × 状況）
+#   - 軸：チーム / 相手 / シーズン / 点差区分 / 残り時間区分 / 速攻 / セカンドチャンス / 開始ゾーン
+#   - チーム・相手・シーズン・ゾーンの各軸は末尾に「全体（ALL）」のスロットを持つ
+#     → 「相手を問わない」「全シーズン」「位置を問わない」も同じ配列の1要素として引ける
+#   - 各セルは 件数・得点合計 を持ち、EPV はリーグ平均（同シーズン・同状況の ALL×ALL）への
+#     経験ベイズ縮約：(合計 + k × 事前平均) / (件数 + k)
+#     k は チーム別セルのばらつきから積率法で推定（PRIOR_N で固定も可）
+#   - 保存は npz（密な NumPy 配列）。問い合わせは添字計算だけの O(1)
+#
+# 使い方：
+#   cube = build_epv_cube(feat)                  # feat は epv.py の特徴量（1ポゼ1行）
+#   save_epv_cube(cube, CUBE_NPZ); cube = load_epv_cube(CUBE_NPZ)
+#   epv_lookup(cube, team=745, margin=-3, clock=45)   # 3点ビハインド・残り45秒
+# ================================================
+
+import itertools
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# ========= ユーザー設定 =========
+INPUT_FEATURES_CSV = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/epv_features_with_xy.csv"
+CUBE_NPZ = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/epv_cube.npz"
+MARGIN_EDGES = [-50, -10, -3, 3, 10, 50]     # epv_analysis.py と同じ区分（左閉右開）
+CLOCK_EDGES = [0, 24, 60, 120, 300, 600, 720]
+ZONE_GRID = (3, 3)                           # 開始位置ゾーン（x 方向, y 方向）の分割数
+PRIOR_N = None                               # 縮約の強さ k（None ならデータから推定）
+# ===============================
+
+ALL = "ALL"
+AXES = ["team", "opponent", "season", "margin", "clock", "fastbreak", "second_chance", "zone"]
+
+
+def _bin(values, edges) -> np.ndarray:
+    """左閉右開の区分番号。範囲外は端の区分に寄せ、欠損は -1。"""
+    v = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    b = np.clip(np.searchsorted(np.asarray(edges, dtype="float64"), v, side="right") - 1, 0, len(edges) - 2)
+    return np.where(np.isnan(v), -1, b)
+
+
+def _zone_edges(v: np.ndarray, n: int) -> np.ndarray:
+    v = v[~np.isnan(v)]
+    lo, hi = (float(v.min()), float(v.max())) if len(v) else (0.0, 1.0)
+    return np.linspace(lo, hi if hi > lo else lo + 1.0, n + 1)
+
+
+def _labels(values: pd.Series) -> np.ndarray:
+    return np.asarray(sorted(pd.Series(values).dropna().unique().tolist()))
+
+
+def _index_of(labels: np.ndarray, values) -> np.ndarray:
+    """ラベル → 軸上の位置（見つからない・欠損は -1）。"""
+    v = pd.Series(values).to_numpy()
+    pos = np.searchsorted(labels, v) if len(labels) else np.zeros(len(v), dtype=np.int64)
+    pos = np.clip(pos, 0, max(len(labels) - 1, 0))
+    ok = pd.notna(v) & (len(labels) > 0)
+    ok &= np.asarray(labels[pos] == v, dtype=bool) if len(labels) else False
+    return np.where(ok, pos, -1)
+
+
+def build_epv_cube(feat: pd.DataFrame, season_of: Optional[Dict[int, str]] = None,
+                   margin_edges=MARGIN_EDGES, clock_edges=CLOCK_EDGES, zone_grid=ZONE_GRID,
+                   prior_n: Optional[float] = PRIOR_N) -> Dict[str, np.ndarray]:
+    """
+    特徴量（1ポゼ1行）から EPV キューブを作る。
+      season_of：試合ID → シーズン名（feat に「シーズン」列があればそちらを使う。無ければ全体で1シーズン）
+    点差・残り時間・チームのいずれかが欠損したポゼッションは数えない。
+    """
+    need = ["試合ID", "possession_team", "opponent_team", "score_margin_start", "clock_start",
+            "is_fastbreak", "is_second_chance", "x_start", "y_start", "points_scored"]
+    miss = [c for c in need if c not in feat.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+
+    if "シーズン" in feat.columns:
+        season = feat["シーズン"].astype(str)
+    elif season_of is not None:
+        season = feat["試合ID"].map(season_of).astype(str)
+    else:
+        season = pd.Series(ALL, index=feat.index)
+
+    teams = _labels(pd.to_numeric(feat["possession_team"], errors="coerce"))
+    opps = _labels(pd.to_numeric(feat["opponent_team"], errors="coerce"))
+    seasons = _labels(season)
+    x = pd.to_numeric(feat["x_start"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    y = pd.to_numeric(feat["y_start"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    x_edges, y_edges = _zone_edges(x, zone_grid[0]), _zone_edges(y, zone_grid[1])
+    n_zone = zone_grid[0] * zone_grid[1]
+
+    ti = _index_of(teams, pd.to_numeric(feat["possession_team"], errors="coerce"))
+    oi = _index_of(opps, pd.to_numeric(feat["opponent_team"], errors="coerce"))
+    si = _index_of(seasons, season)
+    mi = _bin(feat["score_margin_start"], margin_edges)
+    ci = _bin(feat["clock_start"], clock_edges)
+    fi = feat["is_fastbreak"].fillna(False).astype(bool).to_numpy().astype(int)
+    sci = feat["is_second_chance"].fillna(False).astype(bool).to_numpy().astype(int)
+    xi, yi = _bin(x, x_edges), _bin(y, y_edges)
+    zi = np.where((xi >= 0) & (yi >= 0), xi * zone_grid[1] + yi, -1)
+    pts = pd.to_numeric(feat["points_scored"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+    shape = (len(teams) + 1, len(opps) + 1, len(seasons) + 1,
+             len(margin_edges) - 1, len(clock_edges) - 1, 2, 2, n_zone + 1)
+    size = int(np.prod(shape))
+    n = np.zeros(size, dtype=np.int64)
+    s = np.zeros(size)
+    ss = np.zeros(size)
+    base = (ti >= 0) & (si >= 0) & (mi >= 0) & (ci >= 0) & ~np.isnan(pts)
+    # ALL スロットを持つ軸（チーム・相手・シーズン・ゾーン）について「個別 / ALL」の全組合せへ数える
+    # 相手・ゾーンが不明なポゼッションは ALL 側にだけ入る
+    for to_all in itertools.product([False, True], repeat=4):
+        t_, o_, s_, z_ = (np.full(len(feat), shape[ax] - 1) if flag else v
+                          for flag, ax, v in zip(to_all, (0, 1, 2, 7), (ti, oi, si, zi)))
+        ok = base & (o_ >= 0) & (z_ >= 0)
+        flat = np.ravel_multi_index((t_[ok], o_[ok], s_[ok], mi[ok], ci[ok], fi[ok], sci[ok], z_[ok]), shape)
+        n += np.bincount(flat, minlength=size)
+        s += np.bincount(flat, weights=pts[ok], minlength=size)
+        ss += np.bincount(flat, weights=pts[ok] ** 2, minlength=size)
+    n, s, ss = n.reshape(shape), s.reshape(shape), ss.reshape(shape)
+
+    # ---- 経験ベイズ縮約：事前平均は同シーズン・同状況のリーグ平均（件数0ならシーズン全体の平均）----
+    sn = n[-1, -1, :, ..., -1].reshape(shape[2], -1).sum(axis=1)
+    season_mean = s[-1, -1, :, ..., -1].reshape(shape[2], -1).sum(axis=1) / np.maximum(sn, 1)
+    league = np.divide(s[-1, -1], n[-1, -1], out=np.zeros(s.shape[2:]), where=n[-1, -1] > 0)
+    league = np.where(n[-1, -1] > 0, league, season_mean.reshape((-1,) + (1,) * (league.ndim - 1)))
+    k = float(prior_n) if prior_n is not None else _estimate_prior_n(n, s, ss, league)
+    epv = ((s + k * league[None, None]) / (n + k)).astype(np.float32)
+
+    return {
+        "epv": epv, "n": n.astype(np.int32), "raw_sum": s.astype(np.float32), "league": league.astype(np.float32),
+        "prior_n": np.float64(k), "teams": teams, "opponents": opps, "seasons": seasons.astype(str),
+        "margin_edges": np.asarray(margin_edges, dtype="float64"), "clock_edges": np.asarray(clock_edges, dtype="float64"),
+        "x_edges": x_edges, "y_edges": y_edges, "zone_grid": np.asarray(zone_grid),
+    }
+
+
+def _estimate_prior_n(n: np.ndarray, s: np.ndarray, ss: np.ndarray, league: np.ndarray) -> float:
+    """
+    積率法：チーム別セル（相手 ALL・ゾーン ALL）について
+      σ² = セル内分散（プール）、τ² = セル平均のリーグ平均まわりの分散 − σ²/件数
+    から k = σ² / τ² を求める（1〜1000 に丸める）。
+    """
+    cn = n[:-1, -1, :-1, ..., -1].astype("float64")
+    cs = s[:-1, -1, :-1, ..., -1]
+    css = ss[:-1, -1, :-1, ..., -1]
+    prior = league[None, :-1, ..., -1]
+    has = cn > 0
+    if has.sum() < 2 or cn.sum() <= has.sum():
+        return 1.0
+    within = (css[has] - cs[has] ** 2 / cn[has]).sum() / (cn.sum() - has.sum())
+    means = cs[has] / cn[has]
+    w = cn[has] / cn.sum()
+    tau2 = (w * (means - np.broadcast_to(prior, cn.shape)[has]) ** 2).sum() - within * has.sum() / cn.sum()
+    if tau2 <= 0:
+        return 1000.0
+    return float(np.clip(within / tau2, 1.0, 1000.0))
+
+
+def save_epv_cube(cube: Dict[str, np.ndarray], path: str) -> None:
+    np.savez_compressed(path, **cube)
+
+
+def load_epv_cube(path: str) -> Dict[str, np.ndarray]:
+    with np.load(path, allow_pickle=False) as z:
+        return {k: z[k] for k in z.files}
+
+
+def _axis_pos(labels: np.ndarray, value) -> int:
+    """ラベル → 位置（None は ALL スロット）。未知のラベルは ValueError。"""
+    if value is None:
+        return len(labels)
+    value = str(value) if labels.dtype.kind == "U" else float(value)
+    i = int(np.searchsorted(labels, value))
+    if i >= len(labels) or labels[i] != value:
+        raise ValueError(f"キューブに無い値です: {value}")
+    return i
+
+
+def _bin_scalar(value: float, edges: np.ndarray) -> int:
+    """_bin のスカラー版（範囲外は端の区分）。"""
+    if value is None or value != value:
+        raise ValueError(f"区分できない値です: {value}")
+    return min(max(int(np.searchsorted(edges, value, side="right")) - 1, 0), len(edges) - 2)
+
+
+def epv_lookup(cube: Dict[str, np.ndarray], team=None, margin: float = 0, clock: float = 600,
+               fastbreak: bool = False, second_chance: bool = False, opponent=None, season=None,
+               x: Optional[float] = None, y: Optional[float] = None, with_n: bool = False):
+    """
+    状況に対応するセルの EPV を返す（添字計算だけの O(1)）。
+    team / opponent / season / 位置（x, y）を None にすると ALL。with_n=True なら (EPV, 件数)。
+    """
+    gx, gy = (int(v) for v in cube["zone_grid"])
+    zone = gx * gy if x is None or y is None else \
+        _bin_scalar(x, cube["x_edges"]) * gy + _bin_scalar(y, cube["y_edges"])
+    idx = (
+        _axis_pos(cube["teams"], team),
+        _axis_pos(cube["opponents"], opponent),
+        _axis_pos(cube["seasons"], season),
+        _bin_scalar(margin, cube["margin_edges"]),
+        _bin_scalar(clock, cube["clock_edges"]),
+        int(bool(fastbreak)),
+        int(bool(second_chance)),
+        zone,
+    )
+    v = float(cube["epv"][idx])
+    return (v, int(cube["n"][idx])) if with_n else v
+
+
+if __name__ == "__main__":
+    feat = pd.read_csv(INPUT_FEATURES_CSV)
+    cube = build_epv_cube(feat)
+    save_epv_cube(cube, CUBE_NPZ)
+    print(f"✅ 保存しました: {CUBE_NPZ}（shape={cube['epv'].shape}, k={float(cube['prior_n']):.1f}）")
+    print("越谷・3点ビハインド・残り60秒未満:", epv_lookup(cube, team=745, margin=-3, clock=45, with_n=True))
@@ -0,0 +1,116 @@
+# extract_team_games.py
+# ================================================
+# 指定チームが出場した試合の全行（相手チーム含む）をプレイバイプレイCSVから抜き出す
+#   - 1パス目：試合ID・チームID の2列だけをチャンク読みして、対象チームの試合ID集合を作る
+#   - 2パス目：全列をチャンク読みし、対象試合の行だけを出力CSVへ追記する
+#   - どちらのパスもチャンク単位で処理するため、ピークメモリはリーグ全体の大きさに依存しない
+#   - 2パス目は値を文字列のまま素通しする（型推論なし・元CSVの表記を保つ）
+#   - シーズンごとに列の順番・有無が違ってもよい：出力の列は全CSVのヘッダの和集合（出現順。旧 pd.concat と同じ）で、
+#     各チャンクを列名で並べ替えてから書く（無い列は空欄）
+#   - 出力の先頭列（行番号）は、全シーズンを縦結合したときの通し行番号（旧 df_all の index と同じ）
+#
+# 使い方：
+#   extract_team_games([745], OUTPUT_CSV)                                   # 越谷のみ
+#   extract_team_games(B1_TEAMS, ".../{team_id}_all_opponent.csv", per_team=True)  # 全チーム一括
+# ================================================
+
+import os
+from typing import Dict, List, Optional, Sequence, Set
+
+import pandas as pd
+
+from data_store import PBP_FILES, RAW_DIR
+
+# ========= ユーザー設定 =========
+TEAM_IDS = [745]
+SEASONS = ["23-24", "24-25"]
+OUTPUT_CSV = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/koshigaya_all_opponent.csv"
+CHUNKSIZE = 500_000      # 1チャンクの行数
+ENCODING = "utf-8"
+# ===============================
+
+
+def pbp_paths(seasons: Optional[Sequence[str]] = None, raw_dir: str = RAW_DIR) -> List[str]:
+    """シーズン名 → プレイバイプレイCSVのパス（PBP_FILES の順）。"""
+    seasons = list(seasons) if seasons is not None else list(PBP_FILES)
+    unknown = [s for s in seasons if s not in PBP_FILES]
+    if unknown:
+        raise ValueError(f"未知のシーズンです: {unknown}（{list(PBP_FILES)}）")
+    return [os.path.join(raw_dir, PBP_FILES[s]) for s in seasons]
+
+
+def union_header(paths: Sequence[str], encoding: str = ENCODING) -> List[str]:
+    """全CSVのヘッダの和集合（出現順）。ヘッダ行だけを読む。"""
+    cols: Dict[str, None] = {}
+    for path in paths:
+        cols.update(dict.fromkeys(pd.read_csv(path, nrows=0, encoding=encoding).columns))
+    return list(cols)
+
+
+def collect_team_games(paths: Sequence[str], team_ids: Sequence[int],
+                       chunksize: int = CHUNKSIZE, encoding: str = ENCODING) -> Dict[int, Set[int]]:
+    """1パス目：チームID → そのチームが出場した試合ID集合。"""
+    want = {int(t) for t in team_ids}
+    games: Dict[int, Set[int]] = {t: set() for t in want}
+    for path in paths:
+        for chunk in pd.read_csv(path, usecols=["試合ID", "チームID"], chunksize=chunksize, encoding=encoding):
+            chunk = chunk.apply(pd.to_numeric, errors="coerce").dropna()
+            chunk = chunk[chunk["チームID"].isin(want)].drop_duplicates()
+            for t, g in zip(chunk["チームID"].astype(int), chunk["試合ID"].astype(int)):
+                games[t].add(g)
+    return games
+
+
+def extract_team_games(
+    team_ids: Sequence[int],
+    output: str,
+    seasons: Optional[Sequence[str]] = None,
+    per_team: bool = False,
+    raw_dir: str = RAW_DIR,
+    chunksize: int = CHUNKSIZE,
+    encoding: str = ENCODING,
+) -> Dict[int, Set[int]]:
+    """
+    team_ids の試合の全行を output に書き出す。
+      per_team：False なら全チームの試合をまとめて1ファイルへ（同じ試合は1回だけ）
+                True なら output を "{team_id}" を含むパターンとして、チームごとに1ファイルずつ
+    戻り値：チームID → 抽出した試合ID集合
+    """
+    if per_team and "{team_id}" not in output:
+        raise ValueError(f"per_team=True では出力パスに {{team_id}} を含めてください: {output}")
+
+    paths = pbp_paths(seasons, raw_dir)
+    games = collect_team_games(paths, team_ids, chunksize, encoding)
+    if per_team:
+        targets = {output.format(team_id=t): g for t, g in games.items()}
+    else:
+        targets = {output: set().union(*games.values())}
+
+    header = union_header(paths, encoding)
+    written = {path: False for path in targets}
+    offset = 0
+    for path in paths:
+        reader = pd.read_csv(path, dtype=str, keep_default_na=False, na_filter=False,
+                             chunksize=chunksize, encoding=encoding)
+        for chunk in reader:
+            chunk = chunk.reindex(columns=header, fill_value="")   # 列名で揃える（位置では揃えない）
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+            gid = pd.to_numeric(chunk["試合ID"], errors="coerce")
+            for out_path, ids in targets.items():
+                part = chunk[gid.isin(ids)]
+                if part.empty:
+                    continue
+                part.to_csv(out_path, mode="a" if written[out_path] else "w", header=not written[out_path])
+                written[out_path] = True
+
+    # 該当行が無くても出力ファイル（ヘッダのみ）は作る
+    for out_path, done in written.items():
+        if not done:
+            pd.DataFrame(columns=header).to_csv(out_path)
+    return games
+
+
+if __name__ == "__main__":
+    games = extract_team_games(TEAM_IDS, OUTPUT_CSV, seasons=SEASONS)
+    print({t: len(g) for t, g in games.items()})
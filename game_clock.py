@@ -0,0 +1,117 @@
+# game_clock.py
+# ================================================
+# 時刻まわりの一括処理（残時間・プレイタイムの秒変換、試合開始からの経過秒、試合ごとの時刻索引）
+#   - "mm:ss"（全角コロン「：」も可）/ 数値 が混在した列を、ユニーク値だけ解析して一括で秒にする
+#     （行ごとの .apply(lambda x: int(x.split(':')[0]) * 60 ...) の置き換え）
+#   - 経過秒：1〜4Q は10分、5以降（OT）は5分として ピリオド開始秒 + ピリオド長 − 残り秒（3FGA.py と同じ分数）
+#   - 時刻索引：試合ごとに経過秒でソートした配列と試合の区切りを持ち、
+#     「ある試合の t0〜t1 秒の行」を二分探索だけで返す（ポゼッションの長さ、残り2分の切り出しなど）
+#
+# 使い方：
+#   df_box["プレイタイム_秒"] = parse_clock(df_box["プレイタイム"])
+#   x["経過秒"] = elapsed_seconds(x)
+#   idx = game_time_index(x); rows = rows_between(idx, game_id, 2280, 2400)   # 4Q 残り2分
+# ================================================
+
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+# ========= ユーザー設定 =========
+CLOCK_COL = "ピリオド残時間"
+PERIOD_COL = "ピリオド"
+REGULAR_PERIODS = 4      # 通常のピリオド数
+REGULAR_SEC = 600        # 1〜4Q の長さ（秒）
+OT_SEC = 300             # OT の長さ（秒）
+# ===============================
+
+_CLOCK_RE = r"^\s*(\d+)\s*:\s*(\d+)(?:\.\d*)?\s*$"
+
+
+def parse_clock(values, invalid: float = np.nan) -> np.ndarray:
+    """
+    "mm:ss"（"：" も可、秒の小数部は切り捨て）または数値（秒）を秒（float64、整数値）にする。
+    解析できない値・欠損は invalid（既定 NaN。notebook の「コロンが無ければ 0」は invalid=0）。
+    ユニーク値ごとに1回だけ解析するので、行数が多くてもコストは値の種類数に比例。
+    """
+    s = pd.Series(values, copy=False)
+    if pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+        v = s.to_numpy(dtype="float64", na_value=np.nan)
+        return np.where(np.isnan(v), invalid, np.floor(v))
+
+    codes, uniq = pd.factorize(s, use_na_sentinel=True)
+    u = pd.Series(uniq, dtype=object).astype(str).str.replace("：", ":", regex=False)
+    mmss = u.str.extract(_CLOCK_RE)
+    sec = (pd.to_numeric(mmss[0], errors="coerce") * 60 + pd.to_numeric(mmss[1], errors="coerce")).to_numpy(dtype="float64")
+    plain = pd.to_numeric(u, errors="coerce").to_numpy(dtype="float64")     # "45" / "45.0" など
+    sec = np.where(np.isnan(sec), np.floor(plain), sec)
+    sec = np.where(np.isnan(sec), invalid, sec)
+    return np.where(codes >= 0, sec[np.maximum(codes, 0)] if len(sec) else invalid, invalid)
+
+
+def period_length(period) -> np.ndarray:
+    """ピリオドの長さ（秒）。1〜4 は REGULAR_SEC、それ以降は OT_SEC。欠損は NaN。"""
+    p = pd.to_numeric(pd.Series(period, copy=False), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    return np.where(np.isnan(p), np.nan, np.where(p <= REGULAR_PERIODS, REGULAR_SEC, OT_SEC))
+
+
+def period_start(period) -> np.ndarray:
+    """ピリオド開始時点の試合経過秒（1Q=0, 2Q=600, ..., OT1=2400, OT2=2700）。欠損は NaN。"""
+    p = pd.to_numeric(pd.Series(period, copy=False), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    reg = np.minimum(p - 1, REGULAR_PERIODS) * REGULAR_SEC
+    return reg + np.maximum(p - REGULAR_PERIODS - 1, 0) * OT_SEC
+
+
+def elapsed_seconds(x: pd.DataFrame, clock_col: str = CLOCK_COL, period_col: str = PERIOD_COL) -> np.ndarray:
+    """各行の試合開始からの経過秒（float64）。残時間・ピリオドが解析できない行は NaN。"""
+    miss = [c for c in [clock_col, period_col] if c not in x.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    remain = parse_clock(x[clock_col])
+    return period_start(x[period_col]) + period_length(x[period_col]) - remain
+
+
+# ---------- 試合ごとの時刻索引 ----------
+def game_time_index(x: pd.DataFrame, clock_col: str = CLOCK_COL, period_col: str = PERIOD_COL) -> Dict[str, np.ndarray]:
+    """
+    試合ごとに経過秒でソートした索引。
+      games：試合ID（昇順）、bounds：games[i] の範囲は [bounds[i], bounds[i+1])
+      t：経過秒（試合内で昇順）、row：t に対応する x の行番号（位置）
+    経過秒が NaN の行・試合IDが欠損した行は含めない。同時刻の行は元の並び順を保つ。
+    """
+    if "試合ID" not in x.columns:
+        raise ValueError("必要列が見つかりません: ['試合ID']")
+    gid = pd.to_numeric(x["試合ID"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    t = elapsed_seconds(x, clock_col, period_col)
+    rows = np.flatnonzero(~(np.isnan(gid) | np.isnan(t)))
+    order = rows[np.lexsort((rows, t[rows], gid[rows]))]
+    games, first = np.unique(gid[order], return_index=True)
+    return {"games": games, "bounds": np.r_[first, len(order)].astype(np.int64),
+            "t": t[order], "row": order.astype(np.int64)}
+
+
+def rows_between(index: Dict[str, np.ndarray], game, t0: float, t1: float) -> np.ndarray:
+    """試合 game の経過秒 t0 以上 t1 以下の行番号（時刻順）。無い試合なら空配列。"""
+    g = int(np.searchsorted(index["games"], float(game)))
+    if g >= len(index["games"]) or index["games"][g] != float(game):
+        return np.zeros(0, dtype=np.int64)
+    lo, hi = index["bounds"][g], index["bounds"][g + 1]
+    t = index["t"][lo:hi]
+    a, b = np.searchsorted(t, t0, side="left"), np.searchsorted(t, t1, side="right")
+    return index["row"][lo + a:lo + b]
+
+
+def final_seconds_mask(x: pd.DataFrame, seconds: float = 120, clock_col: str = CLOCK_COL,
+                       period_col: str = PERIOD_COL, from_period: int = REGULAR_PERIODS) -> np.ndarray:
+    """from_period 以降の各ピリオドで残り seconds 秒以内の行（既定は 4Q と各 OT の残り2分）。"""
+    remain = parse_clock(x[clock_col])
+    p = pd.to_numeric(x[period_col], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    return (p >= from_period) & (remain <= seconds)
+
+
+def possession_durations(x: pd.DataFrame, tbl: pd.DataFrame, clock_col: str = CLOCK_COL,
+                         period_col: str = PERIOD_COL) -> np.ndarray:
+    """possession_table の各ポゼッションの長さ（秒）＝ 終了行と開始行の経過秒の差。"""
+    t = elapsed_seconds(x, clock_col, period_col)
+    return t[tbl["end_row"].to_numpy(dtype=np.int64)] - t[tbl["start_row"].to_numpy(dtype=np.int64)]
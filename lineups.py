@@ -0,0 +1,224 @@
+# lineups.py
+# ================================================
+# 交代イベントからコート上の5人を復元し、ラインナップごとの区間（スティント）と +/-・ポゼッションを出す
+#   - ピリオド開始時の5人：そのピリオドで「最初の交代IN より前にイベントがある」か
+#     「最初の交代IN より前に交代OUT がある」選手（プレイバイプレイだけから推定）
+#   - 交代行（SUB_IN_CODES / SUB_OUT_CODES）だけを順に適用し、ラインナップ（選手IDのソート済みタプル）が
+#     変わるたびにスティントを切る。同じ経過秒の交代はまとめて1回の切り替えにする
+#     （行ごとの走査は交代行だけ。スティント数 ≒ 交代回数）
+#   - 得点・失点は累積和の区間差（start_row / end_row の2点参照）、ポゼッション・EPV などの値は
+#     possession_table の開始行を (チーム, 開始行) の二分探索でスティントに割り当てる（区間結合）
+#   - start_row / end_row は x の行番号（end_row を含む。possession_table と同じ）
+#
+# 使い方：
+#   st = build_stints(x)                                   # x は (試合ID, ピリオド, 履歴No) 順、行インデックス 0..n-1
+#   st = stint_possessions(st, possession_table(x_labeled), value_cols=["points_scored"])
+#   lineup_summary(st).sort_values("秒", ascending=False)  # ラインナップごとの出場秒・+/-・100ポゼあたり
+# ================================================
+
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+import action_codes as ac
+from game_clock import CLOCK_COL, elapsed_seconds, period_length, period_start
+from running_score import running_scores
+
+# ========= ユーザー設定 =========
+SUB_IN_CODES = {88}      # 交代 IN（選手ID1 がコートに入る）※ アクションコード表に合わせて変更
+SUB_OUT_CODES = {89}     # 交代 OUT（選手ID1 がコートを出る）
+PLAYER_COL = "選手ID1"
+# ===============================
+
+NO_ID = -1
+STINT_COLS = ["試合ID", "ピリオド", "チームID", "相手チームID", "lineup", "人数", "start_row", "end_row",
+              "start_sec", "end_sec", "秒", "得点", "失点", "+/-"]
+
+
+def _int_array(s: pd.Series) -> np.ndarray:
+    v = pd.to_numeric(s, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    return np.where(np.isnan(v), NO_ID, v).astype(np.int64)
+
+
+def lineup_key(players) -> str:
+    """選手IDの集合 → "id-id-id-id-id"（昇順）。"""
+    return "-".join(str(p) for p in sorted(int(p) for p in players))
+
+
+def _segments(gid: np.ndarray, per: np.ndarray):
+    """(試合, ピリオド) の区切り。戻り値：行ごとの区間番号、区間の開始行、区間の終了行（含む）"""
+    n = len(gid)
+    new = np.r_[True, (gid[1:] != gid[:-1]) | (per[1:] != per[:-1])] if n else np.zeros(0, dtype=bool)
+    seg = np.cumsum(new) - 1
+    start = np.flatnonzero(new)
+    end = np.r_[start[1:], n] - 1
+    return seg, start, end
+
+
+def period_starters(seg: np.ndarray, team: np.ndarray, player: np.ndarray, is_in: np.ndarray,
+                    is_out: np.ndarray) -> Dict[tuple, set]:
+    """
+    区間（試合・ピリオド）× チームごとの開始時の選手集合。
+    最初の IN より前に OUT またはその他のイベントがある選手を「開始時にコート上」とみなす。
+    """
+    ok = (team != NO_ID) & (player != NO_ID)
+    rows = np.flatnonzero(ok)
+    kind = np.where(is_in[rows], "in", np.where(is_out[rows], "out", "event"))
+    first = (pd.DataFrame({"seg": seg[rows], "team": team[rows], "player": player[rows], "kind": kind, "row": rows})
+             .groupby(["seg", "team", "player", "kind"])["row"].min().unstack("kind"))
+    for k in ["in", "out", "event"]:
+        if k not in first.columns:
+            first[k] = np.nan
+    f_in = first["in"].fillna(np.inf)
+    on = (first["out"].fillna(np.inf) < f_in) | (first["event"].fillna(np.inf) < f_in)
+    out: Dict[tuple, set] = {}
+    for (s, t, p) in first.index[on.to_numpy()]:
+        out.setdefault((int(s), int(t)), set()).add(int(p))
+    return out
+
+
+def build_stints(x: pd.DataFrame, sub_in: Sequence[int] = SUB_IN_CODES, sub_out: Sequence[int] = SUB_OUT_CODES,
+                 player_col: str = PLAYER_COL) -> pd.DataFrame:
+    """
+    ラインナップの区間表（STINT_COLS）を返す。x は (試合ID, ピリオド, 履歴No) 順で、行インデックス 0..n-1。
+      start_sec / end_sec：試合開始からの経過秒（残時間列が無ければ NaN）。end_sec は次のスティントの開始、
+                           または ピリオド終了時刻
+      得点 / 失点 / +/-  ：start_row〜end_row のそのチーム / 相手の得点（アクション1の得点テーブル）
+    """
+    miss = [c for c in ["試合ID", "ピリオド", "チームID", "アクション1", player_col] if c not in x.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+
+    gid = _int_array(x["試合ID"])
+    per = _int_array(x["ピリオド"])
+    team = _int_array(x["チームID"])
+    player = _int_array(x[player_col])
+    code = _int_array(x["アクション1"])
+    is_in = np.isin(code, list(sub_in))
+    is_out = np.isin(code, list(sub_out))
+    t = elapsed_seconds(x) if CLOCK_COL in x.columns else np.full(len(x), np.nan)
+    period_end = period_start(per) + period_length(per)
+
+    seg, seg_start, seg_end = _segments(gid, per)
+    on_court = period_starters(seg, team, player, is_in, is_out)
+
+    # 交代行を (区間, チーム) ごとにまとめる（行番号順）
+    sub_rows = np.flatnonzero((is_in | is_out) & (team != NO_ID) & (player != NO_ID))
+    subs: Dict[tuple, List[int]] = {}
+    for r in sub_rows:
+        subs.setdefault((int(seg[r]), int(team[r])), []).append(int(r))
+
+    rec = []   # (区間, チーム, lineup, 人数, start_row, end_row)
+    for key in sorted(set(on_court) | set(subs)):
+        s, tm = key
+        lineup = set(on_court.get(key, ()))
+        cur = int(seg_start[s])
+        rows = subs.get(key, [])
+        i = 0
+        while i < len(rows):
+            r0 = rows[i]
+            j = i
+            # 同じ経過秒の交代はまとめて適用（時刻が無い場合は連続する交代行だけ）
+            while j < len(rows) and (rows[j] == r0 or (np.isfinite(t[r0]) and t[rows[j]] == t[r0])
+                                     or (not np.isfinite(t[r0]) and rows[j] == rows[j - 1] + 1)):
+                j += 1
+            if r0 > cur:
+                rec.append((s, tm, lineup_key(lineup), len(lineup), cur, r0 - 1))
+                cur = r0
+            for r in rows[i:j]:
+                (lineup.add if is_in[r] else lineup.discard)(int(player[r]))
+            i = j
+        rec.append((s, tm, lineup_key(lineup), len(lineup), cur, int(seg_end[s])))
+
+    st = pd.DataFrame(rec, columns=["seg", "チームID", "lineup", "人数", "start_row", "end_row"])
+    s_row = st["start_row"].to_numpy(dtype=np.int64)
+    e_row = st["end_row"].to_numpy(dtype=np.int64)
+    st.insert(0, "試合ID", gid[s_row])
+    st.insert(1, "ピリオド", per[s_row])
+
+    # 相手チームと得点・失点（試合内の A / B チームの累積得点の区間差）
+    rs = running_scores(x)
+    ta, tb = rs["team_a"].to_numpy()[s_row], rs["team_b"].to_numpy()[s_row]
+    tm = st["チームID"].to_numpy()
+    is_a = tm == ta
+    st["相手チームID"] = np.where(is_a, tb, ta)
+    pts = ac.points(x["アクション1"]).astype(np.int64)
+    cum = {side: np.r_[0, np.cumsum(np.where(team == col, pts, 0))]
+           for side, col in [("a", rs["team_a"].to_numpy()), ("b", rs["team_b"].to_numpy())]}
+    pa = cum["a"][e_row + 1] - cum["a"][s_row]
+    pb = cum["b"][e_row + 1] - cum["b"][s_row]
+    st["得点"] = np.where(is_a, pa, pb)
+    st["失点"] = np.where(is_a, pb, pa)
+    st["+/-"] = st["得点"] - st["失点"]
+
+    # 経過秒：開始は開始行の時刻（区間の先頭ならピリオド開始）、終了は次のスティントの開始かピリオド終了
+    first_in_seg = s_row == seg_start[st["seg"].to_numpy()]
+    st["start_sec"] = np.where(first_in_seg, period_start(per[s_row]), t[s_row])
+    last_in_seg = e_row == seg_end[st["seg"].to_numpy()]
+    st["end_sec"] = np.where(last_in_seg, period_end[e_row], t[np.minimum(e_row + 1, len(x) - 1)])
+    st["秒"] = st["end_sec"] - st["start_sec"]
+    return st[STINT_COLS].sort_values(["試合ID", "ピリオド", "チームID", "start_row"], kind="stable") \
+                         .reset_index(drop=True)
+
+
+def stint_of(st_team: np.ndarray, st_start: np.ndarray, st_end: np.ndarray,
+            team: np.ndarray, row: np.ndarray) -> np.ndarray:
+    """(team, row) を含むスティントの番号（無ければ -1）。(チーム, 開始行) の辞書順で二分探索する。"""
+    span = int(max(st_end.max(initial=0), row.max(initial=0))) + 1
+    key = st_team.astype(np.int64) * span + st_start
+    order = np.argsort(key, kind="stable")
+    q = team.astype(np.int64) * span + row
+    pos = np.searchsorted(key[order], q, side="right") - 1
+    idx = np.where(pos >= 0, order[np.maximum(pos, 0)], -1)
+    ok = (idx >= 0) & (st_team[np.maximum(idx, 0)] == team) & (row <= st_end[np.maximum(idx, 0)])
+    return np.where(ok, idx, -1)
+
+
+def stint_possessions(st: pd.DataFrame, tbl: pd.DataFrame, value_cols: Sequence[str] = ()) -> pd.DataFrame:
+    """
+    possession_table の各ポゼッションを、開始行を含む攻撃側・守備側のスティントに割り当てて集計する。
+    追加する列：攻撃ポゼッション / 守備ポゼッション、value_cols（points_scored や EPV など）の
+    攻撃側合計 攻撃<列> と 守備側合計 守備<列>。
+    """
+    miss = [c for c in ["possession_team", "start_row"] + list(value_cols) if c not in tbl.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    st = st.copy()
+    st_team = st["チームID"].to_numpy(dtype=np.int64)
+    st_opp = st["相手チームID"].to_numpy(dtype=np.int64)
+    s_row = st["start_row"].to_numpy(dtype=np.int64)
+    e_row = st["end_row"].to_numpy(dtype=np.int64)
+    p_team = _int_array(tbl["possession_team"])
+    p_row = tbl["start_row"].to_numpy(dtype=np.int64)
+
+    off = stint_of(st_team, s_row, e_row, p_team, p_row)
+    dfn = stint_of(st_opp, s_row, e_row, p_team, p_row)       # 守備側：相手チームID がポゼッションのチーム
+    n = len(st)
+    st["攻撃ポゼッション"] = np.bincount(off[off >= 0], minlength=n)
+    st["守備ポゼッション"] = np.bincount(dfn[dfn >= 0], minlength=n)
+    for c in value_cols:
+        v = pd.to_numeric(tbl[c], errors="coerce").fillna(0).to_numpy(dtype="float64")
+        st["攻撃" + c] = np.bincount(off[off >= 0], weights=v[off >= 0], minlength=n)
+        st["守備" + c] = np.bincount(dfn[dfn >= 0], weights=v[dfn >= 0], minlength=n)
+    return st
+
+
+def lineup_summary(st: pd.DataFrame, by: Sequence[str] = ("チームID", "lineup")) -> pd.DataFrame:
+    """
+    スティント表を by ごとに合計する（スティント数・秒・得点・失点・+/-、あればポゼッションと値の列）。
+    ポゼッションがあれば 100ポゼあたりの 攻撃 / 守備 / ネット レーティングも付ける。
+    """
+    by = list(by)
+    sum_cols = [c for c in st.columns if c not in set(by) | set(STINT_COLS[:8]) | {"start_sec", "end_sec"}
+                and pd.api.types.is_numeric_dtype(st[c])]
+    g = st.groupby(by, sort=True)
+    out = g[sum_cols].sum()
+    out.insert(0, "スティント数", g.size())
+    if "攻撃ポゼッション" in out.columns:
+        off = out["攻撃ポゼッション"].to_numpy(dtype="float64")
+        dfn = out["守備ポゼッション"].to_numpy(dtype="float64")
+        out["攻撃レーティング"] = np.divide(out["得点"] * 100.0, off, out=np.full(len(out), np.nan), where=off > 0)
+        out["守備レーティング"] = np.divide(out["失点"] * 100.0, dfn, out=np.full(len(out), np.nan), where=dfn > 0)
+        out["ネットレーティング"] = out["攻撃レーティング"] - out["守備レーティング"]
+    return out.reset_index()
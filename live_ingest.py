@@ -0,0 +1,443 @@
+# live_ingest.py
+# ================================================
+# 試合中のライブ取り込み：プレイバイプレイを1行ずつ受け取り、現在のポゼッション・点差・条件付きEPVを更新する
+#   - 入力は asyncio の非同期イテレータ（1行 = 列名 → 値 の dict）
+#       tail_csv    ：追記されていくCSVを末尾から読み続ける（tail -f 相当。書きかけの行は完成まで待つ）
+#       socket_rows ：ローカルのソケット（1行目がヘッダのCSV行）から読む
+#       replay_rows ：記録済みの試合を、試合時計の経過に合わせて speed 倍速で流す（オフライン試験用）
+#   - 試合ごとの状態（possession_ver2 と同じ状態機械の変数・両チームの累積得点・現ポゼの特徴量）を dict で持ち、
+#     1行あたりの処理は定数回の dict / 配列参照だけ（O(1)）。途中から再開しても状態は試合ごとに独立
+#   - 状態遷移は possession_ver2._possession_kernel と同じ。ただし「試合の2チーム」は全行の先読みではなく
+#     その時点までに出現したチームから決める（再開系の中立行でポゼを開始するときだけ影響）
+#   - possession_points はポゼに属する行の得点の合計（守備側の得点も含む。epv.py の points_scored と同じ定義）
+#   - EPV：ポゼッション開始時の 点差・残り秒 と、その時点までの速攻・セカンドチャンスのタグで
+#     epv_cube.epv_lookup を引く（キューブが無ければ None）
+#
+# 使い方：
+#   asyncio.run(run_live(tail_csv(LIVE_CSV), on_update=print_update, cube=load_epv_cube(CUBE_NPZ)))
+#   asyncio.run(run_live(replay_rows("game.csv", speed=120)))          # 記録済みの試合を120倍速で再生
+#   asyncio.run(serve_replay("game.csv", HOST, PORT))                    # 別プロセスから socket_rows(HOST, PORT) で受信
+# ================================================
+
+import asyncio
+import csv
+import os
+from typing import AsyncIterator, Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+import action_codes as ac
+from action_codes import F_CAN_START, F_DREB, F_FT, F_MADE, F_MISS, F_NEUTRAL, F_OREB, F_STEAL, F_TOLIKE
+from epv_cube import CUBE_NPZ, epv_lookup, load_epv_cube
+from game_clock import CLOCK_COL, elapsed_seconds, parse_clock
+from possession_ver2 import END_CHANGE, END_DREB, END_GAME, END_MADE, END_REASONS, END_STEAL, END_TURNOVER
+
+# ========= ユーザー設定 =========
+LIVE_CSV = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/live_pbp.csv"
+HOST, PORT = "127.0.0.1", 8765
+POLL_SEC = 0.5           # tail_csv：追記が無いときに待つ秒数
+REPLAY_SPEED = 60.0      # replay_rows：何倍速で流すか（0 以下なら待たずに流す）
+TAGS = {"fastbreak": [35], "second_chance": [37]}   # epv.py と同じタグ（A1〜A3 のどこかに出れば True）
+# ===============================
+
+NO_TEAM = -1
+_TAG_TABLE = ac.bit_table([set(v) for v in TAGS.values()])
+_POINT_TABLE = ac.POINT_TABLE
+_FLAG_TABLE = ac.FLAG_TABLE
+
+
+# ---------- 1行の値の変換 ----------
+def _int(v, default: int = NO_TEAM) -> int:
+    """文字列・数値・欠損 → int（変換できなければ default）。"""
+    if v is None:
+        return default
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return default
+    return int(f) if f == f else default
+
+
+_CLOCK_CACHE: Dict[object, float] = {}
+
+
+def _clock(v) -> float:
+    """残時間1つ → 秒（game_clock.parse_clock と同じ。値の種類は少ないので結果を覚えておく）。"""
+    sec = _CLOCK_CACHE.get(v)
+    if sec is None:
+        sec = _CLOCK_CACHE[v] = float(parse_clock([v])[0])
+    return sec
+
+
+def _lookup(table: np.ndarray, code: int) -> int:
+    return int(table[code]) if 0 <= code < len(table) else 0
+
+
+def row_flags(row: Dict) -> int:
+    """1行の A1〜A3 → ビットフラグ（全て欠損なら中立。possession_ver2._classify_actions と同じ）。"""
+    codes = [_int(row.get(c), -1) for c in ac.ACTION_COLS]
+    if all(c < 0 for c in codes):
+        return F_NEUTRAL
+    f = 0
+    for c in codes:
+        f |= _lookup(_FLAG_TABLE, c)
+    return f
+
+
+# ---------- 試合ごとの状態 ----------
+def new_game_state(game_id: int) -> Dict:
+    """1試合分の状態（possession_ver2 の状態変数 ＋ 累積得点 ＋ 現ポゼの特徴量）。"""
+    return {
+        "試合ID": game_id, "rows": 0, "clock": np.nan, "t0": NO_TEAM, "t1": NO_TEAM,
+        "cur": NO_TEAM, "local_id": 0, "waiting_reb": False, "in_ft_seq": False,
+        "pending_open": False, "prev_close": NO_TEAM,
+        "score": {}, "poss": None, "closed": [], "finished": False,
+    }
+
+
+def _margin(st: Dict, team: int) -> Optional[int]:
+    """team 視点の現在の点差（相手が未出現なら None）。"""
+    opp = st["t1"] if team == st["t0"] else st["t0"] if team == st["t1"] else NO_TEAM
+    if team == NO_TEAM or opp == NO_TEAM:
+        return None
+    return st["score"].get(team, 0) - st["score"].get(opp, 0)
+
+
+def _open(st: Dict, team: int, row_no: int, clock: float, cube: Optional[Dict]) -> None:
+    st["local_id"] += 1
+    st["cur"] = team
+    st["waiting_reb"] = st["in_ft_seq"] = st["pending_open"] = False
+    st["prev_close"] = NO_TEAM
+    st["poss"] = {"possession_id": st["local_id"], "possession_team": team, "start_row": row_no,
+                  "clock_start": clock, "score_margin_start": _margin(st, team), "points": 0,
+                  "tags": 0, "epv": None}
+    _update_epv(st, cube)
+
+
+def _close(st: Dict, row_no: int, reason: int) -> None:
+    p = st["poss"]
+    p["end_row"], p["end_reason"] = row_no, END_REASONS[reason]
+    st["closed"].append(p)
+    st["prev_close"] = st["cur"]
+    st["cur"] = NO_TEAM
+    st["poss"] = None
+    st["pending_open"] = True
+
+
+def _update_epv(st: Dict, cube: Optional[Dict]) -> None:
+    p = st["poss"]
+    if cube is None or p is None or p["score_margin_start"] is None or p["clock_start"] != p["clock_start"]:
+        return
+    names = list(TAGS)
+    tag = {k: bool(p["tags"] >> i & 1) for i, k in enumerate(names)}
+    try:
+        p["epv"] = epv_lookup(cube, team=p["possession_team"], margin=p["score_margin_start"],
+                              clock=p["clock_start"], fastbreak=tag.get("fastbreak", False),
+                              second_chance=tag.get("second_chance", False))
+    except ValueError:   # キューブに無いチーム → リーグ全体
+        p["epv"] = epv_lookup(cube, team=None, margin=p["score_margin_start"], clock=p["clock_start"],
+                              fastbreak=tag.get("fastbreak", False), second_chance=tag.get("second_chance", False))
+
+
+def step(st: Dict, row: Dict, cube: Optional[Dict] = None) -> Dict:
+    """
+    1行を状態に反映し、その行のスナップショット（行番号・ポゼ・点差・EPV）を返す。O(1)。
+    遷移は possession_ver2._possession_kernel の1行分と同じ。
+    """
+    i = st["rows"]
+    st["rows"] += 1
+    st["closed"] = []   # この行で閉じたポゼ（最終行では「攻守交代で閉じたポゼ」と「試合終了で閉じたポゼ」の2つになりうる）
+    t = _int(row.get("チームID"))
+    f = row_flags(row)
+    clock = st["clock"] = _clock(row.get(CLOCK_COL))
+
+    if t != NO_TEAM:
+        if st["t0"] == NO_TEAM:
+            st["t0"] = t
+        elif st["t1"] == NO_TEAM and t != st["t0"]:
+            st["t1"] = t
+
+    do_open = do_close = False
+    open_team, reason = NO_TEAM, 0
+    cur, t0, t1 = st["cur"], st["t0"], st["t1"]
+
+    # 1) 終了直後の“開始待ち”
+    if cur == NO_TEAM and st["pending_open"]:
+        prev = st["prev_close"]
+        if t != NO_TEAM and (prev == NO_TEAM or t != prev):
+            do_open, open_team = True, t
+        elif t == NO_TEAM and (f & F_CAN_START):
+            if t1 != NO_TEAM and prev == t0:
+                do_open, open_team = True, t1
+            elif t1 != NO_TEAM and prev == t1:
+                do_open, open_team = True, t0
+
+    in_poss = False
+    if not do_open:
+        if cur == NO_TEAM:
+            # 2) まだ誰のポゼでもない通常時
+            if t != NO_TEAM and (f & (F_DREB | F_STEAL | F_CAN_START)):
+                do_open, open_team = True, t
+        else:
+            # 3) 現ポゼあり
+            in_poss = True
+            if st["waiting_reb"] or st["in_ft_seq"]:
+                # リバウンド待ち / FT 中（どちらか一方だけが立つ）
+                if st["in_ft_seq"] and t == cur and (f & F_FT):
+                    pass
+                elif t == cur and (f & F_OREB):
+                    st["waiting_reb"] = st["in_ft_seq"] = False
+                elif t != cur and (f & (F_DREB | F_STEAL)):
+                    do_close = do_open = True
+                    reason = END_DREB if f & F_DREB else END_STEAL
+                elif f & F_NEUTRAL:
+                    pass
+                elif t != cur:
+                    do_close = do_open = True
+                    reason = END_CHANGE
+                else:
+                    st["waiting_reb"] = st["in_ft_seq"] = False
+            else:
+                if t == cur and (f & F_MADE):
+                    do_close, reason = True, END_MADE
+                elif t == cur and (f & F_TOLIKE):
+                    do_close, reason = True, END_TURNOVER
+                elif t == cur and (f & F_MISS):
+                    st["waiting_reb"] = True
+                elif t == cur and (f & F_FT):
+                    st["in_ft_seq"] = True
+                elif t != cur and (f & (F_DREB | F_STEAL)):
+                    do_close = do_open = True
+                    reason = END_DREB if f & F_DREB else END_STEAL
+            open_team = t
+
+    # 得点・タグはその行が属するポゼ（同じ行で開始したら新しいポゼ、そうでなければ現ポゼ）に入れる
+    # ポゼの得点はどちらのチームの得点も数える（epv.stage_possessions の points_scored と同じ）
+    pts = _lookup(_POINT_TABLE, _int(row.get("アクション1"), -1))
+    if pts and t != NO_TEAM:
+        st["score"][t] = st["score"].get(t, 0) + pts
+    if in_poss and not do_open:
+        _add_to_poss(st, row, pts, cube)
+
+    if do_close:
+        _close(st, i, reason)
+    if do_open:
+        if open_team == NO_TEAM:
+            raise ValueError("チームIDが欠損した行でポゼッションを開始しようとしました")
+        _open(st, open_team, i, clock, cube)
+        _add_to_poss(st, row, pts, cube)
+
+    if _int(row.get("試合終了フラグ"), 0) == 1:
+        finish_game(st)
+    return snapshot(st, i, row)
+
+
+def _add_to_poss(st: Dict, row: Dict, pts: int, cube: Optional[Dict]) -> None:
+    p = st["poss"]
+    p["points"] += pts
+    tags = 0
+    for c in ac.ACTION_COLS:
+        tags |= _lookup(_TAG_TABLE, _int(row.get(c), -1))
+    if tags & ~p["tags"]:
+        p["tags"] |= tags
+        _update_epv(st, cube)
+
+
+def finish_game(st: Dict) -> None:
+    """試合終了：未クローズのポゼを最後の行で閉じる（kernel の「試合末尾」と同じ）。"""
+    if st["cur"] != NO_TEAM:
+        _close(st, st["rows"] - 1, END_GAME)
+    st["finished"] = True
+
+
+def snapshot(st: Dict, row_no: int, row: Dict) -> Dict:
+    """
+    表示・保存用の現在値（dict）。possession_id / possession_team はその行が属するポゼ
+    （possession_ver2 の行ラベルと同じ。その行で閉じたポゼも含む）、closed はその行で閉じたポゼのリスト（閉じた順）。
+    """
+    closed = [c for c in st["closed"] if c["end_row"] == row_no]
+    p = st["poss"] if st["poss"] is not None else closed[-1] if closed else None
+    teams = [t for t in (st["t0"], st["t1"]) if t != NO_TEAM]
+    return {
+        "試合ID": st["試合ID"], "row": row_no, "ピリオド": _int(row.get("ピリオド"), 0),
+        "残り秒": st["clock"],
+        "score": {t: st["score"].get(t, 0) for t in teams},
+        "possession_id": p["possession_id"] if p else None,
+        "possession_team": p["possession_team"] if p else None,
+        "margin": _margin(st, p["possession_team"]) if p else None,
+        "possession_points": p["points"] if p else None,
+        "epv": p["epv"] if p else None,
+        "closed": closed,
+    }
+
+
+def update(states: Dict[int, Dict], row: Dict, cube: Optional[Dict] = None) -> Optional[Dict]:
+    """row の試合の状態を（無ければ作って）1行進める。試合IDが無い行・試合終了後に届いた行は None。"""
+    gid = _int(row.get("試合ID"))
+    if gid == NO_TEAM:
+        return None
+    st = states.get(gid)
+    if st is None:
+        st = states[gid] = new_game_state(gid)
+    if st["finished"]:
+        return None
+    return step(st, row, cube)
+
+
+# ---------- 入力（非同期） ----------
+def _record(header, line: str) -> Dict:
+    values = next(csv.reader([line]))
+    return {k: (v if v != "" else None) for k, v in zip(header, values)}
+
+
+async def tail_csv(path: str, poll: float = POLL_SEC, idle_timeout: Optional[float] = None,
+                   encoding: str = "utf-8-sig") -> AsyncIterator[Dict]:
+    """
+    追記されていくCSVを先頭から読み、以降は追記分を読み続ける。書きかけの行（改行なし）は完成まで待つ。
+    idle_timeout 秒追記が無ければ終わる（None なら終わらない）。
+    """
+    while not os.path.exists(path):
+        await asyncio.sleep(poll)
+    header, buf, idle = None, "", 0.0
+    with open(path, encoding=encoding, newline="") as f:
+        while True:
+            line = f.readline()
+            if not line or not line.endswith("\n"):
+                buf += line
+                if idle_timeout is not None and idle >= idle_timeout:
+                    return
+                await asyncio.sleep(poll)
+                idle += poll
+                continue
+            line, buf, idle = buf + line, "", 0.0
+            if not line.strip():
+                continue
+            if header is None:
+                header = next(csv.reader([line]))
+                continue
+            yield _record(header, line)
+
+
+async def socket_rows(host: str = HOST, port: int = PORT, encoding: str = "utf-8") -> AsyncIterator[Dict]:
+    """ソケットから CSV 行を読む（1行目がヘッダ）。相手が閉じたら終わる。"""
+    reader, writer = await asyncio.open_connection(host, port)
+    header = None
+    try:
+        while True:
+            raw = await reader.readline()
+            if not raw:
+                return
+            line = raw.decode(encoding)
+            if not line.strip():
+                continue
+            if header is None:
+                header = next(csv.reader([line]))
+                continue
+            yield _record(header, line)
+    finally:
+        writer.close()
+
+
+# ---------- 記録済みの試合の再生 ----------
+def _replay_frame(path: str) -> pd.DataFrame:
+    df = pd.read_csv(path) if isinstance(path, str) else path
+    return df.sort_values(["試合ID", "ピリオド", "履歴No"], kind="stable").reset_index(drop=True)
+
+
+def _replay_waits(df: pd.DataFrame, speed: float) -> np.ndarray:
+    """各行の前に待つ秒数（同じ試合の経過秒の差 ÷ speed。試合の切り替わり・時刻不明は0）。"""
+    if speed <= 0 or CLOCK_COL not in df.columns:
+        return np.zeros(len(df))
+    t = elapsed_seconds(df)
+    gid = df["試合ID"].to_numpy()
+    dt = np.r_[0.0, np.diff(t)]
+    dt[np.r_[True, gid[1:] != gid[:-1]]] = 0.0
+    return np.clip(np.nan_to_num(dt, nan=0.0), 0, None) / speed
+
+
+async def replay_rows(path, speed: float = REPLAY_SPEED) -> AsyncIterator[Dict]:
+    """記録済みのプレイバイプレイ（CSV パス / DataFrame）を試合時計どおりに speed 倍速で1行ずつ流す。"""
+    df = _replay_frame(path)
+    waits = _replay_waits(df, speed)
+    cols = list(df.columns)
+    for w, values in zip(waits, df.itertuples(index=False, name=None)):
+        if w > 0:
+            await asyncio.sleep(w)
+        yield {k: (None if isinstance(v, float) and v != v else v) for k, v in zip(cols, values)}
+
+
+def _csv_line(values) -> str:
+    return ",".join("" if v is None or (isinstance(v, float) and v != v) else
+                    '"' + str(v).replace('"', '""') + '"' if ("," in str(v) or '"' in str(v)) else str(v)
+                    for v in values) + "\n"
+
+
+async def replay_to_file(path, dst: str, speed: float = REPLAY_SPEED) -> int:
+    """記録済みの試合を dst に1行ずつ追記する（tail_csv の試験用）。戻り値：書いた行数"""
+    df = _replay_frame(path)
+    waits = _replay_waits(df, speed)
+    with open(dst, "w", encoding="utf-8", newline="") as f:
+        f.write(_csv_line(df.columns))
+        f.flush()
+        for w, values in zip(waits, df.itertuples(index=False, name=None)):
+            if w > 0:
+                await asyncio.sleep(w)
+            f.write(_csv_line(values))
+            f.flush()
+    return len(df)
+
+
+async def serve_replay(path, host: str = HOST, port: int = PORT, speed: float = REPLAY_SPEED,
+                       once: bool = True) -> None:
+    """接続してきた相手に記録済みの試合を CSV 行で流すサーバ（once=True なら1接続で終わる）。"""
+    df = _replay_frame(path)
+    waits = _replay_waits(df, speed)
+    done = asyncio.Event()
+
+    async def handle(reader, writer):
+        writer.write(_csv_line(df.columns).encode("utf-8"))
+        for w, values in zip(waits, df.itertuples(index=False, name=None)):
+            if w > 0:
+                await asyncio.sleep(w)
+            writer.write(_csv_line(values).encode("utf-8"))
+            await writer.drain()
+        writer.close()
+        done.set()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        if once:
+            await done.wait()
+        else:
+            await server.serve_forever()
+
+
+# ---------- 実行 ----------
+async def run_live(rows: AsyncIterator[Dict], on_update: Optional[Callable[[Dict], None]] = None,
+                   cube: Optional[Dict] = None, states: Optional[Dict[int, Dict]] = None) -> Dict[int, Dict]:
+    """
+    rows を受け取るたびに該当試合の状態を更新し、on_update(スナップショット) を呼ぶ。
+    states を渡せばその状態から再開する。戻り値：試合ID → 状態
+    """
+    states = {} if states is None else states
+    async for row in rows:
+        snap = update(states, row, cube)
+        if snap is not None and on_update is not None:
+            on_update(snap)
+    return states
+
+
+def print_update(snap: Dict) -> None:
+    for c in snap["closed"]:
+        print(f"[{snap['試合ID']}] ポゼ{c['possession_id']} 終了（{c['possession_team']}, {c['end_reason']}, "
+              f"{c['points']}点） スコア {snap['score']}")
+    if snap["possession_team"] is not None:
+        epv = "-" if snap["epv"] is None else f"{snap['epv']:.2f}"
+        print(f"[{snap['試合ID']}] Q{snap['ピリオド']} 残り{snap['残り秒']:.0f}秒 攻撃 {snap['possession_team']} "
+              f"点差 {snap['margin']} EPV {epv}")
+
+
+if __name__ == "__main__":
+    cube = load_epv_cube(CUBE_NPZ) if os.path.exists(CUBE_NPZ) else None
+    asyncio.run(run_live(tail_csv(LIVE_CSV), on_update=print_update, cube=cube))
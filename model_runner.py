@@ -0,0 +1,204 @@
+# model_runner.py
+# ================================================
+# 勝敗の L1 ロジスティック回帰と 得点の Lasso 回帰を、全チーム × 正則化パスでまとめて当てる
+#   - logistic*.ipynb の「リーグ全体 → チームID == 745 だけ」のコピペセルを1回の呼び出しに置き換える
+#   - 標準化済みの計画行列（説明変数ごとに平均0・分散1、ddof=0 = StandardScaler と同じ）はチームごとに1回だけ作り、
+#     同じチームの全 alpha・全モデルで使い回す
+#   - L1 ロジスティック：sm.Logit(...).fit_regularized(method="l1") を alpha の大きい順に当て、
+#     1つ前の解を start_params に渡す（ウォームスタート）
+#   - Lasso：LassoCV(cv=5, random_state=42) で最適 alpha を選び、その alpha 列の係数パスを lasso_path で返す
+#   - チーム（＋リーグ全体）ごとの当てはめは ProcessPoolExecutor で並列化
+#   - 戻り値は1行1係数の縦持ち表：model / チームID / alpha / 変数 / 係数 / n / 備考列
+#
+# 注意：macOS / Windows（spawn 起動）では、呼び出し側スクリプトを
+#       if __name__ == "__main__": の中から実行すること
+#
+# 使い方：
+#   coef = run_models(load_team_games())                       # 全チーム＋リーグ全体、両モデル（team_games.py の表）
+#   coef.query("model == 'logit_l1' and チームID == 745 and alpha == 1")
+# ================================================
+
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# ========= ユーザー設定 =========
+CUP_IDS = [500, 507]     # 対象のカップID（リーグ戦）。None なら全試合
+OUTPUT_COEF_CSV = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/model_coefficients.csv"
+WIN_FEATURES = [
+    'ブロックショット','ファウル','ダンク','被ブロックショット',
+    'ディフェンスリバウンド','スティール','ターンオーバ','ファストブレイクポイント',
+    'アシスト','セカンドチャンスポイント','オフェンスリバウンド',
+    '被ファウル','3P試投','2P試投','2Pインサイドポイント','フリースロー試投'
+]
+POINTS_FEATURES = [
+    '3P試投','2P試投','ダンク','フリースロー試投',
+    'ディフェンスリバウンド','オフェンスリバウンド',
+    'ターンオーバ','スティール','ブロックショット','被ブロックショット',
+    'ファストブレイクポイント','セカンドチャンスポイント','ファウル','被ファウル'
+]
+LOGIT_ALPHAS = [10, 3, 1, 0.3, 0.1]   # L1 ロジスティックの正則化パス（notebook は alpha=1）
+LASSO_CV = 5
+TEAMS = None             # None なら全チーム。リストなら指定チームのみ
+INCLUDE_LEAGUE = True    # リーグ全体（チームID = "ALL"）も当てる
+MAX_WORKERS = None       # None なら CPU コア数。1 なら並列化しない
+# ===============================
+
+LEAGUE = "ALL"
+CONST = "const"
+MODELS = ["logit_l1", "lasso"]
+COEF_COLS = ["model", "チームID", "alpha", "変数", "係数", "n", "is_best", "converged"]
+
+
+# ---------- 計画行列 ----------
+def standardize(X: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """StandardScaler と同じ標準化（ddof=0、分散0の列は scale=1）。戻り値：(Z, mean, scale)"""
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale = np.where(scale > 0, scale, 1.0)
+    return (X - mean) / scale, mean, scale
+
+
+def build_designs(df: pd.DataFrame, features: Sequence[str], target: str, teams=None,
+                  include_league: bool = True) -> Dict[object, Dict[str, np.ndarray]]:
+    """
+    チーム（＋リーグ全体）ごとの標準化済み計画行列。
+    値は {"X": 標準化した説明変数, "y": 目的変数, "mean", "scale"}。説明変数・目的変数に欠損がある行は除く。
+    """
+    miss = [c for c in ["チームID", target] + list(features) if c not in df.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+
+    data = df[["チームID", target] + list(features)].apply(pd.to_numeric, errors="coerce").dropna()
+    team = data["チームID"].to_numpy(dtype=np.int64)
+    X = data[list(features)].to_numpy(dtype="float64")
+    y = data[target].to_numpy(dtype="float64")
+
+    keys: List[object] = [LEAGUE] if include_league else []
+    keys += sorted(np.unique(team).tolist()) if teams is None else list(teams)
+    designs = {}
+    for k in keys:
+        m = slice(None) if k == LEAGUE else team == int(k)
+        Z, mean, scale = standardize(X[m])
+        designs[k] = {"X": Z, "y": y[m], "mean": mean, "scale": scale}
+    return designs
+
+
+# ---------- 当てはめ（ワーカー側） ----------
+def fit_logit_path(design: Dict[str, np.ndarray], alphas: Sequence[float], maxiter: int = 1000) -> List[Dict]:
+    """
+    L1 ロジスティック回帰を alpha の大きい順に当てる（前の解をウォームスタートに使う）。
+    alpha は notebook と同じく定数項も含めた全係数にかかる（statsmodels の fit_regularized の既定）。
+    勝敗が片方しかない・完全分離などで当てられない alpha は係数 NaN、converged=False。
+    """
+    import statsmodels.api as sm
+
+    X = sm.add_constant(design["X"], has_constant="add")
+    y = design["y"]
+    out, start = [], None
+    for a in sorted(alphas, reverse=True):
+        params, ok = np.full(X.shape[1], np.nan), False
+        if len(y) > X.shape[1] and 0 < y.sum() < len(y):
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    res = sm.Logit(y, X).fit_regularized(method="l1", alpha=a, maxiter=maxiter,
+                                                         start_params=start, disp=0)
+                params = np.asarray(res.params, dtype="float64")
+                ok = bool(res.mle_retvals.get("converged", True))
+                start = params
+            except Exception:  # 完全分離・特異行列など（そのチームの当該 alpha だけ NaN にする）
+                pass
+        out.append({"alpha": float(a), "coef": params, "converged": ok})
+    return out
+
+
+def fit_lasso_path(design: Dict[str, np.ndarray], cv: int = LASSO_CV) -> List[Dict]:
+    """LassoCV（notebook と同じ cv=5, random_state=42）で最適 alpha を選び、同じ alpha 列の係数パスを返す。"""
+    from sklearn.linear_model import LassoCV, lasso_path
+
+    X, y = design["X"], design["y"]
+    if len(y) < max(cv, 2):
+        return []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        lasso = LassoCV(cv=cv, random_state=42).fit(X, y)
+        # lasso_path は内部で alpha の大きい順にウォームスタートする（中心化は LassoCV の切片と同じ扱い）
+        alphas, coefs, _ = lasso_path(X - X.mean(axis=0), y - y.mean(), alphas=lasso.alphas_)
+    out = []
+    for i, a in enumerate(alphas):
+        intercept = y.mean() - X.mean(axis=0) @ coefs[:, i]
+        out.append({"alpha": float(a), "coef": np.r_[intercept, coefs[:, i]],
+                    "converged": True, "is_best": bool(np.isclose(a, lasso.alpha_))})
+    return out
+
+
+def _fit_task(task: Tuple[str, object, Dict[str, np.ndarray]], logit_alphas: Sequence[float],
+              lasso_cv: int) -> Tuple[str, object, int, List[Dict]]:
+    model, key, design = task
+    path = fit_logit_path(design, logit_alphas) if model == "logit_l1" else fit_lasso_path(design, lasso_cv)
+    return model, key, len(design["y"]), path
+
+
+# ---------- まとめて実行 ----------
+def run_models(df: pd.DataFrame, win_features: Sequence[str] = WIN_FEATURES,
+               points_features: Sequence[str] = POINTS_FEATURES, logit_alphas: Sequence[float] = LOGIT_ALPHAS,
+               lasso_cv: int = LASSO_CV, teams=TEAMS, include_league: bool = INCLUDE_LEAGUE,
+               models: Sequence[str] = MODELS, max_workers: Optional[int] = MAX_WORKERS) -> pd.DataFrame:
+    """
+    全チーム（＋リーグ全体）× 正則化パスで両モデルを当て、縦持ちの係数表（COEF_COLS）を返す。
+      logit_l1：目的変数 勝敗、説明変数 win_features、alpha は logit_alphas
+      lasso   ：目的変数 得点、説明変数 points_features、alpha は LassoCV のパス（is_best が選ばれた alpha）
+    係数は標準化した説明変数に対するもの（変数 "const" は切片）。
+    """
+    unknown = [m for m in models if m not in MODELS]
+    if unknown:
+        raise ValueError(f"未知のモデルです: {unknown}")
+
+    spec = {"logit_l1": (win_features, "勝敗"), "lasso": (points_features, "得点")}
+    tasks, names = [], {}
+    for m in models:
+        features, target = spec[m]
+        names[m] = [CONST] + list(features)
+        designs = build_designs(df, features, target, teams, include_league)
+        tasks += [(m, k, d) for k, d in designs.items()]
+
+    fit = partial(_fit_task, logit_alphas=logit_alphas, lasso_cv=lasso_cv)
+    workers = max_workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) <= 1:
+        results = list(map(fit, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(fit, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+    rows = []
+    for model, key, n, path in results:
+        best = None
+        if model == "logit_l1":
+            best = min(logit_alphas, key=lambda a: abs(a - 1.0))  # notebook の alpha=1 に最も近いもの
+        for p in path:
+            is_best = p.get("is_best", p["alpha"] == best)
+            rows += [(model, key, p["alpha"], v, c, n, is_best, p["converged"])
+                     for v, c in zip(names[model], p["coef"])]
+    return pd.DataFrame(rows, columns=COEF_COLS)
+
+
+def coef_wide(coef: pd.DataFrame, model: str = "logit_l1", alpha: Optional[float] = None) -> pd.DataFrame:
+    """係数表を 変数 × チームID の横持ちにする（alpha が None なら is_best の行）。"""
+    c = coef[coef["model"] == model]
+    c = c[c["is_best"]] if alpha is None else c[np.isclose(c["alpha"], alpha)]
+    return c.pivot_table(index="変数", columns="チームID", values="係数", sort=False)
+
+
+if __name__ == "__main__":
+    from team_games import load_team_games
+    df = load_team_games(filters=[("カップID", "in", CUP_IDS)] if CUP_IDS else None)
+    coef = run_models(df)
+    coef.to_csv(OUTPUT_COEF_CSV, index=False, encoding="utf-8-sig")
+    print(f"✅ 保存しました: {OUTPUT_COEF_CSV}（{coef['チームID'].nunique()} 対象 × {len(coef)} 行）")
+    print(coef_wide(coef)[[LEAGUE, 745]] if 745 in set(coef["チームID"]) else coef_wide(coef).iloc[:, :3])
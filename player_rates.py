@@ -0,0 +1,202 @@
+# player_rates.py
+# ================================================
+# ボックススコア → 選手ごとの 40分あたり・1試合あたり・100ポゼッションあたり の全スタッツ（1回の集計で全列）
+#   - ピリオド区分 == 18（試合合計）の選手行を (シーズン, カップID, 選手ID, チームID) で合計
+#     （カップID は試合データから。リーグ戦だけ等は filters=[("カップID", "in", [507])] で読む）
+#   - プレイタイムは game_clock.parse_clock で秒に（DNP などは 0 秒）
+#   - 40分あたり = 合計 / 出場秒 × 2400。出場秒が0以下なら NaN（inf は出さない）
+#   - 1試合あたり = 合計 / 出場試合数（出場秒 > 0 の試合）
+#   - 100ポゼッションあたり：チームの試合ポゼッション数（FGA + 0.44×FTA − OR + TO）を
+#     出場時間の割合（出場秒 ÷ チーム合計出場秒 × 5）で配分した「在コートポゼッション数」で割る
+#   - 合計列はシーズンごとに data_store の STORE_DIR/player_rates/シーズン=.../ に保存し、
+#     レートは読み込み時に計算（最低出場時間・ポジション / チームでの集計はそのときに指定）
+#
+# 使い方：
+#   rates = load_player_rates(seasons=["24-25"], min_sec=300)          # 5分以上出場した選手
+#   rates[["選手名", "オフェンスリバウンド_per40", "ディフェンスリバウンド_per40"]]
+#   by_pos = group_rates(load_player_totals(), ["シーズン", "ポジション"])
+#   by_player = group_rates(load_player_totals(filters=[("カップID", "in", [507])]), ["選手ID"])   # チーム・カップをまたいで合計
+# ================================================
+
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import data_store
+from game_clock import parse_clock
+from team_games import TOTAL_PERIOD, game_seasons
+
+# ========= ユーザー設定 =========
+STORE_DIR = data_store.STORE_DIR
+MIN_SEC = 0              # これ未満の出場秒の選手は除く（notebook の min_playtime_sec）
+PER_MINUTES = 40         # 「何分あたり」に換算するか
+# ===============================
+
+PLAYER_KEYS = ["シーズン", "カップID", "選手ID", "チームID"]
+NO_CUP = -1              # 試合データに無い試合のカップID
+SEC_COL, GAMES_COL, POSS_COL = "プレイタイム_秒", "出場試合数", "在コートポゼッション"
+# 合計しない列（ID・区分・属性）
+NON_STAT_COLS = ["試合ID", "チームID", "選手ID", "ピリオド区分", "背番号", "ホームアウェイ",
+                 "スターティングフラグ", "プレイタイム", SEC_COL]
+# 選手マスタから結合する属性列（スタッツとしては扱わない）
+PLAYER_ATTR_COLS = ["選手名", "ポジション", "身長", "体重", "国籍"]
+# ポゼッション推定に使う列と重み
+POSS_WEIGHTS: Dict[str, float] = {"2P試投": 1.0, "3P試投": 1.0, "フリースロー試投": 0.44,
+                                  "オフェンスリバウンド": -1.0, "ターンオーバ": 1.0}
+PLAYER_RATES_PARTITIONING = ds.partitioning(pa.schema([("シーズン", pa.string())]), flavor="hive")
+
+
+def per40(num, sec, minutes: float = PER_MINUTES) -> np.ndarray:
+    """num / sec × minutes 分。sec が0以下・欠損なら NaN。"""
+    num = np.asarray(num, dtype="float64")
+    sec = np.asarray(sec, dtype="float64")
+    return np.divide(num * minutes * 60, sec, out=np.full(num.shape, np.nan), where=sec > 0)
+
+
+def _per(num, den) -> np.ndarray:
+    num, den = np.asarray(num, dtype="float64"), np.asarray(den, dtype="float64")
+    return np.divide(num, den, out=np.full(num.shape, np.nan), where=den > 0)
+
+
+def stat_columns(df: pd.DataFrame) -> List[str]:
+    """合計対象のスタッツ列（数値列から ID・区分・出場時間の列を除いたもの）。"""
+    skip = set(NON_STAT_COLS) | set(PLAYER_KEYS) | set(PLAYER_ATTR_COLS) | {GAMES_COL, POSS_COL}
+    return [c for c in df.columns if c not in skip and pd.api.types.is_numeric_dtype(df[c])
+            and not pd.api.types.is_bool_dtype(df[c])]
+
+
+def player_totals(box: pd.DataFrame, season_of: Optional[Dict[int, str]] = None,
+                  cup_of: Optional[Dict[int, int]] = None, total_period: int = TOTAL_PERIOD) -> pd.DataFrame:
+    """
+    選手の試合合計行から (シーズン, カップID, 選手ID, チームID) ごとの合計を作る。
+      スタッツ列の合計 ＋ プレイタイム_秒 ＋ 出場試合数 ＋ 在コートポゼッション
+    season_of が None ならシーズンは "ALL"。cup_of（試合ID → カップID）が None か、対応が無い試合は NO_CUP。
+    """
+    miss = [c for c in ["試合ID", "チームID", "選手ID", "ピリオド区分"] if c not in box.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+
+    b = box[pd.to_numeric(box["ピリオド区分"], errors="coerce") == total_period].copy()
+    if SEC_COL not in b.columns:
+        if "プレイタイム" not in b.columns:
+            raise ValueError("必要列が見つかりません: ['プレイタイム']")
+        b[SEC_COL] = parse_clock(b["プレイタイム"], invalid=0)
+    sec = pd.to_numeric(b[SEC_COL], errors="coerce").fillna(0).to_numpy(dtype="float64")
+    b[SEC_COL] = sec
+    b["シーズン"] = b["試合ID"].map(season_of).astype("string") if season_of is not None else "ALL"
+    b["カップID"] = b["試合ID"].map(cup_of).fillna(NO_CUP).astype(np.int64) if cup_of is not None else NO_CUP
+    stats = stat_columns(b)
+
+    # 在コートポゼッション：チームの試合ポゼッション数 × 出場秒 / (チーム合計出場秒 / 5)
+    poss_cols = [c for c in POSS_WEIGHTS if c in b.columns]
+    row_poss = sum(pd.to_numeric(b[c], errors="coerce").fillna(0).to_numpy() * POSS_WEIGHTS[c] for c in poss_cols) \
+        if poss_cols else np.zeros(len(b))
+    key = [b["試合ID"], b["チームID"]]
+    team_poss = pd.Series(row_poss, index=b.index).groupby(key).transform("sum").to_numpy()
+    team_sec = pd.Series(sec, index=b.index).groupby(key).transform("sum").to_numpy()
+    b[POSS_COL] = team_poss * _per(sec * 5, team_sec) if len(b) else np.zeros(0)
+    b[POSS_COL] = b[POSS_COL].fillna(0.0)
+    b[GAMES_COL] = (sec > 0).astype(np.int64)
+
+    tot = b.groupby(PLAYER_KEYS, sort=True)[stats + [SEC_COL, GAMES_COL, POSS_COL]].sum().reset_index()
+    return tot
+
+
+def add_rates(tot: pd.DataFrame, stats: Optional[Sequence[str]] = None, min_sec: float = MIN_SEC) -> pd.DataFrame:
+    """
+    合計表に <列>_per40 / <列>_per_game / <列>_per100 を付ける（1回の配列演算で全列）。
+    プレイタイム_秒 が min_sec 未満の行は除く。
+    """
+    miss = [c for c in [SEC_COL, GAMES_COL, POSS_COL] if c not in tot.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    t = tot[pd.to_numeric(tot[SEC_COL], errors="coerce") >= min_sec].reset_index(drop=True)
+    stats = list(stats) if stats is not None else stat_columns(t)
+    v = t[stats].to_numpy(dtype="float64")
+    sec = t[SEC_COL].to_numpy(dtype="float64")[:, None]
+    games = t[GAMES_COL].to_numpy(dtype="float64")[:, None]
+    poss = t[POSS_COL].to_numpy(dtype="float64")[:, None]
+    rates = np.hstack([per40(v, np.broadcast_to(sec, v.shape)),
+                       _per(v, np.broadcast_to(games, v.shape)),
+                       _per(v * 100, np.broadcast_to(poss, v.shape))])
+    names = [f"{c}_per40" for c in stats] + [f"{c}_per_game" for c in stats] + [f"{c}_per100" for c in stats]
+    return pd.concat([t, pd.DataFrame(rates, columns=names)], axis=1)
+
+
+def group_rates(tot: pd.DataFrame, by: Sequence[str], min_sec: float = MIN_SEC) -> pd.DataFrame:
+    """
+    合計表を by（例：["シーズン","ポジション"] / ["シーズン","チームID"] / ["選手ID"]）で合計し直してからレートを付ける。
+    （選手のレートの平均ではなく、グループ全体の 合計 ÷ 出場時間）min_sec は集計前の選手行に適用。
+    by が 選手ID を含むときは選手マスタの属性列（PLAYER_ATTR_COLS のうちある列）も残す。
+    """
+    miss = [c for c in by if c not in tot.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    t = tot[pd.to_numeric(tot[SEC_COL], errors="coerce") >= min_sec]
+    stats = stat_columns(t)
+    g = t.groupby(list(by), dropna=False)
+    out = g[stats + [SEC_COL, GAMES_COL, POSS_COL]].sum()
+    out["選手数"] = g["選手ID"].nunique() if "選手ID" in t.columns else np.nan
+    if "選手ID" in by:
+        attrs = [c for c in PLAYER_ATTR_COLS if c in t.columns and c not in by]
+        out = out.join(g[attrs].first())
+    return add_rates(out.reset_index(), stats, min_sec=0)
+
+
+def attach_players(df: pd.DataFrame, player: pd.DataFrame, cols: Sequence[str] = PLAYER_ATTR_COLS) -> pd.DataFrame:
+    """選手マスタの属性列（PLAYER_ATTR_COLS のうちある列）を 選手ID で結合（マスタ側の重複IDは先頭を使う）。"""
+    cols = ["選手ID"] + [c for c in cols if c in player.columns and c not in df.columns]
+    return df.merge(player[cols].drop_duplicates("選手ID"), on="選手ID", how="left")
+
+
+# ---------- 保存・読み込み ----------
+def build_player_totals(store_dir: str = STORE_DIR, seasons: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """取り込み済みの box（と選手マスタ）から合計表を作り、STORE_DIR/player_rates/シーズン=.../ に保存する。"""
+    season_of = game_seasons(store_dir)
+    if seasons is not None:
+        season_of = {g: s for g, s in season_of.items() if s in set(seasons)}
+    ids = sorted(season_of)
+    box = data_store.load_table("box", filters=[("試合ID", "in", ids)], store_dir=store_dir)
+    game = data_store.load_table("game", columns=["試合ID", "カップID"], filters=[("試合ID", "in", ids)],
+                                 store_dir=store_dir)
+    cup_of = dict(zip(game["試合ID"].astype(np.int64), game["カップID"].astype(np.int64)))
+    tot = player_totals(box, season_of, cup_of)
+    if os.path.exists(os.path.join(store_dir, "player.parquet")):
+        tot = attach_players(tot, data_store.load_table("player", store_dir=store_dir))
+    ds.write_dataset(
+        pa.Table.from_pandas(tot, preserve_index=False), os.path.join(store_dir, "player_rates"),
+        format="parquet", partitioning=PLAYER_RATES_PARTITIONING, existing_data_behavior="delete_matching",
+        basename_template="part-{i}.parquet",
+    )
+    return tot
+
+
+def load_player_totals(seasons: Optional[Sequence[str]] = None, filters: Optional[List[tuple]] = None,
+                       store_dir: str = STORE_DIR) -> pd.DataFrame:
+    """保存済みの合計表を読む（未作成なら作る）。filters は data_store.load_pbp と同じ形式。"""
+    path = os.path.join(store_dir, "player_rates")
+    if not os.path.isdir(path):
+        build_player_totals(store_dir)
+    dataset = ds.dataset(path, format="parquet", partitioning=PLAYER_RATES_PARTITIONING)
+    expr = pq.filters_to_expression(filters) if filters else None
+    if seasons is not None:
+        season_expr = ds.field("シーズン").isin(list(seasons))
+        expr = season_expr if expr is None else expr & season_expr
+    df = dataset.to_table(filter=expr).to_pandas()
+    return df.sort_values(PLAYER_KEYS, kind="stable").reset_index(drop=True)
+
+
+def load_player_rates(seasons: Optional[Sequence[str]] = None, min_sec: float = MIN_SEC,
+                      filters: Optional[List[tuple]] = None, store_dir: str = STORE_DIR) -> pd.DataFrame:
+    """保存済みの合計表を読み、全スタッツのレート列を付けて返す。"""
+    return add_rates(load_player_totals(seasons, filters, store_dir), min_sec=min_sec)
+
+
+if __name__ == "__main__":
+    tot = build_player_totals()
+    print(f"✅ 保存しました: {os.path.join(STORE_DIR, 'player_rates')}（{len(tot)} 行）")
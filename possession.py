@@ -1,7 +1,7 @@
 import pandas as pd
 import numpy as np
 
-df = pd.read_csv("/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/koshigaya_all_opponent.csv")
+import action_codes as ac
 
 
 def label_possessions(df: pd.DataFrame) -> pd.DataFrame:
@@ -23,27 +23,22 @@ def label_possessions(df: pd.DataFrame) -> pd.DataFrame:
 
     x = x.sort_values(["試合ID","ピリオド","履歴No"], ascending=[True, True, True]).reset_index(drop=True)
 
-    # ---- 2) アクション集合 ----
-    MADE_FG = {1, 3, 4, 44}
-    MISSED_FG = {2, 5, 6, 45}
-    OREB = {10, 18}
-    DREB = {9, 19}
-    FT = {7, 8}
-    STEAL = {14}
-
-    OFF_FOUL_MAIN = {23}
-    TURNOVER_MAIN = {13, 17}
-    TURNOVER_KINDS = {147,148,149,150,151,152,153,154,155,156,157,158,159,160,161,163}
-    SHOT_CLOCK = {34, 156}  # 156 は TO 詳細にも含まれる流派あり
-
-    # 中立イベント：交代/TO/レビュー/開始終了など（保持判定は次の有意味イベントで行う）
-    NEUTRAL = {
-        80,81,82,83,84,85,86,87,88,89,  # 試合/ピリオド開始・終了、時計start/stop、交代、TO
-        90,107,108,109,110,111,         # オフィシャル、ジャンプボール関連
-        133,134,135,136,137,138,        # admin系
-        139,140,141,142,143,144,        # タイムアウトの種類/レビュー/メディア等
-        116,117,118,112,113,114,115     # アウトオブバウンズ等（次行で保持が決まる想定のタグ群）
-    }
+    # ---- 2) アクション分類（action_codes のルックアップ配列で列ごと一括判定）----
+    # アクション1 が欠損の行は中立扱い
+    flags1 = ac.code_flags(x["アクション1"])
+    flags1[x["アクション1"].isna().to_numpy()] |= ac.F_NEUTRAL
+    flags1 = flags1.tolist()
+
+    def is_neutral(f):   return bool(f & ac.F_NEUTRAL)
+    def is_ft(f):        return bool(f & ac.F_FT)
+    def is_made_fg(f):   return bool(f & ac.F_MADE)
+    def is_miss_fg(f):   return bool(f & ac.F_MISS)
+    def is_oreb(f):      return bool(f & ac.F_OREB)
+    def is_dreb(f):      return bool(f & ac.F_DREB)
+    def is_steal(f):     return bool(f & ac.F_STEAL)
+    def is_to_like(f):   return bool(f & ac.F_TOLIKE)
+    # 攻撃側しか起きない明確な行為
+    OFFENSIVE = ac.F_MADE | ac.F_MISS | ac.F_FT | ac.F_OREB | ac.F_TOLIKE
 
     # ---- 3) 出力列を用意 ----
     x["possession_id"] = pd.NA
@@ -79,40 +74,27 @@ def label_possessions(df: pd.DataFrame) -> pd.DataFrame:
             x.loc[i, "possession_end_flag"] = 1
 
         for i in idxs:
-            a1 = x.at[i, "アクション1"]
-            a2 = x.at[i, "アクション2"]
-            a3 = x.at[i, "アクション3"]
+            f  = flags1[i]
             t  = x.at[i, "チームID"]
 
-            code1 = int(a1) if pd.notna(a1) else None
             team  = int(t) if pd.notna(t) else None
 
-            # ユーティリティ
-            def is_neutral(c):   return (c is None) or (c in NEUTRAL)
-            def is_ft(c):        return (c in FT)
-            def is_made_fg(c):   return (c in MADE_FG)
-            def is_miss_fg(c):   return (c in MISSED_FG)
-            def is_oreb(c):      return (c in OREB)
-            def is_dreb(c):      return (c in DREB)
-            def is_steal(c):     return (c in STEAL)
-            def is_to_like(c):   return (c in TURNOVER_MAIN) or (c in TURNOVER_KINDS) or (c in SHOT_CLOCK) or (c in OFF_FOUL_MAIN)
-
             # ---- まだポゼ未確定 ----
             if pd.isna(current_team):
-                if code1 in DREB or code1 in STEAL:
+                if is_dreb(f) or is_steal(f):
                     start(team, i)
                     # ミス直後・FT連続のフラグは通常ここでは立たないが整合性のため
-                    if is_miss_fg(code1): waiting_rebound = True
-                    if is_ft(code1) and team == current_team: in_ft_sequence = True
-                    if team == current_team and (is_made_fg(code1) or is_to_like(code1)):
+                    if is_miss_fg(f): waiting_rebound = True
+                    if is_ft(f) and team == current_team: in_ft_sequence = True
+                    if team == current_team and (is_made_fg(f) or is_to_like(f)):
                         end(i); current_team = pd.NA
                     continue
-                elif code1 in (MADE_FG | MISSED_FG | FT | OREB | TURNOVER_MAIN | OFF_FOUL_MAIN | TURNOVER_KINDS | SHOT_CLOCK):
+                elif f & OFFENSIVE:
                     # 攻撃側しか起きない明確な行為 → この行のチームで開始
                     start(team, i)
-                    if is_miss_fg(code1): waiting_rebound = True
-                    if is_ft(code1) and team == current_team: in_ft_sequence = True
-                    if team == current_team and (is_made_fg(code1) or is_to_like(code1)):
+                    if is_miss_fg(f): waiting_rebound = True
+                    if is_ft(f) and team == current_team: in_ft_sequence = True
+                    if team == current_team and (is_made_fg(f) or is_to_like(f)):
                         end(i); current_team = pd.NA
                     continue
                 else:
@@ -124,12 +106,12 @@ def label_possessions(df: pd.DataFrame) -> pd.DataFrame:
 
             # ミス後のリバウンド待ち
             if waiting_rebound:
-                if team == current_team and is_oreb(code1):
+                if team == current_team and is_oreb(f):
                     waiting_rebound = False               # OREB→継続
-                elif team != current_team and (is_dreb(code1) or is_steal(code1)):
+                elif team != current_team and (is_dreb(f) or is_steal(f)):
                     end(i); current_team = pd.NA          # DREB/STEAL→交代
                     start(team, i)
-                elif is_neutral(code1):
+                elif is_neutral(f):
                     pass                                  # 中立は読み飛ばす
                 elif team != current_team:
                     end(i); current_team = pd.NA          # 相手の攻撃行為→交代
@@ -140,17 +122,17 @@ def label_possessions(df: pd.DataFrame) -> pd.DataFrame:
 
             # FT 連続中
             if in_ft_sequence:
-                if team == current_team and is_ft(code1):
+                if team == current_team and is_ft(f):
                     # 連続中は継続
                     pass
                 else:
                     # 連続終了 → 次イベントで保持判定
-                    if team == current_team and is_oreb(code1):
+                    if team == current_team and is_oreb(f):
                         in_ft_sequence = False             # OREB→継続
-                    elif team != current_team and (is_dreb(code1) or is_steal(code1)):
+                    elif team != current_team and (is_dreb(f) or is_steal(f)):
                         end(i); current_team = pd.NA       # DREB/STEAL→交代
                         start(team, i)
-                    elif is_neutral(code1):
+                    elif is_neutral(f):
                         pass                               # 中立は読み飛ばす
                     elif team != current_team:
                         end(i); current_team = pd.NA       # 相手の攻撃行為→交代
@@ -160,15 +142,15 @@ def label_possessions(df: pd.DataFrame) -> pd.DataFrame:
                 continue
 
             # 通常状態
-            if team == current_team and is_made_fg(code1):
+            if team == current_team and is_made_fg(f):
                 end(i); current_team = pd.NA
-            elif team == current_team and is_to_like(code1):
+            elif team == current_team and is_to_like(f):
                 end(i); current_team = pd.NA
-            elif team == current_team and is_miss_fg(code1):
+            elif team == current_team and is_miss_fg(f):
                 waiting_rebound = True
-            elif team == current_team and is_ft(code1):
+            elif team == current_team and is_ft(f):
                 in_ft_sequence = True
-            elif team != current_team and (is_dreb(code1) or is_steal(code1)):
+            elif team != current_team and (is_dreb(f) or is_steal(f)):
                 end(i); current_team = pd.NA
                 start(team, i)
 
@@ -188,8 +170,10 @@ def label_possessions(df: pd.DataFrame) -> pd.DataFrame:
 
 # 使い方：
 # df はあなたのプレイバイプレイ DataFrame
-possession_df = label_possessions(df)
-possession_df.to_csv('/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/possession_df.csv')
+if __name__ == "__main__":
+    df = pd.read_csv("/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/koshigaya_all_opponent.csv")
+    possession_df = label_possessions(df)
+    possession_df.to_csv('/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/possession_df.csv')
 
 # 例：越谷の攻撃ポゼッションだけに絞る
 # KOSHI_ID = 745  # 必要に応じて置き換え
@@ -0,0 +1,165 @@
+# possession_incremental.py
+# ================================================
+# 差分（インクリメンタル）ポゼッション付与
+#   - 付与済みの試合IDごとに「PBP行の内容ハッシュ」をマニフェストに記録
+#   - 新規・内容が変わった試合だけを付与し、試合ごとのファイルとして保存庫へ書き込む
+#   - 変わっていない試合は再計算しないため、週次更新の処理量は差分の試合数に比例する
+#   - possession_id は試合ごとの採番なので、他の試合の追加・更新で値が変わることはない
+#
+# 保存庫のレイアウト：
+#   <STORE_DIR>/manifest.json          {"games": {"<試合ID>": {"hash": ..., "rows": ...}}}
+#   <STORE_DIR>/games/<試合ID>.csv      試合1つ分の付与結果（start/end row index は試合内の行番号）
+# ================================================
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from possession_ver2 import compact_dtypes, label_possessions_with_row_index
+from possession_parallel import ROW_INDEX_COLS, concat_labeled
+
+# ========= ユーザー設定 =========
+INPUT_CSV = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/koshigaya_all_opponent.csv"
+STORE_DIR = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/possession_store"
+OUTPUT_CSV = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/possession_df_ver2.csv"
+PRUNE = False   # True なら入力に無くなった試合を保存庫から削除
+# ===============================
+
+MANIFEST_NAME = "manifest.json"
+
+
+def _content_cols(df: pd.DataFrame) -> List[str]:
+    # CSV 保存時の行番号列（Unnamed: 0 等）は試合の追加で値がずれるためハッシュに含めない
+    return [c for c in df.columns if not str(c).startswith("Unnamed")]
+
+
+def _canonical(df: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
+    """
+    列型に依存しない形（各列 → 数値として読めれば float64 / 読めなければ文字列 の2列）。
+    欠損が1つ混じって int64 → float64 になった、文字が混じって object になった等で値が変わらないようにする。
+    """
+    out = {}
+    for i, c in enumerate(cols):
+        v = df[c]
+        num = pd.to_numeric(v, errors="coerce").astype("float64")
+        text = v.astype(str).where(num.isna() & v.notna(), "")
+        out[f"n{i}"] = num.to_numpy()
+        out[f"s{i}"] = text.to_numpy(dtype=object)
+    return pd.DataFrame(out, index=df.index)
+
+
+def game_hashes(df: pd.DataFrame) -> Dict[int, str]:
+    """
+    試合IDごとの内容ハッシュ（sha1）を返す。
+    行は (試合ID, ピリオド, 履歴No) の順に並べてからハッシュするので、ファイル内の行順には依存しない。
+    列名もハッシュに含めるため、列の追加・削除があれば全試合が「変更あり」になる。
+    値は列型に依存しない形（_canonical）でハッシュするので、他の試合の追加で列型が変わっても値は変わらない。
+    """
+    keys = [pd.to_numeric(df[c], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+            for c in ["試合ID", "ピリオド", "履歴No"]]
+    order = np.lexsort(keys[::-1])
+    gid = keys[0][order]
+    n_valid = int((~np.isnan(gid)).sum())
+    if n_valid == 0:
+        return {}
+
+    cols = _content_cols(df)
+    row_hash = pd.util.hash_pandas_object(_canonical(df, cols), index=False).to_numpy()[order]
+    header = "\x1f".join(map(str, cols)).encode("utf-8")
+
+    bounds = np.r_[np.flatnonzero(np.r_[True, gid[1:n_valid] != gid[:n_valid - 1]]), n_valid]
+    out: Dict[int, str] = {}
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        h = hashlib.sha1(header)
+        h.update(row_hash[lo:hi].tobytes())
+        out[int(gid[lo])] = h.hexdigest()
+    return out
+
+
+def _game_path(store_dir: str, gid: int) -> str:
+    return os.path.join(store_dir, "games", f"{gid}.csv")
+
+
+def load_manifest(store_dir: str) -> Dict[str, dict]:
+    path = os.path.join(store_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("games", {})
+
+
+def _save_manifest(store_dir: str, games: Dict[str, dict]) -> None:
+    path = os.path.join(store_dir, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"games": games}, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, path)  # 書き込み途中で落ちてもマニフェストが壊れないように差し替える
+
+
+def update_possession_store(df: pd.DataFrame, store_dir: str, prune: bool = False,
+                            **labeler_kwargs) -> Dict[str, List[int]]:
+    """
+    df のうち新規・変更ありの試合だけを付与し、保存庫に書き込む。
+      prune         ：True なら df に含まれない試合を保存庫から削除
+      labeler_kwargs：label_possessions_with_row_index に渡す（例：engine="array"）
+    戻り値：{"new": [...], "changed": [...], "unchanged": [...], "removed": [...]}（試合ID）
+    """
+    os.makedirs(os.path.join(store_dir, "games"), exist_ok=True)
+    manifest = load_manifest(store_dir)
+    hashes = game_hashes(df)
+
+    new = sorted(g for g in hashes if str(g) not in manifest)
+    changed = sorted(g for g in hashes if str(g) in manifest and manifest[str(g)]["hash"] != hashes[g])
+    unchanged = sorted(g for g in hashes if str(g) in manifest and manifest[str(g)]["hash"] == hashes[g])
+    removed = sorted(int(g) for g in manifest if int(g) not in hashes) if prune else []
+
+    todo = new + changed
+    if todo:
+        gid = pd.to_numeric(df["試合ID"], errors="coerce")
+        labeled = label_possessions_with_row_index(df[gid.isin(todo)], **labeler_kwargs)
+        # 付与結果はソート済みなので、試合ごとに連続した行になっている
+        for g, part in labeled.groupby("試合ID", sort=True):
+            base = part.index[0]
+            part = part.reset_index(drop=True)
+            for c in ROW_INDEX_COLS:
+                part[c] = part[c] - base  # 試合内の行番号へ
+            part.to_csv(_game_path(store_dir, int(g)), index=False, encoding="utf-8-sig")
+            manifest[str(int(g))] = {"hash": hashes[int(g)], "rows": len(part)}
+
+    for g in removed:
+        path = _game_path(store_dir, g)
+        if os.path.exists(path):
+            os.remove(path)
+        manifest.pop(str(g), None)
+
+    _save_manifest(store_dir, manifest)
+    return {"new": new, "changed": changed, "unchanged": unchanged, "removed": removed}
+
+
+def load_possession_store(store_dir: str, game_ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """
+    保存庫を読み込み、試合IDの昇順に結合して返す（全試合を一括付与した結果と同じ並び・行番号）。
+    game_ids を渡せばその試合だけを読む。
+    """
+    manifest = load_manifest(store_dir)
+    gids = sorted(int(g) for g in manifest)
+    if game_ids is not None:
+        want = {int(g) for g in game_ids}
+        gids = [g for g in gids if g in want]
+    if not gids:
+        return pd.DataFrame()
+
+    parts = [compact_dtypes(pd.read_csv(_game_path(store_dir, g), encoding="utf-8-sig")) for g in gids]
+    return compact_dtypes(concat_labeled(parts))
+
+
+if __name__ == "__main__":
+    df = pd.read_csv(INPUT_CSV)
+    summary = update_possession_store(df, STORE_DIR, prune=PRUNE)
+    print({k: len(v) for k, v in summary.items()})
+    if summary["new"] or summary["changed"] or summary["removed"]:
+        load_possession_store(STORE_DIR).to_csv(OUTPUT_CSV)
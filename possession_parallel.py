@@ -0,0 +1,116 @@
+# possession_parallel.py
+# ================================================
+# 試合単位でプレイバイプレイを分割し、ProcessPoolExecutor で並列にポゼッションを付与する
+#   - 各試合は独立（状態は試合をまたがない）なので、試合の塊（シャード）ごとに別プロセスで処理
+#   - シャードは試合IDの昇順で切り、結果も同じ順で結合するため、直列実行と全行一致する
+#   - ポゼッションIDは試合ごとの採番のまま（一意キーは (試合ID, possession_id)）。
+#     add_uid=True で全体通しの possession_uid（試合ID→ポゼIDの昇順で 0 始まり）も付与できる
+#
+# 注意：macOS / Windows（spawn 起動）では、呼び出し側スクリプトを
+#       if __name__ == "__main__": の中から実行すること
+# ================================================
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import possession
+import possession_ver2
+
+# ========= ユーザー設定 =========
+INPUT_CSV = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/koshigaya_all_opponent.csv"
+OUTPUT_CSV = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/possession_df_ver2.csv"
+MAX_WORKERS = None       # None なら CPU コア数
+GAMES_PER_CHUNK = 32     # 1シャードあたりの試合数
+# ===============================
+
+LABELERS = {
+    "ver2": possession_ver2.label_possessions_with_row_index,
+    "v1": possession.label_possessions,
+}
+
+ROW_INDEX_COLS = ["possession_start_row_index", "possession_end_row_index"]
+
+
+def split_by_games(df: pd.DataFrame, games_per_chunk: int) -> List[pd.DataFrame]:
+    """
+    df を試合IDの昇順に games_per_chunk 試合ずつのシャードへ分割する。
+    試合IDが欠損した行は（直列版と同じく末尾に来るよう）最後のシャードに含める。
+    """
+    if "試合ID" not in df.columns:
+        raise ValueError("必要列が見つかりません: ['試合ID']")
+    if games_per_chunk < 1:
+        raise ValueError(f"games_per_chunk は 1 以上を指定してください: {games_per_chunk}")
+
+    gid = pd.to_numeric(df["試合ID"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    order = np.argsort(gid, kind="stable")       # NaN は末尾、同一試合内は元の順序を保つ
+    g = gid[order]
+    n_valid = int((~np.isnan(g)).sum())
+    if n_valid == 0:
+        return [df]
+
+    game_starts = np.flatnonzero(np.r_[True, g[1:n_valid] != g[:n_valid - 1]])
+    cuts = np.r_[game_starts[::games_per_chunk], len(df)]
+    return [df.iloc[order[lo:hi]] for lo, hi in zip(cuts[:-1], cuts[1:])]
+
+
+def concat_labeled(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    試合順に並んだ付与済みシャードを結合する。
+    シャード内の行番号（start/end row index）を全体の行番号へずらし、行インデックスを 0..n-1 に振り直す。
+    """
+    offset = 0
+    for r in parts:
+        for c in ROW_INDEX_COLS:
+            if c in r.columns and offset:
+                r[c] = r[c] + offset  # 型（Int32 等）は保ったままずらす
+        offset += len(r)
+    return pd.concat(parts, ignore_index=True)
+
+
+def label_possessions_parallel(
+    df: pd.DataFrame,
+    labeler: str = "ver2",
+    max_workers: Optional[int] = None,
+    games_per_chunk: int = 32,
+    add_uid: bool = False,
+    **labeler_kwargs,
+) -> pd.DataFrame:
+    """
+    試合シャードを並列に処理してポゼッションを付与する。
+      labeler        ："ver2"（label_possessions_with_row_index） / "v1"（label_possessions）
+      max_workers    ：ワーカープロセス数（None なら CPU コア数、1 なら同一プロセスで直列実行）
+      games_per_chunk：1シャードあたりの試合数（小さいほど負荷が均等、大きいほど転送回数が少ない）
+      add_uid        ：True なら全体で一意な possession_uid 列を追加
+      labeler_kwargs ：labeler にそのまま渡す（例：engine="array"）
+    戻り値は直列版と同じ並び・同じ行インデックス（0..n-1）を持つ。
+    """
+    if labeler not in LABELERS:
+        raise ValueError(f"未知のlabelerです: {labeler}（{list(LABELERS)}）")
+    func: Callable[..., pd.DataFrame] = partial(LABELERS[labeler], **labeler_kwargs)
+
+    shards = split_by_games(df, games_per_chunk)
+    workers = max_workers or os.cpu_count() or 1
+    if workers == 1 or len(shards) == 1:
+        results = [func(s) for s in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as ex:
+            results = list(ex.map(func, shards))
+
+    out = concat_labeled(results)
+    if add_uid:
+        out["possession_uid"] = (out.groupby(["試合ID", "possession_id"], sort=True, dropna=True)
+                                    .ngroup().astype("Int64"))
+    return out
+
+
+if __name__ == "__main__":
+    df = pd.read_csv(INPUT_CSV)
+    possession_df = label_possessions_parallel(
+        df, labeler="ver2", max_workers=MAX_WORKERS, games_per_chunk=GAMES_PER_CHUNK
+    )
+    possession_df.to_csv(OUTPUT_CSV)
@@ -0,0 +1,147 @@
+# possession_stream.py
+# ================================================
+# メモリに載らない大きさのプレイバイプレイを、試合単位に揃えたチャンクで逐次ポゼッション付与する
+#   - 入力は (試合ID, ピリオド, 履歴No) 順に並んだCSV / Parquet をチャンク読み
+#   - チャンク末尾の「途中かもしれない試合」は次のチャンクへ持ち越すので、試合が分断されることはない
+#   - 状態は試合をまたがないため、チャンクごとに label_possessions_with_row_index を呼ぶだけでよい
+#   - 付与済みチャンクはすぐ書き出す（CSV 追記 / Parquet は一時ファイル）ので、メモリは
+#     「チャンク + 最大の1試合」分で一定
+#   - Parquet 出力は全チャンクの列型を揃えてから1ファイルにまとめる（チャンクごとに型推論がぶれても落ちない）
+#       全欠損 → 後で文字、整数 → 後で小数 などは pa.unify_schemas で広い型へ、数値と文字が混ざる列は文字列へ
+#   - 行インデックスと start/end row index は全体通しの行番号にずらすため、一括付与と同じ値になる
+#
+# 使い方：
+#   label_possessions_stream(INPUT_PATH, OUTPUT_PATH)            # 拡張子で CSV / Parquet を判定
+# ================================================
+
+import os
+import shutil
+import tempfile
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from data_store import unify_schemas
+from possession_ver2 import label_possessions_with_row_index
+from possession_parallel import ROW_INDEX_COLS
+
+# ========= ユーザー設定 =========
+INPUT_PATH = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/koshigaya_all_opponent.csv"
+OUTPUT_PATH = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/possession_df_ver2.csv"
+CHUNKSIZE = 200_000      # 1チャンクの行数（実際のチャンクは試合境界で前後する）
+ENGINE = "array"
+# ===============================
+
+
+def _is_parquet(path: str) -> bool:
+    return os.path.isdir(path) or path.endswith((".parquet", ".pq"))
+
+
+def read_pbp_chunks(path: str, chunksize: int = CHUNKSIZE, **read_kwargs) -> Iterator[pd.DataFrame]:
+    """CSV（chunksize 行ずつ）/ Parquet ファイル・ディレクトリ（バッチごと）を DataFrame のチャンクで返す。"""
+    if _is_parquet(path):
+        for batch in ds.dataset(path, format="parquet").to_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, **read_kwargs)
+
+
+def iter_game_chunks(chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    """
+    チャンク列を「試合の途中で切れない」チャンク列に組み直す。
+    入力は試合IDの昇順（試合IDが欠損した行は末尾）に並んでいること。並んでいなければ ValueError。
+    """
+    carry: Optional[pd.DataFrame] = None
+    last_gid = -np.inf
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+            carry = None
+        if chunk.empty:
+            continue
+        gid = pd.to_numeric(chunk["試合ID"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        nan = np.isnan(gid)
+        n_valid = len(gid) - int(nan.sum())
+        valid = gid[:n_valid]
+        if nan[:n_valid].any() or (np.diff(valid) < 0).any() or (n_valid and valid[0] < last_gid):
+            raise ValueError("入力が試合ID順に並んでいません（(試合ID, ピリオド, 履歴No) でソートしてください）")
+        if n_valid == 0:
+            carry = chunk   # 試合IDが欠損した末尾の行
+            continue
+
+        last_gid = valid[-1]
+        cut = int(np.searchsorted(valid, last_gid, side="left"))  # 末尾の試合（続きがありうる）の先頭
+        if cut > 0:
+            yield chunk.iloc[:cut]
+        carry = chunk.iloc[cut:]
+
+    if carry is not None and len(carry):
+        yield carry
+
+
+def iter_labeled_chunks(chunks: Iterable[pd.DataFrame], engine: str = ENGINE) -> Iterator[pd.DataFrame]:
+    """試合単位のチャンクを付与し、行インデックス・start/end row index を全体通しの行番号にずらして返す。"""
+    offset = 0
+    for part in iter_game_chunks(chunks):
+        out = label_possessions_with_row_index(part, engine=engine)
+        if offset:
+            out.index = out.index + offset
+            for c in ROW_INDEX_COLS:
+                out[c] = out[c] + offset
+        offset += len(out)
+        yield out
+
+
+def _write_parquet(tables: Iterable[pa.Table], output_path: str) -> int:
+    """
+    チャンクを一時ファイルへ書き、全チャンクの列型を揃えてから output_path に1ファイルで書き直す。
+    読み直しも1チャンクずつなので、メモリは1チャンク分のまま。
+    """
+    tmp_dir = tempfile.mkdtemp(prefix=".possession_stream_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        paths, schemas, n = [], [], 0
+        for i, table in enumerate(tables):
+            paths.append(os.path.join(tmp_dir, f"part-{i}.parquet"))
+            pq.write_table(table, paths[-1])
+            schemas.append(table.schema)
+            n += table.num_rows
+        if not paths:
+            return 0
+        schema = unify_schemas(schemas)
+        if all(s.remove_metadata().equals(schema) for s in schemas):
+            schema = schemas[0]   # 型が揃っていれば pandas のメタデータ（Int32 などの拡張型）を残す
+        with pq.ParquetWriter(output_path, schema) as writer:
+            for path in paths:
+                table = pq.read_table(path).select(schema.names)
+                writer.write_table(table.replace_schema_metadata(schema.metadata).cast(schema))
+        return n
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def label_possessions_stream(input_path: str, output_path: str, chunksize: int = CHUNKSIZE,
+                             engine: str = ENGINE, **read_kwargs) -> int:
+    """
+    input_path を試合単位のチャンクで付与し、output_path（.csv / .parquet）へ逐次書き出す。
+    Parquet 出力は全チャンクの列型を揃えてから書く（CSV をチャンク読みすると列型がチャンクごとに
+    変わりうるため。read_kwargs に dtype= を渡して型を固定してもよい）。
+    戻り値：書き出した行数
+    """
+    chunks = read_pbp_chunks(input_path, chunksize, **read_kwargs)
+    if _is_parquet(output_path):
+        return _write_parquet((pa.Table.from_pandas(out, preserve_index=False)
+                               for out in iter_labeled_chunks(chunks, engine)), output_path)
+    n = 0
+    for out in iter_labeled_chunks(chunks, engine):
+        out.to_csv(output_path, mode="a" if n else "w", header=not n)
+        n += len(out)
+    return n
+
+
+if __name__ == "__main__":
+    n = label_possessions_stream(INPUT_PATH, OUTPUT_PATH)
+    print(f"✅ {n} 行を書き出しました: {OUTPUT_PATH}")
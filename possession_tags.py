@@ -0,0 +1,66 @@
+# possession_tags.py
+# ================================================
+# ポゼッション単位のタグ集計（速攻・セカンドチャンス・ファウル等）
+#   - タグ名 → アクションコード集合 の対応を1つのビット表（action_codes.bit_table）にまとめ、
+#     A1〜A3 を1回ずつ引いて行ごとのタグビットを作る
+#   - ポゼッションへの集約は bincount だけで行う（groupby.apply・ポゼごとの np.isin は使わない）
+#   - タグを増やしても、表引きの回数は A1〜A3 の3回のまま
+#
+# 使い方：
+#   tags = tag_possessions(x)                               # is_fastbreak, is_second_chance, ...
+#   tags = tag_possessions(x, {"paint": {...}}, counts=True) # n_paint（該当行数）も付ける
+# ================================================
+
+from typing import Dict, Sequence, Set
+
+import numpy as np
+import pandas as pd
+
+import action_codes as ac
+
+# タグ名 → アクションコード集合（マスタに合わせて追加）
+POSSESSION_TAGS: Dict[str, Set[int]] = {
+    "fastbreak": {35},        # 速攻
+    "second_chance": {37},    # セカンドチャンス
+    "foul": ac.FOUL,          # ポゼ中のファウル
+}
+
+KEY_COLS = ["試合ID", "possession_id"]
+
+
+def tag_possessions(x: pd.DataFrame, tags: Dict[str, Set[int]] = POSSESSION_TAGS,
+                    counts: bool = False, cols: Sequence[str] = ac.ACTION_COLS) -> pd.DataFrame:
+    """
+    (試合ID, possession_id) ごとに、tags の各タグが A1〜A3 のどこかに現れたかを集計する。
+    戻り値：試合ID・possession_id の昇順に1ポゼ1行
+      is_<タグ名>：1行でも該当すれば True
+      n_<タグ名> ：該当した行数（counts=True のとき）
+    possession_id が欠損した行（ポゼ外）は集計しない。
+    """
+    miss = [c for c in KEY_COLS if c not in x.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    if len(tags) > 63:
+        raise ValueError(f"タグは 63 個までです: {len(tags)}")
+
+    names = list(tags)
+    table = ac.bit_table([tags[k] for k in names])
+
+    gid = pd.to_numeric(x["試合ID"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    pid = pd.to_numeric(x["possession_id"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    ok = ~(np.isnan(gid) | np.isnan(pid))
+    keys, inv = np.unique(np.c_[gid[ok], pid[ok]], axis=0, return_inverse=True)
+    inv = inv.ravel()
+
+    bits = np.zeros(int(ok.sum()), dtype=np.int64)
+    for c in cols:
+        if c in x.columns:
+            bits |= ac.lookup(table, x[c])[ok]
+
+    out = pd.DataFrame({"試合ID": keys[:, 0].astype(np.int64), "possession_id": keys[:, 1].astype(np.int64)})
+    for k, name in enumerate(names):
+        n_hit = np.bincount(inv[(bits >> k) & 1 == 1], minlength=len(keys))
+        out[f"is_{name}"] = n_hit > 0
+        if counts:
+            out[f"n_{name}"] = n_hit
+    return out
@@ -1,9 +1,88 @@
+import numpy as np
 import pandas as pd
-from typing import Optional, Dict, Set
+from typing import Optional, Dict, Set, Tuple
+
+try:
+    from numba import njit
+except ImportError:  # numba が無い環境では純Pythonループで回す
+    njit = None
+
+import action_codes as ac
+# アクション集合・行フラグは action_codes に集約
+from action_codes import (
+    MADE_FG, MISSED_FG, OREB, DREB, FT, STEAL, TO_LIKE, NEUTRAL, NEUTRAL_CAN_START,
+    F_NEUTRAL, F_CAN_START, F_FT, F_MADE, F_MISS, F_OREB, F_DREB, F_STEAL, F_TOLIKE,
+)
+from game_clock import CLOCK_COL, parse_clock
+
+# ========= ユーザー設定 =========
+INPUT_CSV = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/koshigaya_all_opponent.csv"
+OUTPUT_CSV = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/possession_df_ver2.csv"
+OUTPUT_TABLE_CSV = "/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/possession_table_ver2.csv"  # 1ポゼ1行
+ENGINE = "array"        # "array"（配列エンジン） / "python"（従来の行ループ）
+USE_NUMBA = True        # 配列エンジンで numba が import できればコンパイル済みカーネルを使う
+CHECK_PARITY = False    # True で両エンジンの全行一致を確認してから保存
+# ===============================
+
+NEED_COLS = ["試合ID","ピリオド","履歴No","チームID","アクション1","アクション2","アクション3"]
+POSSESSION_COLS = ["possession_id","possession_team","possession_start_row_index","possession_end_row_index",
+                   "possession_end_reason"]
+
+# ポゼッションの終了理由（possession_end_reason の値）
+END_MADE, END_TURNOVER, END_DREB, END_STEAL, END_CHANGE, END_GAME = 1, 2, 3, 4, 5, 6
+END_REASONS = {
+    END_MADE: "made",          # FG成功
+    END_TURNOVER: "turnover",  # TO・オフェンスファウル・ショットクロック等
+    END_DREB: "dreb",          # 相手のディフェンスリバウンド
+    END_STEAL: "steal",        # 相手のスティール
+    END_CHANGE: "change",      # 相手の攻撃行為による交代（ミス・FT後など）
+    END_GAME: "game_end",      # 試合末尾で未クローズ
+}
+
+# 出力列の型（幅の狭い nullable 整数。groupby・保存・読み戻しで同じ型を使う）
+COMPACT_DTYPES = {
+    "試合ID": "Int32", "ピリオド": "Int8", "履歴No": "Int32", "チームID": "Int32",
+    "アクション1": "Int16", "アクション2": "Int16", "アクション3": "Int16",
+    "possession_id": "Int16", "possession_team": "Int32",
+    "possession_start_row_index": "Int32", "possession_end_row_index": "Int32",
+    "possession_end_reason": "Int8",
+}
+
+
+def compact_dtypes(df: pd.DataFrame, dtypes: Dict[str, str] = COMPACT_DTYPES) -> pd.DataFrame:
+    """
+    dtypes にある列を幅の狭い nullable 整数へ変換する（df をそのまま書き換えて返す）。
+    整数でない値・型の範囲を超える値を含む列は、情報を落とさないよう元の型のまま残す。
+    """
+    for c, dt in dtypes.items():
+        if c in df.columns:
+            try:
+                df[c] = df[c].astype(dt)
+            except (TypeError, ValueError, OverflowError):
+                pass
+    return df
+
+
+def read_possession_csv(path: str, **kwargs) -> pd.DataFrame:
+    """付与済みCSVを読み、COMPACT_DTYPES の型に揃えて返す。"""
+    return compact_dtypes(pd.read_csv(path, **kwargs))
+
+
+def _prepare_pbp(df: pd.DataFrame) -> pd.DataFrame:
+    """入力検査・数値化・ソート（処理順は試合ID・ピリオド・履歴Noの昇順）。両エンジン共通。"""
+    miss = [c for c in NEED_COLS if c not in df.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+
+    x = df.copy()
+    for c in NEED_COLS:
+        # 数値化（文字が混じっても NaN にして落とさない）
+        x[c] = pd.to_numeric(x[c], errors="coerce")
+
+    return x.sort_values(["試合ID","ピリオド","履歴No"], ascending=True).reset_index(drop=True)
 
-df = pd.read_csv("/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/koshigaya_all_opponent.csv")
 
-def label_possessions_with_row_index(df: pd.DataFrame) -> pd.DataFrame:
+def label_possessions_with_row_index(df: pd.DataFrame, engine: str = "array") -> pd.DataFrame:
     """
     プレイバイプレイに「ポゼッションID」「開始行」「終了行」を付与する。
     重要な仕様：
@@ -15,50 +94,32 @@ def label_possessions_with_row_index(df: pd.DataFrame) -> pd.DataFrame:
         * team付きの中立 → そのteamで開始
         * team無しの中立 → 直前に閉じたチームの“相手チーム”で開始（試合内2チームが取得できる場合）
       - A1/A2/A3 のいずれかに該当すればイベント成立と判定
+      - possession_id は試合ごとに 1 から採番（試合をまたぐ一意キーは (試合ID, possession_id)）
+
+    engine：
+      - "array"  ：A1〜A3 を一度だけビットフラグ配列に分類し、連続配列上で状態遷移を回す（既定）
+                   numba が使えれば全試合を JIT コンパイル済みカーネル1回の呼び出しで処理する
+      - "python" ：従来の行ごとのステートマシン（参照実装。compare_possession_engines で突き合わせ可）
 
     付与列：
-      - possession_id（Int64）：行が属するポゼID（ポゼ外はNA）
-      - possession_team（Int64）：当該ポゼのチームID（ポゼ外はNA）
-      - possession_start_row_index（Int64）：そのポゼの開始行インデックス
-      - possession_end_row_index（Int64）：そのポゼの終了行インデックス
+      - possession_id（Int16）：行が属するポゼID（ポゼ外はNA）
+      - possession_team（Int32）：当該ポゼのチームID（ポゼ外はNA）
+      - possession_start_row_index（Int32）：そのポゼの開始行インデックス
+      - possession_end_row_index（Int32）：そのポゼの終了行インデックス
+      - possession_end_reason（Int8）：そのポゼの終了理由（END_REASONS のコード）
+    1ポゼッション1行の表は possession_table(結果) で取り出せる。
+    入力の試合ID・ピリオド・履歴No・チームID・アクション列も COMPACT_DTYPES の型へ詰めて返す。
     """
+    x = _prepare_pbp(df)
+    if engine == "array":
+        return compact_dtypes(_label_possessions_array(x))
+    if engine == "python":
+        return compact_dtypes(_label_possessions_python(x))
+    raise ValueError(f"未知のengineです: {engine}（'array' / 'python'）")
 
-    # ---- 入力検査 & ソート（処理順は試合ID・ピリオド・履歴Noの昇順）----
-    need = ["試合ID","ピリオド","履歴No","チームID","アクション1","アクション2","アクション3"]
-    miss = [c for c in need if c not in df.columns]
-    if miss:
-        raise ValueError(f"必要列が見つかりません: {miss}")
-
-    x = df.copy()
-    for c in need:
-        # 数値化（文字が混じっても NaN にして落とさない）
-        x[c] = pd.to_numeric(x[c], errors="coerce")
 
-    x = x.sort_values(["試合ID","ピリオド","履歴No"], ascending=True).reset_index(drop=True)
-
-    # ---- アクション集合（マスタに合わせて調整）----
-    MADE_FG: Set[int]     = {1, 3, 4, 44}
-    MISSED_FG: Set[int]   = {2, 5, 6, 45}
-    OREB: Set[int]        = {10, 18}
-    DREB: Set[int]        = {9, 19}
-    FT: Set[int]          = {7, 8}
-    STEAL: Set[int]       = {14}
-
-    OFF_FOUL_MAIN: Set[int]  = {23}
-    TURNOVER_MAIN: Set[int]  = {13, 17}
-    TURNOVER_KINDS: Set[int] = {147,148,149,150,151,152,153,154,155,156,157,158,159,160,161,163}
-    SHOT_CLOCK: Set[int]     = {34, 156}  # 156 はTO詳細にも重複しうる
-
-    # 中立イベント（clock,交代,TO,レビュー等）
-    NEUTRAL: Set[int] = {
-        80,81,82,83,84,85,86,87,88,89,     # 試合/ピリオド開始・終了/clock/交代
-        90,107,108,109,110,111,            # オフィシャル、ジャンプボール関連など
-        133,134,135,136,137,138,           # 管理用
-        139,140,141,142,143,144,           # タイムアウト/レビュー/メディア等
-        116,117,118,112,113,114,115        # OOB/スローイン等（再開系）
-    }
-    # 中立だが「ポゼ開始に使ってよい（再開系）」コード
-    NEUTRAL_CAN_START: Set[int] = {112,113,114,115,116,117,118}
+def _label_possessions_python(x: pd.DataFrame) -> pd.DataFrame:
+    """従来の行ループ版。x は _prepare_pbp 済みであること。"""
 
     # ---- 判定ユーティリティ（A1/A2/A3のどれか一致で True）----
     def any_in(codes: Set[int], a1, a2, a3) -> bool:
@@ -81,17 +142,19 @@ def label_possessions_with_row_index(df: pd.DataFrame) -> pd.DataFrame:
     def is_oreb(a1,a2,a3):   return any_in(OREB,a1,a2,a3)
     def is_dreb(a1,a2,a3):   return any_in(DREB,a1,a2,a3)
     def is_steal(a1,a2,a3):  return any_in(STEAL,a1,a2,a3)
-    def is_tolike(a1,a2,a3): return any_in(TURNOVER_MAIN.union(TURNOVER_KINDS, SHOT_CLOCK, OFF_FOUL_MAIN), a1,a2,a3)
+    def is_tolike(a1,a2,a3): return any_in(TO_LIKE,a1,a2,a3)
 
     # ---- 出力列（行単位の所属のみ塗る：ポゼ外はNAのまま）----
     x["possession_id"] = pd.NA
     x["possession_team"] = pd.NA
     x["possession_start_row_index"] = pd.NA
     x["possession_end_row_index"] = pd.NA
+    x["possession_end_reason"] = pd.NA
 
-    # ポゼID→開始/終了インデックス
-    poss_start: Dict[int, int] = {}
-    poss_end: Dict[int, int]   = {}
+    # (試合ID, ポゼID)→開始/終了インデックス（ポゼIDは試合ごとに採番されるため試合IDも鍵に含める）
+    poss_start: Dict[Tuple[int, int], int] = {}
+    poss_end: Dict[Tuple[int, int], int]   = {}
+    poss_reason: Dict[Tuple[int, int], int] = {}
 
     # ---- 試合ごとに走査 ----
     for gid, sub_idx in x.groupby("試合ID").groups.items():
@@ -123,7 +186,7 @@ def label_possessions_with_row_index(df: pd.DataFrame) -> pd.DataFrame:
             in_ft_seq   = False
             pending_open = False
             prev_team_at_close = None
-            poss_start[poss_id] = row_i
+            poss_start[(gid, poss_id)] = row_i
             x.loc[row_i, "possession_id"] = poss_id
             x.loc[row_i, "possession_team"] = current_team
 
@@ -132,10 +195,11 @@ def label_possessions_with_row_index(df: pd.DataFrame) -> pd.DataFrame:
             x.loc[row_i, "possession_id"] = poss_id
             x.loc[row_i, "possession_team"] = current_team
 
-        def close_current_at(row_i: int) -> None:
+        def close_current_at(row_i: int, reason: int) -> None:
             """現ポゼを row_i で終了（行の所属は塗り替えない）。"""
             nonlocal current_team, pending_open, prev_team_at_close
-            poss_end[poss_id] = row_i
+            poss_end[(gid, poss_id)] = row_i
+            poss_reason[(gid, poss_id)] = reason
             prev_team_at_close = current_team
             current_team = None
             pending_open = True  # 以降、相手側の行（中立でも）で開ける
@@ -186,7 +250,7 @@ def label_possessions_with_row_index(df: pd.DataFrame) -> pd.DataFrame:
                     waiting_reb = False  # 自軍OREB → 継続
                 elif team != current_team and (is_dreb(a1,a2,a3) or is_steal(a1,a2,a3)):
                     # 交代（同行で end & start 両立）
-                    close_current_at(i)
+                    close_current_at(i, END_DREB if is_dreb(a1,a2,a3) else END_STEAL)
                     open_possession(team, i)
                     waiting_reb = False
                     in_ft_seq   = False
@@ -195,7 +259,7 @@ def label_possessions_with_row_index(df: pd.DataFrame) -> pd.DataFrame:
                     pass
                 elif team != current_team:
                     # 相手の攻撃行為（保持を示唆）→ 交代（同行end/start）
-                    close_current_at(i)
+                    close_current_at(i, END_CHANGE)
                     open_possession(team, i)
                     waiting_reb = False
                     in_ft_seq   = False
@@ -214,13 +278,13 @@ def label_possessions_with_row_index(df: pd.DataFrame) -> pd.DataFrame:
                     if team == current_team and is_oreb(a1,a2,a3):
                         in_ft_seq = False  # 自軍OREB → 継続
                     elif team != current_team and (is_dreb(a1,a2,a3) or is_steal(a1,a2,a3)):
-                        close_current_at(i)
+                        close_current_at(i, END_DREB if is_dreb(a1,a2,a3) else END_STEAL)
                         open_possession(team, i)
                         in_ft_seq = False
                     elif is_neutral(a1,a2,a3):
                         pass
                     elif team != current_team:
-                        close_current_at(i)
+                        close_current_at(i, END_CHANGE)
                         open_possession(team, i)
                         in_ft_seq = False
                     else:
@@ -230,16 +294,16 @@ def label_possessions_with_row_index(df: pd.DataFrame) -> pd.DataFrame:
             # 3c) 通常状態
             if team == current_team and is_made(a1,a2,a3):
                 # FG成功はポゼ終了。and-one のFTは次行以降の“無所属区間”で処理される
-                close_current_at(i)
+                close_current_at(i, END_MADE)
             elif team == current_team and is_tolike(a1,a2,a3):
-                close_current_at(i)
+                close_current_at(i, END_TURNOVER)
             elif team == current_team and is_miss(a1,a2,a3):
                 waiting_reb = True
             elif team == current_team and is_ft(a1,a2,a3):
                 in_ft_seq = True
             elif team != current_team and (is_dreb(a1,a2,a3) or is_steal(a1,a2,a3)):
                 # 相手が明確に獲得 → 同行 end/start
-                close_current_at(i)
+                close_current_at(i, END_DREB if is_dreb(a1,a2,a3) else END_STEAL)
                 open_possession(team, i)
             else:
                 # 中立・その他 → 継続
@@ -247,13 +311,18 @@ def label_possessions_with_row_index(df: pd.DataFrame) -> pd.DataFrame:
 
         # 4) 試合末尾：未クローズが残っていれば、その試合の最後の行で閉じる
         if current_team is not None:
-            poss_end[poss_id] = idxs[-1]
+            poss_end[(gid, poss_id)] = idxs[-1]
+            poss_reason[(gid, poss_id)] = END_GAME
 
     # ---- possessionごとの start/end を各行へブロードキャスト ----
     # （possession_id が付いた行にのみ付与。ポゼ外行のNAはそのまま残す）
-    pid = x["possession_id"].astype("Int64")
-    x["possession_start_row_index"] = pid.map({k:int(v) for k,v in poss_start.items()})
-    x["possession_end_row_index"]   = pid.map({k:int(v) for k,v in poss_end.items()})
+    keys = pd.MultiIndex.from_arrays([x["試合ID"], x["possession_id"].astype("Int64")])
+    x["possession_start_row_index"] = pd.array(
+        [poss_start.get(k, pd.NA) for k in keys], dtype="Int64")
+    x["possession_end_row_index"] = pd.array(
+        [poss_end.get(k, pd.NA) for k in keys], dtype="Int64")
+    x["possession_end_reason"] = pd.array(
+        [poss_reason.get(k, pd.NA) for k in keys], dtype="Int64")
 
     # 注意：ここでは ffill を行わない。
     #  ポゼ外（終了〜開始の間）の行を NA のまま残すことで、
@@ -262,5 +331,300 @@ def label_possessions_with_row_index(df: pd.DataFrame) -> pd.DataFrame:
 
     return x
 
-possession_df = label_possessions_with_row_index(df)
-possession_df.to_csv('/Users/nakamurawataru/Documents/学校/研究室/SDSC/analysis/possession_df_ver2.csv')
+
+# ================================================
+# 配列エンジン
+#   A1〜A3 を一度だけビットフラグへ分類し、
+#   (試合区間, チーム, フラグ) の連続配列上で状態遷移を回す
+# ================================================
+
+NO_TEAM = -1  # チームID 欠損の番兵
+
+
+def _classify_actions(x: pd.DataFrame) -> np.ndarray:
+    """A1〜A3 を一括でビットフラグ配列（int32）へ変換する（全NAの行は中立扱い）。"""
+    flags = ac.row_flags(x)
+    flags[ac.all_missing(x)] |= F_NEUTRAL
+    return flags
+
+
+def _possession_kernel(bounds, team, flags, row_poss, poss_local, poss_team, poss_start, poss_end, poss_reason):
+    """
+    状態遷移の本体。行ループ版と同じ遷移を、添字アクセスだけで書いたもの。
+      bounds：試合区間の境界（長さ 試合数+1）
+      team  ：行のチームID（欠損は NO_TEAM）
+      flags ：行のビットフラグ
+    出力（事前確保済み）：
+      row_poss   ：行が属するポゼの通し番号（ポゼ外は -1）
+      poss_local ：通し番号 → 試合内ポゼID
+      poss_team / poss_start / poss_end / poss_reason：通し番号 → チーム / 開始行 / 終了行 / 終了理由
+    戻り値：ポゼッション総数
+    """
+    n_poss = 0
+    for g in range(len(bounds) - 1):
+        lo = bounds[g]
+        hi = bounds[g + 1]
+
+        # 試合に出現する最初の2チーム（相手チーム導出用）
+        t0 = NO_TEAM
+        t1 = NO_TEAM
+        for i in range(lo, hi):
+            t = team[i]
+            if t == NO_TEAM:
+                continue
+            if t0 == NO_TEAM:
+                t0 = t
+            elif t != t0:
+                t1 = t
+                break
+
+        # 状態
+        cur = NO_TEAM
+        cur_poss = -1
+        local_id = 0
+        waiting_reb = False
+        in_ft_seq = False
+        pending_open = False
+        prev_close = NO_TEAM
+
+        for i in range(lo, hi):
+            f = flags[i]
+            t = team[i]
+            do_open = False
+            do_close = False
+            open_team = NO_TEAM
+            reason = 0
+
+            # 1) 終了直後の“開始待ち”
+            if cur == NO_TEAM and pending_open:
+                if t != NO_TEAM and (prev_close == NO_TEAM or t != prev_close):
+                    do_open = True
+                    open_team = t
+                elif t == NO_TEAM and (f & F_CAN_START):
+                    if t1 != NO_TEAM and prev_close == t0:
+                        do_open = True
+                        open_team = t1
+                    elif t1 != NO_TEAM and prev_close == t1:
+                        do_open = True
+                        open_team = t0
+
+            if not do_open:
+                if cur == NO_TEAM:
+                    # 2) まだ誰のポゼでもない通常時
+                    if t != NO_TEAM and (f & (F_DREB | F_STEAL)):
+                        do_open = True
+                        open_team = t
+                    elif t != NO_TEAM and (f & F_CAN_START):
+                        do_open = True
+                        open_team = t
+                else:
+                    # 3) 現ポゼあり：まず行を現ポゼで塗る
+                    row_poss[i] = cur_poss
+                    if waiting_reb:
+                        if t == cur and (f & F_OREB):
+                            waiting_reb = False
+                        elif t != cur and (f & (F_DREB | F_STEAL)):
+                            do_close = True
+                            do_open = True
+                            reason = END_DREB if f & F_DREB else END_STEAL
+                        elif f & F_NEUTRAL:
+                            pass
+                        elif t != cur:
+                            do_close = True
+                            do_open = True
+                            reason = END_CHANGE
+                        else:
+                            waiting_reb = False
+                    elif in_ft_seq:
+                        if t == cur and (f & F_FT):
+                            pass
+                        elif t == cur and (f & F_OREB):
+                            in_ft_seq = False
+                        elif t != cur and (f & (F_DREB | F_STEAL)):
+                            do_close = True
+                            do_open = True
+                            reason = END_DREB if f & F_DREB else END_STEAL
+                        elif f & F_NEUTRAL:
+                            pass
+                        elif t != cur:
+                            do_close = True
+                            do_open = True
+                            reason = END_CHANGE
+                        else:
+                            in_ft_seq = False
+                    else:
+                        if t == cur and (f & F_MADE):
+                            do_close = True
+                            reason = END_MADE
+                        elif t == cur and (f & F_TOLIKE):
+                            do_close = True
+                            reason = END_TURNOVER
+                        elif t == cur and (f & F_MISS):
+                            waiting_reb = True
+                        elif t == cur and (f & F_FT):
+                            in_ft_seq = True
+                        elif t != cur and (f & (F_DREB | F_STEAL)):
+                            do_close = True
+                            do_open = True
+                            reason = END_DREB if f & F_DREB else END_STEAL
+                    open_team = t
+
+            if do_close:
+                poss_end[cur_poss] = i
+                poss_reason[cur_poss] = reason
+                prev_close = cur
+                cur = NO_TEAM
+                pending_open = True
+
+            if do_open:
+                if open_team == NO_TEAM:
+                    raise ValueError("チームIDが欠損した行でポゼッションを開始しようとしました")
+                local_id += 1
+                cur = open_team
+                cur_poss = n_poss
+                n_poss += 1
+                waiting_reb = False
+                in_ft_seq = False
+                pending_open = False
+                prev_close = NO_TEAM
+                poss_local[cur_poss] = local_id
+                poss_team[cur_poss] = cur
+                poss_start[cur_poss] = i
+                row_poss[i] = cur_poss
+
+        # 4) 試合末尾：未クローズが残っていれば、その試合の最後の行で閉じる
+        if cur != NO_TEAM:
+            poss_end[cur_poss] = hi - 1
+            poss_reason[cur_poss] = END_GAME
+
+    return n_poss
+
+
+# numba があればカーネルをコンパイル（初回呼び出し時にコンパイルし、ディスクにキャッシュ）
+_possession_kernel_jit = njit(cache=True)(_possession_kernel) if njit is not None else None
+
+
+def _run_possession_kernel(bounds: np.ndarray, team: np.ndarray, flags: np.ndarray):
+    """
+    カーネルを実行し (row_poss, poss_local, poss_team, poss_start, poss_end, poss_reason) を返す（いずれも int32）。
+    USE_NUMBA かつ numba があればコンパイル版、無ければ同じカーネルを純Pythonで回す。
+    """
+    n = len(team)
+    if USE_NUMBA and _possession_kernel_jit is not None:
+        row_poss = np.full(n, -1, dtype=np.int32)
+        poss = [np.zeros(n, dtype=np.int32) for _ in range(5)]
+        _possession_kernel_jit(bounds, team, flags, row_poss, *poss)
+        return (row_poss, *poss)
+
+    # 純Pythonで回す場合は list の方が添字アクセスが速い
+    row_poss_l = [-1] * n
+    poss_l = [[0] * n for _ in range(5)]
+    _possession_kernel(bounds.tolist(), team.tolist(), flags.tolist(), row_poss_l, *poss_l)
+    return (np.asarray(row_poss_l, dtype=np.int32),
+            *(np.asarray(a, dtype=np.int32) for a in poss_l))
+
+
+def _game_bounds(x: pd.DataFrame) -> np.ndarray:
+    """ソート済み x の試合区間境界。試合ID が NA の行（末尾）は対象外。"""
+    gid = x["試合ID"].to_numpy(dtype="float64", na_value=np.nan)
+    n_valid = int((~np.isnan(gid)).sum())
+    if n_valid == 0:
+        return np.zeros(1, dtype=np.int64)
+    g = gid[:n_valid]
+    starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+    return np.r_[starts, n_valid].astype(np.int64)
+
+
+def _masked_int(values: np.ndarray, valid: np.ndarray, dtype=np.int32) -> pd.arrays.IntegerArray:
+    return pd.arrays.IntegerArray(np.where(valid, values, 0).astype(dtype), ~valid)
+
+
+def _label_possessions_array(x: pd.DataFrame) -> pd.DataFrame:
+    """配列エンジン版。x は _prepare_pbp 済みであること。"""
+    flags = _classify_actions(x)
+    team = x["チームID"].to_numpy(dtype="float64", na_value=np.nan)
+    team = np.where(np.isnan(team), NO_TEAM, team).astype(np.int64)
+    bounds = _game_bounds(x)
+
+    row_poss, poss_local, poss_team, poss_start, poss_end, poss_reason = _run_possession_kernel(bounds, team, flags)
+
+    has = row_poss >= 0
+    ref = np.where(has, row_poss, 0)
+    x["possession_id"] = _masked_int(poss_local[ref], has, np.int16)
+    x["possession_team"] = _masked_int(poss_team[ref], has)
+    x["possession_start_row_index"] = _masked_int(poss_start[ref], has)
+    x["possession_end_row_index"] = _masked_int(poss_end[ref], has)
+    x["possession_end_reason"] = _masked_int(poss_reason[ref], has, np.int8)
+    return x
+
+
+POSSESSION_TABLE_COLS = ["試合ID", "possession_id", "possession_team", "start_row", "end_row",
+                         "ピリオド", "clock_start", "end_reason"]
+
+
+def possession_table(x: pd.DataFrame, clock_col: Optional[str] = CLOCK_COL) -> pd.DataFrame:
+    """
+    付与済みの x（label_possessions_with_row_index の戻り値そのまま：行インデックス 0..n-1）から
+    1ポゼッション1行の表を取り出す。groupby はせず、開始行（行番号＝start_row の行）を拾うだけ。
+      start_row / end_row：x の行番号。ポゼの全イベントは x.iloc[start_row:end_row + 1]（possession_events）
+                           ※ 交代が同じ行で起きた場合、end_row はそのまま次ポゼの start_row でもある
+      ピリオド / clock_start：開始行のピリオドと clock_col の残り秒（game_clock.parse_clock。clock_col が無ければ NaN）
+      end_reason：END_REASONS の名前（"made" / "turnover" / ...）
+    """
+    miss = [c for c in ["試合ID", "ピリオド"] + POSSESSION_COLS if c not in x.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+
+    start = x["possession_start_row_index"].to_numpy(dtype="float64", na_value=np.nan)
+    is_start = start == np.arange(len(x))
+    s = x.loc[is_start]
+    reason = s["possession_end_reason"].astype("Int64")
+    return pd.DataFrame({
+        "試合ID": s["試合ID"].to_numpy(),
+        "possession_id": s["possession_id"].to_numpy(),
+        "possession_team": s["possession_team"].to_numpy(),
+        "start_row": s["possession_start_row_index"].to_numpy(),
+        "end_row": s["possession_end_row_index"].to_numpy(),
+        "ピリオド": s["ピリオド"].to_numpy(),
+        "clock_start": parse_clock(s[clock_col]) if clock_col in x.columns else np.nan,
+        "end_reason": pd.Categorical(reason.map(END_REASONS).to_numpy(dtype=object),
+                                     categories=list(END_REASONS.values())),
+    }, columns=POSSESSION_TABLE_COLS)
+
+
+def possession_events(x: pd.DataFrame, poss: pd.Series) -> pd.DataFrame:
+    """possession_table の1行 poss に対応するイベント行を x から行範囲で切り出す（O(1)）。"""
+    return x.iloc[int(poss["start_row"]):int(poss["end_row"]) + 1]
+
+
+def compare_possession_engines(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    "python" と "array" の両エンジンで付与し、POSSESSION_COLS の5列（終了理由を含む）を全行突き合わせる。
+    戻り値：不一致行（両エンジンの値を _python / _array の接尾辞で併記）。空なら全行一致。
+    """
+    ref = label_possessions_with_row_index(df, engine="python")
+    new = label_possessions_with_row_index(df, engine="array")
+    a = ref[POSSESSION_COLS].astype("Int64")
+    b = new[POSSESSION_COLS].astype("Int64")
+    same = (a == b).fillna(False) | (a.isna() & b.isna())
+    bad = ~same.all(axis=1)
+    return (ref.loc[bad, NEED_COLS]
+               .join(a[bad].add_suffix("_python"))
+               .join(b[bad].add_suffix("_array")))
+
+
+if __name__ == "__main__":
+    df = pd.read_csv(INPUT_CSV)
+    if CHECK_PARITY:
+        diff = compare_possession_engines(df)
+        if len(diff):
+            print(diff.head(20))
+            raise SystemExit(f"エンジン間で {len(diff)} 行が不一致です")
+        print("✅ 両エンジンの出力は全行一致しました")
+    possession_df = label_possessions_with_row_index(df, engine=ENGINE)
+    if OUTPUT_CSV.endswith(".parquet"):
+        possession_df.to_parquet(OUTPUT_CSV)   # 列型（Int16/Int32 等）をそのまま保存
+    else:
+        possession_df.to_csv(OUTPUT_CSV)       # 読み戻しは read_possession_csv で型を復元
+    if OUTPUT_TABLE_CSV:
+        possession_table(possession_df).to_csv(OUTPUT_TABLE_CSV, index=False)
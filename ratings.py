@@ -0,0 +1,170 @@
+# ratings.py
+# ================================================
+# 相手の強さを調整したチーム・選手のレーティング（RAPM 型のリッジ回帰を疎行列で解く）
+#   - 1ポゼッション = 1行。目的変数はそのポゼの得点 × 100（100ポゼあたり）
+#   - 説明変数：攻撃側の指示変数（+1）と守備側の指示変数（+1）を別ブロックに並べた scipy.sparse 行列
+#       チーム：攻撃チーム・守備チームの2列だけが 1
+#       選手  ：lineups.build_stints のスティントにポゼを割り当て、攻撃5人・守備5人が 1
+#               （ポゼ×スティント の指示行列 @ スティント×選手 の指示行列 で作る。密行列にはしない）
+#   - 解法：中心化した目的変数に対して scipy.sparse.linalg.lsqr（damp = √alpha がリッジ罰則）
+#     → 行数が数十万でも X の非ゼロ要素数に比例した反復計算だけで解ける
+#   - 攻撃レーティング = 平均 + 攻撃係数、守備レーティング = 平均 + 守備係数（小さいほど良い守備）、
+#     ネット = 攻撃係数 − 守備係数
+#
+# 使い方：
+#   lab = label_possessions_with_row_index(df)                 # possession_ver2
+#   poss = possession_outcomes(lab, possession_table(lab))
+#   team_ratings(poss)                                          # 全チーム（by_season=True ならシーズン別）
+#   player_ratings(poss, build_stints(lab))                     # 選手（交代コードは lineups.py の設定）
+# ================================================
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+import action_codes as ac
+from running_score import running_scores
+
+# ========= ユーザー設定 =========
+TEAM_ALPHA = 100.0       # チームのリッジ罰則（係数の2乗和にかかる重み。ポゼ数に対して相対的）
+PLAYER_ALPHA = 3000.0    # 選手のリッジ罰則（RAPM では数千が目安）
+MIN_POSS = 0             # これ未満のポゼッション数の選手は結果から除く（推定には含める）
+ITER_LIMIT = None        # lsqr の最大反復回数（None なら scipy の既定）
+# ===============================
+
+RATING_COLS = ["攻撃係数", "守備係数", "攻撃レーティング", "守備レーティング", "ネット", "攻撃ポゼッション", "守備ポゼッション"]
+
+
+def possession_outcomes(x: pd.DataFrame, tbl: pd.DataFrame) -> pd.DataFrame:
+    """
+    possession_table に 得点（そのポゼに属する行の得点合計）と 相手チームID を付ける。
+    x は label_possessions_with_row_index の戻り値（行インデックス 0..n-1）。
+    """
+    miss = [c for c in ["試合ID", "チームID", "アクション1", "possession_start_row_index"] if c not in x.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    out = tbl.copy()
+    start_rows = out["start_row"].to_numpy(dtype=np.int64)
+
+    # 行 → ポゼは開始行の二分探索で対応づけ（epv.stage_possessions と同じ）
+    pts = ac.points(x["アクション1"]).astype("float64")
+    row_start = x["possession_start_row_index"].to_numpy(dtype="float64", na_value=np.nan)
+    in_poss = ~np.isnan(row_start)
+    which = np.searchsorted(start_rows, row_start[in_poss].astype(np.int64))
+    out["得点"] = np.bincount(which, weights=pts[in_poss], minlength=len(out)).astype(int)
+
+    rs = running_scores(x)
+    team = out["possession_team"].to_numpy(dtype="int64")
+    ta, tb = rs["team_a"].to_numpy()[start_rows], rs["team_b"].to_numpy()[start_rows]
+    opp = np.where(team == ta, tb, ta).astype("float64")
+    opp[((team != ta) & (team != tb)) | (opp < 0)] = np.nan
+    out["相手チームID"] = pd.array(opp, dtype="Int64")
+    return out
+
+
+def solve_ridge(X, y: np.ndarray, alpha: float, iter_lim: Optional[int] = ITER_LIMIT) -> Dict:
+    """
+    min ||X b − (y − 平均)||² + alpha ||b||² を lsqr で解く（X は scipy.sparse、密行列にしない）。
+    戻り値：{"coef", "intercept", "iterations", "converged"}
+    """
+    from scipy.sparse.linalg import lsqr
+
+    intercept = float(np.mean(y)) if len(y) else 0.0
+    res = lsqr(X, y - intercept, damp=float(np.sqrt(alpha)), atol=1e-10, btol=1e-10, iter_lim=iter_lim)
+    coef, istop, itn = res[0], res[1], res[2]
+    return {"coef": coef, "intercept": intercept, "iterations": int(itn), "converged": istop in (1, 2)}
+
+
+def _indicator(rows: np.ndarray, cols: np.ndarray, n_rows: int, n_cols: int):
+    from scipy.sparse import csr_matrix
+    return csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_rows, n_cols))
+
+
+def _rating_frame(keys, coef: np.ndarray, intercept: float, n_off: np.ndarray, n_def: np.ndarray) -> pd.DataFrame:
+    k = len(keys)
+    off, dfn = coef[:k], coef[k:]
+    return pd.DataFrame({
+        "攻撃係数": off, "守備係数": dfn,
+        "攻撃レーティング": intercept + off, "守備レーティング": intercept + dfn,
+        "ネット": off - dfn,
+        "攻撃ポゼッション": n_off.astype(np.int64), "守備ポゼッション": n_def.astype(np.int64),
+    }, columns=RATING_COLS)
+
+
+def team_ratings(poss: pd.DataFrame, alpha: float = TEAM_ALPHA, by_season: bool = False) -> pd.DataFrame:
+    """
+    相手調整済みのチームレーティング（100ポゼあたり）。poss は possession_outcomes の戻り値。
+    by_season=True なら poss の シーズン 列ごとに別のチームとして推定する。
+    """
+    from scipy.sparse import hstack
+
+    need = ["possession_team", "相手チームID", "得点"] + (["シーズン"] if by_season else [])
+    miss = [c for c in need if c not in poss.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    p = poss.dropna(subset=["possession_team", "相手チームID"])
+    off = p["possession_team"].astype(np.int64).astype(str)
+    dfn = p["相手チームID"].astype(np.int64).astype(str)
+    if by_season:
+        off = p["シーズン"].astype(str) + "|" + off
+        dfn = p["シーズン"].astype(str) + "|" + dfn
+    codes, keys = pd.factorize(pd.concat([off, dfn], ignore_index=True), sort=True)
+    n, k = len(p), len(keys)
+    oc, dc = codes[:n], codes[n:]
+    rows = np.arange(n)
+    X = hstack([_indicator(rows, oc, n, k), _indicator(rows, dc, n, k)]).tocsr()
+    fit = solve_ridge(X, p["得点"].to_numpy(dtype="float64") * 100, alpha)
+
+    out = _rating_frame(keys, fit["coef"], fit["intercept"], np.bincount(oc, minlength=k), np.bincount(dc, minlength=k))
+    if by_season:
+        parts = pd.Series(keys).str.split("|", n=1, expand=True)
+        out.insert(0, "チームID", parts[1].astype(np.int64).to_numpy())
+        out.insert(0, "シーズン", parts[0].to_numpy())
+    else:
+        out.insert(0, "チームID", np.asarray(keys).astype(np.int64))
+    return out.sort_values("ネット", ascending=False).reset_index(drop=True)
+
+
+def player_ratings(poss: pd.DataFrame, stints: pd.DataFrame, alpha: float = PLAYER_ALPHA,
+                   min_poss: int = MIN_POSS) -> pd.DataFrame:
+    """
+    選手の RAPM（100ポゼあたり）。ポゼの開始行を含む攻撃側・守備側のスティント（lineups.build_stints）を
+    引き、その lineup の選手を指示変数にする。スティントに割り当てられないポゼは除く。
+    """
+    from lineups import stint_of
+    from scipy.sparse import hstack
+
+    miss = [c for c in ["possession_team", "start_row", "得点"] if c not in poss.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    st_team = stints["チームID"].to_numpy(dtype=np.int64)
+    st_opp = stints["相手チームID"].to_numpy(dtype=np.int64)
+    s_row = stints["start_row"].to_numpy(dtype=np.int64)
+    e_row = stints["end_row"].to_numpy(dtype=np.int64)
+    p_team = pd.to_numeric(poss["possession_team"], errors="coerce").fillna(-1).to_numpy(dtype=np.int64)
+    p_row = poss["start_row"].to_numpy(dtype=np.int64)
+    off = stint_of(st_team, s_row, e_row, p_team, p_row)
+    dfn = stint_of(st_opp, s_row, e_row, p_team, p_row)
+    ok = (off >= 0) & (dfn >= 0)
+    off, dfn = off[ok], dfn[ok]
+    y = poss["得点"].to_numpy(dtype="float64")[ok] * 100
+
+    # スティント × 選手 の指示行列（lineup 文字列はスティント数だけ分解する）
+    players = stints["lineup"].fillna("").str.split("-")
+    n_each = players.str.len().to_numpy() * (stints["lineup"].fillna("") != "").to_numpy()
+    flat = np.array([int(v) for lst in players for v in lst if v != ""], dtype=np.int64)
+    codes, keys = pd.factorize(flat, sort=True)
+    S = _indicator(np.repeat(np.arange(len(stints)), n_each), codes, len(stints), len(keys))
+
+    n, k = len(y), len(keys)
+    rows = np.arange(n)
+    X = hstack([_indicator(rows, off, n, len(stints)) @ S, _indicator(rows, dfn, n, len(stints)) @ S]).tocsr()
+    fit = solve_ridge(X, y, alpha)
+
+    n_off = np.asarray(X[:, :k].sum(axis=0)).ravel()
+    n_def = np.asarray(X[:, k:].sum(axis=0)).ravel()
+    out = _rating_frame(keys, fit["coef"], fit["intercept"], n_off, n_def)
+    out.insert(0, "選手ID", np.asarray(keys, dtype=np.int64))
+    out = out[(out["攻撃ポゼッション"] + out["守備ポゼッション"]) >= min_poss]
+    return out.sort_values("ネット", ascending=False).reset_index(drop=True)
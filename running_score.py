@@ -0,0 +1,88 @@
+# running_score.py
+# ================================================
+# 試合ごとの累積スコア（両チーム分）を、ソート済みプレイバイプレイと同じ長さの配列で持つ
+#   - 試合内に最初に出現したチームを A、2番目を B として、行ごとに score_a / score_b を1パスで積み上げる
+#   - 得点はアクション1の得点テーブル（action_codes.points）で判定
+#   - 任意の行・任意のチーム視点の点差は、配列の添字参照だけで求まる（unstack や行ごとの apply は不要）
+#   - 列数はチーム数に依存しない（横持ちにしないため、リーグ全体のファイルでもメモリは行数に比例）
+#
+# 使い方：
+#   rs = running_scores(x)                                      # x は (試合ID, ピリオド, 履歴No) 順
+#   margin = score_margin(rs, tbl["start_row"], tbl["possession_team"])
+# ================================================
+
+import numpy as np
+import pandas as pd
+
+import action_codes as ac
+
+NO_TEAM = -1  # チームID 欠損の番兵
+SCORE_COLS = ["team_a", "team_b", "score_a", "score_b"]
+
+
+def _int_array(s: pd.Series) -> np.ndarray:
+    v = pd.to_numeric(s, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    return np.where(np.isnan(v), NO_TEAM, v).astype(np.int64)
+
+
+def running_scores(x: pd.DataFrame, points=None) -> pd.DataFrame:
+    """
+    x の各行時点（その行の得点を含む）の両チーム累積スコアを返す（index は x と同じ）。
+      team_a / team_b  ：その試合の A / B チームID（試合内の出現順。片方しか出ない試合の B は -1）
+      score_a / score_b：その行までの A / B の累積得点
+    points を渡せば、アクション1から求める代わりにその行得点（配列）を使う。
+    x は (試合ID, ピリオド, 履歴No) の昇順に並んでいること。
+    """
+    miss = [c for c in ["試合ID", "チームID", "アクション1"] if c not in x.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+
+    n = len(x)
+    gid = pd.to_numeric(x["試合ID"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    team = _int_array(x["チームID"])
+    pts = (ac.points(x["アクション1"]) if points is None else np.asarray(points)).astype(np.int32)
+
+    # 試合の区切り（NaN 同士も別試合扱いにならないよう、欠損は同じ値に寄せて比較）
+    g = np.where(np.isnan(gid), np.inf, gid)
+    new_game = np.r_[True, g[1:] != g[:-1]] if n else np.zeros(0, dtype=bool)
+    game_no = np.cumsum(new_game) - 1
+    game_start = np.flatnonzero(new_game)
+
+    # 試合ごとの A / B：チーム付き行の (試合, チーム) 初出を出現順に並べ、1番目が A、2番目が B
+    has_team = team != NO_TEAM
+    rows = np.flatnonzero(has_team)
+    _, first = np.unique(np.c_[game_no[rows], team[rows]], axis=0, return_index=True)
+    first = np.sort(rows[first])
+    fg = game_no[first]
+    rank = np.arange(len(first)) - np.searchsorted(fg, fg, side="left")
+    n_games = len(game_start)
+    team_a = np.full(n_games, NO_TEAM, dtype=np.int64)
+    team_b = np.full(n_games, NO_TEAM, dtype=np.int64)
+    team_a[fg[rank == 0]] = team[first[rank == 0]]
+    team_b[fg[rank == 1]] = team[first[rank == 1]]
+
+    # 行ごとに A / B の得点を積み上げ、試合の先頭で 0 に戻す
+    ta, tb = team_a[game_no], team_b[game_no]
+    out = {}
+    for col, t in [("score_a", ta), ("score_b", tb)]:
+        c = np.cumsum(np.where(has_team & (team == t), pts, 0), dtype=np.int64)
+        base = np.r_[0, c][game_start]            # 各試合の開始直前までの累積
+        out[col] = (c - base[game_no]).astype(np.int32)
+
+    return pd.DataFrame({"team_a": ta.astype(np.int32), "team_b": tb.astype(np.int32),
+                         "score_a": out["score_a"], "score_b": out["score_b"]},
+                        index=x.index, columns=SCORE_COLS)
+
+
+def score_margin(rs: pd.DataFrame, rows, team) -> np.ndarray:
+    """
+    rows 行目（位置）の時点での team 視点の点差（自チーム − 相手）を返す（float64）。
+    team がその試合の A / B どちらでもない（欠損含む）場合は NaN。
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    t = _int_array(pd.Series(team))
+    ta = rs["team_a"].to_numpy()[rows]
+    tb = rs["team_b"].to_numpy()[rows]
+    diff = (rs["score_a"].to_numpy()[rows] - rs["score_b"].to_numpy()[rows]).astype("float64")
+    return np.where((t == ta) & (t != NO_TEAM), diff,
+                    np.where((t == tb) & (t != NO_TEAM), 0.0 - diff, np.nan))
@@ -0,0 +1,136 @@
+# sequence_patterns.py
+# ================================================
+# 並んだプレイバイプレイ上で「イベント A の次に B」のような連続パターンを一括検出する
+#   - パターンは宣言的に書く：steps（各ステップのアクション1のコード集合）＋ 条件
+#       scope     ："period"（同じ試合・ピリオド内、既定）/ "game"（同じ試合内）
+#       within    ：最初のステップから最後のステップまでの秒数上限（game_clock の経過秒。None なら制限なし）
+#       same_team ：全ステップが同じチームID
+#       skip      ：ステップ間にあっても無視するコード（交代・タイムアウトなど）。既定は何も無視しない
+#       credit    ：何番目のステップの行を「その選手・チームの記録」とするか（既定 0）
+#   - 全パターンのコード集合を1つのビット表にまとめ、アクション1の表引きは1回だけ
+#     （パターンごとの処理は「k 行先とのビット比較 ＋ 試合・ピリオドの一致」の配列演算のみ）
+#   - shift(-1) をシーズン全体にかけた場合と違い、試合・ピリオドをまたいだ組合せは数えない
+#
+# 使い方：
+#   m = match_patterns(x)                               # x は (試合ID, ピリオド, 履歴No) 順。列 = パターン名（bool）
+#   pattern_counts(x, m, by="選手ID1")                   # 選手ごとの回数
+#   pattern_counts(x, m, by="チームID")                  # チームごとの回数
+# ================================================
+
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+import action_codes as ac
+
+# ========= ユーザー設定 =========
+PATTERNS: Dict[str, Dict] = {
+    # A3P.ipynb：3P成功（1）の直後がアシスト（12）
+    "assisted_3": {"steps": [{1}, {12}]},
+    # 同じチームの FG 失敗 → オフェンスリバウンド → FG 成功 が 5 秒以内（交代などの中立イベントは無視）
+    "putback": {"steps": [ac.MISSED_FG, ac.OREB, ac.MADE_FG], "within": 5, "same_team": True,
+                "skip": ac.NEUTRAL, "credit": 2},
+}
+# ===============================
+
+CODE_COL = "アクション1"
+SCOPES = ("period", "game")
+
+
+def _codes(step) -> set:
+    return {int(c) for c in step}
+
+
+def _validate(name: str, pat: Dict) -> None:
+    steps = pat.get("steps")
+    if not steps:
+        raise ValueError(f"パターン {name} に steps がありません")
+    if pat.get("scope", "period") not in SCOPES:
+        raise ValueError(f"未知の scope です: {pat.get('scope')}（{SCOPES}）")
+    if not 0 <= pat.get("credit", 0) < len(steps):
+        raise ValueError(f"パターン {name} の credit がステップ数の範囲外です: {pat.get('credit')}")
+
+
+def _int_col(x: pd.DataFrame, col: str, fill: int = -1) -> np.ndarray:
+    v = pd.to_numeric(x[col], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    return np.where(np.isnan(v), fill, v).astype(np.int64)
+
+
+def match_patterns(x: pd.DataFrame, patterns: Optional[Dict[str, Dict]] = None,
+                   code_col: str = CODE_COL) -> pd.DataFrame:
+    """
+    各パターンが成立した「credit ステップの行」に True を立てた bool 表を返す（index は x と同じ）。
+    x は (試合ID, ピリオド, 履歴No) の昇順に並んでいること。within を使うパターンがあれば
+    ピリオド残時間 列が必要（game_clock.elapsed_seconds で経過秒にする）。
+    """
+    patterns = PATTERNS if patterns is None else patterns
+    for name, pat in patterns.items():
+        _validate(name, pat)
+    need = ["試合ID", "ピリオド", code_col] + (["チームID"] if any(p.get("same_team") for p in patterns.values()) else [])
+    miss = [c for c in need if c not in x.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+
+    # 全パターンのステップ・skip のコード集合に1ビットずつ割り当て、アクション1を1回だけ表引きする
+    sets: List[set] = []
+    slot: Dict[frozenset, int] = {}
+
+    def bit_of(codes) -> int:
+        key = frozenset(_codes(codes))
+        if key not in slot:
+            slot[key] = len(sets)
+            sets.append(set(key))
+        return slot[key]
+
+    plan = {name: ([bit_of(s) for s in pat["steps"]], bit_of(pat["skip"]) if pat.get("skip") else None)
+            for name, pat in patterns.items()}
+    if len(sets) > 63:
+        raise ValueError(f"コード集合が多すぎます（{len(sets)} > 63）。パターンを分けて実行してください")
+    bits = ac.lookup(ac.bit_table(sets), x[code_col]) if sets else np.zeros(len(x), dtype=np.int64)
+
+    n = len(x)
+    gid = _int_col(x, "試合ID")
+    per = _int_col(x, "ピリオド")
+    team = _int_col(x, "チームID") if "チームID" in x.columns else None
+    t = None
+    if any(p.get("within") is not None for p in patterns.values()):
+        from game_clock import elapsed_seconds
+        t = elapsed_seconds(x)
+
+    out = {}
+    for name, pat in patterns.items():
+        step_bits, skip_bit = plan[name]
+        k_steps = len(step_bits)
+        idx = np.arange(n) if skip_bit is None else np.flatnonzero((bits >> skip_bit) & 1 == 0)
+        hit = np.zeros(n, dtype=bool)
+        m = len(idx) - k_steps + 1
+        if m > 0:
+            start = idx[:m]
+            ok = np.ones(m, dtype=bool)
+            for k, b in enumerate(step_bits):
+                rows = idx[k:k + m]
+                ok &= ((bits[rows] >> b) & 1).astype(bool)
+                if k:
+                    ok &= gid[rows] == gid[start]
+                    if pat.get("scope", "period") == "period":
+                        ok &= per[rows] == per[start]
+                    if pat.get("same_team"):
+                        ok &= (team[rows] == team[start]) & (team[start] >= 0)
+            if pat.get("within") is not None:
+                dt = t[idx[k_steps - 1:k_steps - 1 + m]] - t[start]
+                ok &= np.nan_to_num(dt, nan=np.inf) <= pat["within"]
+            credit = pat.get("credit", 0)
+            hit[idx[credit:credit + m][ok]] = True
+        out[name] = hit
+    return pd.DataFrame(out, index=x.index, columns=list(patterns))
+
+
+def pattern_counts(x: pd.DataFrame, matches: pd.DataFrame, by: Union[str, Sequence[str]] = "選手ID1") -> pd.DataFrame:
+    """match_patterns の結果を by（選手ID1 / チームID / [チームID, 選手ID1] など）ごとの回数にする。"""
+    by = [by] if isinstance(by, str) else list(by)
+    miss = [c for c in by if c not in x.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    keys = [x[c] for c in by]
+    return matches.astype(np.int64).groupby(keys).sum()
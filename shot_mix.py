@@ -0,0 +1,146 @@
+# shot_mix.py
+# ================================================
+# シュート構成（3P / ペイント内・外の2P / FT の試投・成功）をグループごとに1回で数える
+#   （3FGA_2FG%.ipynb の summarize 系で項目ごとに書いていた lambda s: s.isin([...]).sum() の置き換え）
+#   - アクション1 → 「SHOT_CATEGORIES に出てくるコードの列番号」をルックアップ配列で1回だけ変換
+#   - グループキー × コード列 を1本の添字にして np.bincount 1回 → (グループ数 × コード数) の件数表
+#     → 各カテゴリはコード列の和（件数表 @ 所属行列）。カテゴリが重なっていても（3PA ⊃ 3PM）数え直さない
+#   - 成功率・3P試投割合は np.divide（分母 0 は 0、notebook と同じ）
+#   - 分あたり：by に ピリオド があれば (試合ID, ピリオド)、なければ 試合ID を単位に、
+#     グループに含まれる単位の分数を合計して割る（1〜4Q は10分、OT は5分 = game_clock と同じ）
+#       (試合ID, ピリオド, チームID) → そのピリオドの長さ、(チームID, 試合ID) → 40 + 5 × OT数、
+#       (チームID,) → 出場した試合の合計分数
+#
+# 使い方：
+#   per = shot_mix(use)                                   # (試合ID, ピリオド, チームID) ごと
+#   game = shot_mix(use, by=["チームID", "試合ID"])        # チーム×試合
+#   per[["threeFGA_sum", "twoFG_pct", "threeFGA_per_min"]]
+# ================================================
+
+from typing import Dict, Sequence, Set, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import action_codes as ac
+from game_clock import REGULAR_PERIODS, period_length, period_start
+
+# ========= ユーザー設定 =========
+# カテゴリ名 → アクション1のコード集合（列名は「カテゴリ名_sum」「カテゴリ名_per_min」）
+SHOT_CATEGORIES: Dict[str, Set[int]] = {
+    "threeFGA": {1, 2},
+    "threeFGM": {1},
+    "twoFGA": {3, 4, 5, 6},
+    "twoFGM": {3, 4},
+    "outsidepaint_twoFGA": {3, 5},
+    "outsidepaint_twoFGM": {3},
+    "insidepaint_twoFGA": {4, 6},
+    "insidepaint_twoFGM": {4},
+    "FTA": ac.FT,
+    "FTM": ac.FT_MADE,
+}
+# 比率列 → (分子カテゴリ, 分母カテゴリ のタプル)。分母は複数カテゴリの和も可
+RATIOS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "threeFG_pct": ("threeFGM", ("threeFGA",)),
+    "twoFG_pct": ("twoFGM", ("twoFGA",)),
+    "insidepaint_twoFG_pct": ("insidepaint_twoFGM", ("insidepaint_twoFGA",)),
+    "outsidepaint_twoFG_pct": ("outsidepaint_twoFGM", ("outsidepaint_twoFGA",)),
+    "FT_pct": ("FTM", ("FTA",)),
+    "threeFGA_rate": ("threeFGA", ("threeFGA", "twoFGA")),   # FG試投に占める3P試投の割合
+}
+EXCLUDE_TEAMS: Set[int] = {0}   # チームID = 0（試合進行などチームに属さない行）は除く
+# ===============================
+
+DEFAULT_BY = ["試合ID", "ピリオド", "チームID"]
+CODE_COL = "アクション1"
+
+
+def _category_matrix(categories: Dict[str, Set[int]]):
+    """カテゴリに出てくるコードの一覧・コード → 列番号+1 のルックアップ配列・(コード数 × カテゴリ数) の所属行列。"""
+    codes = sorted({int(c) for s in categories.values() for c in s})
+    table = np.zeros(max(codes, default=-1) + 1, dtype=np.int64)
+    table[codes] = np.arange(1, len(codes) + 1)
+    member = np.zeros((len(codes), len(categories)), dtype=np.int64)
+    col = {c: i for i, c in enumerate(codes)}
+    for j, s in enumerate(categories.values()):
+        member[[col[int(c)] for c in s], j] = 1
+    return codes, table, member
+
+
+def _group_codes(x: pd.DataFrame, by: Sequence[str]):
+    """by の組合せを 0..G-1 の番号にする（キーの昇順）。戻り値：(行ごとの番号, グループのキー表)。"""
+    keys = [pd.factorize(x[c], sort=True) for c in by]
+    if not keys:
+        return np.zeros(len(x), dtype=np.int64), pd.DataFrame(index=range(1))
+    flat = np.ravel_multi_index([k[0] for k in keys], [max(len(k[1]), 1) for k in keys])
+    g, uniq = pd.factorize(flat, sort=True)
+    parts = np.unravel_index(uniq, [max(len(k[1]), 1) for k in keys])
+    return g.astype(np.int64), pd.DataFrame({c: k[1].to_numpy()[p] for c, k, p in zip(by, keys, parts)})
+
+
+def _group_minutes(x: pd.DataFrame, g: np.ndarray, n_groups: int, by: Sequence[str]) -> np.ndarray:
+    """グループに含まれる (試合ID, ピリオド) または 試合ID の分数の合計。"""
+    if not len(x):
+        return np.zeros(n_groups)
+    gid = pd.factorize(x["試合ID"])[0]
+    per = pd.to_numeric(x["ピリオド"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    if "ピリオド" in by:
+        pc, pu = pd.factorize(per)
+        unit = gid * max(len(pu), 1) + pc
+        unit_min = period_length(per) / 60
+    else:
+        # 試合の分数 = 最終ピリオドまでの長さ（4Q 未満で終わっているデータも40分とする）
+        last = np.maximum(pd.Series(per).groupby(gid).max().to_numpy(), REGULAR_PERIODS)
+        unit = gid
+        unit_min = ((period_start(last) + period_length(last)) / 60)[gid]
+    first = np.flatnonzero(~pd.Series(g * (unit.max() + 1) + unit).duplicated().to_numpy())
+    return np.bincount(g[first], weights=np.nan_to_num(unit_min[first]), minlength=n_groups)
+
+
+def shot_mix(x: pd.DataFrame, by: Union[str, Sequence[str]] = DEFAULT_BY,
+             categories: Dict[str, Set[int]] = None, ratios: Dict[str, Tuple[str, Tuple[str, ...]]] = None,
+             per_minute: bool = True) -> pd.DataFrame:
+    """
+    by ごとのシュート構成：by ＋ カテゴリ名_sum ＋ 比率列 ＋（per_minute なら）minutes・カテゴリ名_per_min。
+    by の列・アクション1が欠損の行と、チームID が EXCLUDE_TEAMS の行は数えない（notebook の前処理と同じ）。
+    シュートが1本もないグループも、行があれば 0 として残る。
+    """
+    categories = SHOT_CATEGORIES if categories is None else categories
+    ratios = RATIOS if ratios is None else ratios
+    by = [by] if isinstance(by, str) else list(by)
+    need = list(dict.fromkeys(by + [CODE_COL] + (["試合ID", "ピリオド"] if per_minute else [])))
+    miss = [c for c in need if c not in x.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+    unknown = [c for num, den in ratios.values() for c in (num,) + tuple(den) if c not in categories]
+    if unknown:
+        raise ValueError(f"RATIOS に未知のカテゴリがあります: {sorted(set(unknown))}")
+
+    keep = x[need].notna().all(axis=1).to_numpy().copy()
+    if "チームID" in x.columns and EXCLUDE_TEAMS:
+        team = pd.to_numeric(x["チームID"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        for t in EXCLUDE_TEAMS:
+            keep &= team != t
+    y = x.loc[keep]
+
+    g, out = _group_codes(y, by)
+    n_groups = len(out)
+    codes, table, member = _category_matrix(categories)
+    k = len(codes) + 1                                   # 列 0 = カテゴリに入らないコード
+    col = ac.lookup(table, y[CODE_COL])
+    counts = np.bincount(g * k + col, minlength=n_groups * k).reshape(n_groups, k)[:, 1:] @ member
+
+    for j, name in enumerate(categories):
+        out[f"{name}_sum"] = counts[:, j]
+    idx = {name: j for j, name in enumerate(categories)}
+    for name, (num, den) in ratios.items():
+        a = counts[:, idx[num]].astype(float)
+        b = counts[:, [idx[c] for c in den]].sum(axis=1).astype(float)
+        out[name] = np.divide(a, b, out=np.zeros_like(a), where=b > 0)
+
+    if per_minute:
+        minutes = _group_minutes(y, g, n_groups, by)
+        out["minutes"] = minutes
+        for j, name in enumerate(categories):
+            out[f"{name}_per_min"] = np.divide(counts[:, j], minutes, out=np.full(n_groups, np.nan), where=minutes > 0)
+    return out
@@ -0,0 +1,177 @@
+# team_games.py
+# ================================================
+# ボックススコア → 1試合1チーム1行の集計表（df_box_gameid_sum）を1回だけ作って Parquet に保存する
+#   - ピリオド区分 == 18（試合合計）の選手行を (試合ID, チームID) で合計（notebook と同じ）
+#   - 成功率（2P / 3P / フリースロー）：分母0は0、0〜1 に丸める（notebook の safe_rate と同じ）
+#   - 勝敗：試合内の最大得点なら1（notebook と同じ）
+#   - 相手側の列：同じ試合のもう一方のチームの値を「相手<列名>」で横に並べる（相手得点・相手ファウル など）
+#   - 試合データから ホーム（1/0）・失点・得点差・カップID を結合
+#   - 保存は data_store の STORE_DIR/team_games/シーズン=.../ にシーズンごと（列指向・型付き）
+#
+# 使い方：
+#   build_team_games()                                             # 取り込み済みの box / game から作成・保存
+#   df_box_gameid_sum = load_team_games(filters=[("カップID", "in", [500, 507])])
+#   df_box_gameid_sum = df_box_gameid_sum[base_columns(df_box_gameid_sum)]   # notebook と同じ列だけ（VIF など）
+# ================================================
+
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import data_store
+
+# ========= ユーザー設定 =========
+STORE_DIR = data_store.STORE_DIR
+TOTAL_PERIOD = 18        # ボックススコアの「試合合計」のピリオド区分
+# ===============================
+
+KEYS = ["試合ID", "チームID"]
+# 合計しない列（選手の属性・区分）
+PLAYER_COLS = ["ピリオド区分", "ホームアウェイ", "チーム名", "チーム名英", "選手ID", "背番号", "選手名",
+               "スターティングフラグ", "プレイタイム", "プレイタイム_秒"]
+RATE_DEFS: Dict[str, tuple] = {
+    "2P成功率": ("2P成功", "2P試投"),
+    "3P成功率": ("3P成功", "3P試投"),
+    "フリースロー成功率": ("フリースロー成功", "フリースロー試投"),
+}
+OPP_PREFIX = "相手"
+TEAM_GAMES_PARTITIONING = ds.partitioning(pa.schema([("シーズン", pa.string())]), flavor="hive")
+
+
+def safe_rate(num: pd.Series, den: pd.Series, fillna: Optional[float] = 0) -> pd.Series:
+    """num / den（分母0・非数値は NaN → fillna）。0〜1 に丸める。"""
+    r = pd.to_numeric(num, errors="coerce") / pd.to_numeric(den, errors="coerce").replace({0: np.nan})
+    r = r.astype(float).clip(lower=0.0, upper=1.0)
+    return r if fillna is None else r.fillna(fillna)
+
+
+def _mirror(tg: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
+    """
+    同じ試合のもう一方のチームの cols を返す（tg は (試合ID, チームID) 順、index は 0..n-1）。
+    チームが2つでない試合は NaN。
+    """
+    gid = tg["試合ID"].to_numpy()
+    start = np.r_[True, gid[1:] != gid[:-1]]
+    size = np.diff(np.r_[np.flatnonzero(start), len(gid)])
+    two = np.repeat(size == 2, size)
+    partner = np.where(start, np.arange(len(gid)) + 1, np.arange(len(gid)) - 1)   # 1行目 ↔ 2行目
+    partner = np.where(two, partner, 0)
+    vals = tg[cols].to_numpy(dtype="float64")[partner] if len(gid) else np.zeros((0, len(cols)))
+    vals[~two] = np.nan
+    return pd.DataFrame(vals, columns=[OPP_PREFIX + c for c in cols], index=tg.index)
+
+
+def team_game_table(box: pd.DataFrame, game: Optional[pd.DataFrame] = None,
+                    season_of: Optional[Dict[int, str]] = None, total_period: int = TOTAL_PERIOD) -> pd.DataFrame:
+    """
+    ボックススコア（と試合データ）から1試合1チーム1行の表を作る。
+      box      ：ボックススコア（選手行）
+      game     ：試合データ（ホームチームID / アウェイチームID / ホーム得点 / アウェイ得点 / カップID）。None なら結合しない
+      season_of：試合ID → シーズン名（None ならシーズン列を付けない）
+    """
+    miss = [c for c in KEYS + ["ピリオド区分", "得点"] if c not in box.columns]
+    if miss:
+        raise ValueError(f"必要列が見つかりません: {miss}")
+
+    b = box[pd.to_numeric(box["ピリオド区分"], errors="coerce") == total_period]
+    b = b.drop(columns=[c for c in PLAYER_COLS if c in b.columns])
+    tg = b.groupby(KEYS, sort=True).sum(numeric_only=True).reset_index()
+    count_cols = [c for c in tg.columns if c not in KEYS]
+
+    for out, (num, den) in RATE_DEFS.items():
+        if num in tg.columns and den in tg.columns:
+            tg[out] = safe_rate(tg[num], tg[den])
+    tg["勝敗"] = (tg["得点"] == tg.groupby("試合ID")["得点"].transform("max")).astype(int)
+    tg = pd.concat([tg, _mirror(tg, count_cols)], axis=1)
+
+    if game is not None:
+        gm = ["試合ID", "ホームチームID", "アウェイチームID", "ホーム得点", "アウェイ得点"]
+        miss = [c for c in gm if c not in game.columns]
+        if miss:
+            raise ValueError(f"必要列が見つかりません: {miss}")
+        g = game[gm + (["カップID"] if "カップID" in game.columns else [])].drop_duplicates("試合ID")
+        g = tg[KEYS].merge(g, on="試合ID", how="left")
+        home = (g["チームID"] == g["ホームチームID"]).to_numpy()
+        away = (g["チームID"] == g["アウェイチームID"]).to_numpy()
+        own = np.where(home, g["ホーム得点"], np.where(away, g["アウェイ得点"], np.nan))
+        opp = np.where(home, g["アウェイ得点"], np.where(away, g["ホーム得点"], np.nan))
+        tg["ホーム"] = pd.array(np.where(home | away, home.astype(float), np.nan), dtype="Int8")
+        tg["失点"] = opp
+        tg["得点差"] = own - opp
+        if "カップID" in g.columns:
+            tg["カップID"] = g["カップID"].to_numpy()
+
+    if season_of is not None:
+        tg["シーズン"] = tg["試合ID"].map(season_of).astype("string")
+    return tg
+
+
+def base_columns(tg: pd.DataFrame) -> List[str]:
+    """
+    notebook の df_box_gameid_sum と同じ列（キー・合計列・勝敗・失点・成功率）。
+    相手<列名> と試合データ由来の ホーム・得点差・カップID、シーズン は含めない。
+    """
+    cols = list(tg.columns)
+    count_cols = [c for c in cols if c not in KEYS and OPP_PREFIX + c in cols]
+    extra = ["勝敗", "失点"] + list(RATE_DEFS)
+    return KEYS + count_cols + [c for c in extra if c in cols]
+
+
+def game_seasons(store_dir: str = STORE_DIR) -> Dict[int, str]:
+    """取り込み済みプレイバイプレイのパーティション（シーズン=/試合ID=）から 試合ID → シーズン を作る（データは読まない）。"""
+    dataset = ds.dataset(os.path.join(store_dir, "pbp"), format="parquet",
+                         partitioning=data_store.PBP_PARTITIONING)
+    out = {}
+    for frag in dataset.get_fragments():
+        keys = ds.get_partition_keys(frag.partition_expression)
+        out[int(keys["試合ID"])] = str(keys["シーズン"])
+    return out
+
+
+def build_team_games(store_dir: str = STORE_DIR, seasons: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    取り込み済みの box / game から集計表を作り、STORE_DIR/team_games/シーズン=.../ に保存する。
+    seasons を指定するとそのシーズンのパーティションだけ作り直す。プレイバイプレイに無い試合は保存しない。
+    """
+    season_of = game_seasons(store_dir)
+    if seasons is not None:
+        season_of = {g: s for g, s in season_of.items() if s in set(seasons)}
+    ids = sorted(season_of)
+    box = data_store.load_table("box", filters=[("試合ID", "in", ids)], store_dir=store_dir)
+    game = data_store.load_table("game", filters=[("試合ID", "in", ids)], store_dir=store_dir)
+    tg = team_game_table(box, game, season_of)
+    ds.write_dataset(
+        pa.Table.from_pandas(tg, preserve_index=False), os.path.join(store_dir, "team_games"),
+        format="parquet", partitioning=TEAM_GAMES_PARTITIONING, existing_data_behavior="delete_matching",
+        basename_template="part-{i}.parquet",
+    )
+    return tg
+
+
+def load_team_games(seasons: Optional[Sequence[str]] = None, columns: Optional[List[str]] = None,
+                    filters: Optional[List[tuple]] = None, store_dir: str = STORE_DIR) -> pd.DataFrame:
+    """
+    保存済みの集計表を読む（未作成なら作る）。seasons / columns / filters は data_store.load_pbp と同じ。
+    (試合ID, チームID) の昇順で返す。
+    """
+    path = os.path.join(store_dir, "team_games")
+    if not os.path.isdir(path):
+        build_team_games(store_dir)
+    dataset = ds.dataset(path, format="parquet", partitioning=TEAM_GAMES_PARTITIONING)
+    expr = pq.filters_to_expression(filters) if filters else None
+    if seasons is not None:
+        season_expr = ds.field("シーズン").isin(list(seasons))
+        expr = season_expr if expr is None else expr & season_expr
+    df = dataset.to_table(columns=columns, filter=expr).to_pandas()
+    keys = [c for c in KEYS if c in df.columns]
+    return df.sort_values(keys, kind="stable").reset_index(drop=True) if keys else df
+
+
+if __name__ == "__main__":
+    tg = build_team_games()
+    print(f"✅ 保存しました: {os.path.join(STORE_DIR, 'team_games')}（{len(tg)} 行 × {tg.shape[1]} 列）")